@@ -7,9 +7,20 @@ import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 from io import BytesIO
-import json
 from firebase_config import firebase_manager
+from log_acessos import LOG_DIR
 from ip_utils import get_client_info
+from cache_planilhas import cache_planilhas
+from usuarios import USUARIOS_FILE, banco_usuarios
+
+# Linhas mostradas nas tabelas de acessos (métricas, gráficos e exportações usam todo o histórico)
+LIMITE_TABELA_LOGS = 1000
+
+def _tabela_acessos(logs):
+    """Acessos (do índice) no formato das tabelas e exportações do admin"""
+    df = pd.DataFrame(logs, columns=['data_hora', 'usuario', 'ip', 'user_agent'])
+    df.columns = ['Data/Hora', 'Usuário', 'IP', 'Navegador']
+    return df
 
 def tela_admin():
     """Tela de login para administradores"""
@@ -73,47 +84,33 @@ def dashboard_admin():
     
     st.markdown("---")
     
+    painel_cache_planilhas()
+    painel_usuarios()
+    
     try:
-        # Carregar dados do Firebase
+        # Consultas no índice (log local + Firebase, se conectado): métricas e gráficos cobrem todo o histórico
         with st.spinner("Carregando dados de monitoramento..."):
-            logs = firebase_manager.get_access_logs(limit=500)
+            resumo = firebase_manager.get_access_summary()
         
-        if not logs:
+        if not resumo['total']:
             st.warning("Nenhum log de acesso encontrado ainda.")
             return
         
-        # Converter para DataFrame
-        df_logs = pd.DataFrame(logs)
-        
-        # Converter timestamp de forma simples
-        df_logs['timestamp'] = pd.to_datetime(df_logs['timestamp'], errors='coerce')
-        df_logs = df_logs.dropna(subset=['timestamp'])
-        
-        if len(df_logs) == 0:
-            st.warning("Nenhum timestamp válido encontrado nos logs.")
-            return
-            
-        df_logs['data'] = df_logs['timestamp'].dt.date
-        df_logs['hora'] = df_logs['timestamp'].dt.strftime('%H:%M')
-        
         # Métricas principais
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            total_acessos = len(df_logs)
-            st.metric("Total de Acessos", total_acessos)
+            st.metric("Total de Acessos", resumo['total'])
         
         with col2:
-            usuarios_unicos = df_logs['usuario'].nunique()
-            st.metric("Usuários Únicos", usuarios_unicos)
+            st.metric("Usuários Únicos", resumo['usuarios'])
         
         with col3:
-            ips_unicos = df_logs['ip'].nunique()
-            st.metric("IPs Únicos", ips_unicos)
+            st.metric("IPs Únicos", resumo['ips'])
         
         with col4:
-            hoje = datetime.now().date()
-            acessos_hoje = len(df_logs[df_logs['data'] == hoje])
+            hoje = datetime.now().date().isoformat()
+            acessos_hoje = firebase_manager.get_access_summary(inicio=hoje, fim=hoje)['total']
             st.metric("Acessos Hoje", acessos_hoje)
         
         st.markdown("---")
@@ -122,36 +119,36 @@ def dashboard_admin():
         col_filter1, col_filter2, col_filter3 = st.columns(3)
         
         with col_filter1:
-            usuarios_disponiveis = ['Todos'] + sorted(df_logs['usuario'].unique().tolist())
+            usuarios_disponiveis = ['Todos'] + firebase_manager.get_access_values('usuario')
             usuario_filtro = st.selectbox("Filtrar por Usuário:", usuarios_disponiveis)
         
         with col_filter2:
-            datas_disponiveis = sorted(df_logs['data'].unique(), reverse=True)
-            data_filtro = st.selectbox("Filtrar por Data:", ['Todas'] + [str(d) for d in datas_disponiveis])
+            datas_disponiveis = sorted(firebase_manager.get_access_values('data'), reverse=True)
+            data_filtro = st.selectbox("Filtrar por Data:", ['Todas'] + datas_disponiveis)
         
         with col_filter3:
-            ips_disponiveis = ['Todos'] + sorted(df_logs['ip'].unique().tolist())
+            ips_disponiveis = ['Todos'] + firebase_manager.get_access_values('ip')
             ip_filtro = st.selectbox("Filtrar por IP:", ips_disponiveis)
         
-        # Aplicar filtros
-        df_filtrado = df_logs.copy()
+        # Aplicar filtros (na consulta)
+        filtros = {}
         
         if usuario_filtro != 'Todos':
-            df_filtrado = df_filtrado[df_filtrado['usuario'] == usuario_filtro]
+            filtros['usuario'] = usuario_filtro
         
         if data_filtro != 'Todas':
-            data_selecionada = pd.to_datetime(data_filtro).date()
-            df_filtrado = df_filtrado[df_filtrado['data'] == data_selecionada]
+            filtros['inicio'] = filtros['fim'] = data_filtro
         
         if ip_filtro != 'Todos':
-            df_filtrado = df_filtrado[df_filtrado['ip'] == ip_filtro]
+            filtros['ip'] = ip_filtro
         
         # Gráficos
         col_graph1, col_graph2 = st.columns(2)
         
         with col_graph1:
             # Gráfico de acessos por dia
-            acessos_por_dia = df_filtrado.groupby('data').size().reset_index(name='acessos')
+            acessos_por_dia = pd.DataFrame(firebase_manager.get_access_counts('data', **filtros), columns=['data', 'acessos'])
+            acessos_por_dia['data'] = pd.to_datetime(acessos_por_dia['data'], errors='coerce').dt.date
             fig_dia = px.line(acessos_por_dia, x='data', y='acessos', 
                              title='Acessos por Dia', markers=True)
             fig_dia.update_layout(xaxis_title="Data", yaxis_title="Número de Acessos")
@@ -159,16 +156,16 @@ def dashboard_admin():
         
         with col_graph2:
             # Gráfico de acessos por usuário
-            acessos_por_usuario = df_filtrado.groupby('usuario').size().reset_index(name='acessos')
+            acessos_por_usuario = pd.DataFrame(firebase_manager.get_access_counts('usuario', **filtros), columns=['usuario', 'acessos'])
             fig_usuario = px.bar(acessos_por_usuario, x='usuario', y='acessos',
                                 title='Acessos por Usuário')
             fig_usuario.update_layout(xaxis_title="Usuário", yaxis_title="Número de Acessos")
-            fig_usuario.update_xaxis(tickangle=45)
+            fig_usuario.update_xaxes(tickangle=45)
             st.plotly_chart(fig_usuario, use_container_width=True)
         
         # Gráfico de acessos por hora
-        df_filtrado['hora_int'] = df_filtrado['timestamp'].dt.hour
-        acessos_por_hora = df_filtrado.groupby('hora_int').size().reset_index(name='acessos')
+        acessos_por_hora = pd.DataFrame(firebase_manager.get_access_counts('hora', **filtros), columns=['hora', 'acessos'])
+        acessos_por_hora = acessos_por_hora.rename(columns={'hora': 'hora_int'})
         fig_hora = px.bar(acessos_por_hora, x='hora_int', y='acessos',
                          title='Acessos por Hora do Dia')
         fig_hora.update_layout(xaxis_title="Hora", yaxis_title="Número de Acessos")
@@ -179,11 +176,13 @@ def dashboard_admin():
         # Tabela de logs recentes
         st.markdown("### 📋 Logs de Acesso Recentes")
         
-        # Preparar dados para exibição
-        df_exibicao = df_filtrado[['data_hora', 'usuario', 'ip', 'user_agent']].copy()
-        df_exibicao.columns = ['Data/Hora', 'Usuário', 'IP', 'Navegador']
-        df_exibicao = df_exibicao.sort_values('Data/Hora', ascending=False)
+        # Preparar dados para exibição (mais recentes primeiro)
+        total_filtrado = firebase_manager.get_access_summary(**filtros)['total']
+        logs_recentes = firebase_manager.get_access_list(limit=LIMITE_TABELA_LOGS, **filtros)
+        df_exibicao = _tabela_acessos(logs_recentes)
         
+        if total_filtrado > len(df_exibicao):
+            st.caption(f"Mostrando os {len(df_exibicao)} acessos mais recentes de {total_filtrado}.")
         st.dataframe(df_exibicao, use_container_width=True, height=400)
         
         # Botões de ação
@@ -193,7 +192,7 @@ def dashboard_admin():
             if st.button("📥 Exportar Logs para Excel"):
                 output = BytesIO()
                 with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    df_exibicao.to_excel(writer, sheet_name='Logs de Acesso', index=False)
+                    _tabela_acessos(firebase_manager.get_access_list(**filtros)).to_excel(writer, sheet_name='Logs de Acesso', index=False)
                 
                 st.download_button(
                     label="⬇️ Baixar Arquivo Excel",
@@ -205,36 +204,9 @@ def dashboard_admin():
         with col_clean:
             if st.button("🧹 Limpar Logs Duplicados"):
                 try:
-                    # Limpar logs duplicados (manter apenas um por usuário a cada 2 minutos)
-                    logs_limpos = []
-                    for log in logs:
-                        usuario = log.get('usuario', '')
-                        timestamp = log.get('timestamp', '')
-                        
-                        # Verificar se já existe um log similar recente
-                        log_similar = False
-                        for log_existente in logs_limpos:
-                            if log_existente.get('usuario') == usuario:
-                                try:
-                                    # Usar a mesma função de parsing de timestamp
-                                    ts1 = parse_timestamp(timestamp)
-                                    ts2 = parse_timestamp(log_existente.get('timestamp', ''))
-                                    if abs((ts1 - ts2).seconds) < 120:
-                                        log_similar = True
-                                        break
-                                except:
-                                    # Se não conseguir comparar timestamps, considerar como similar
-                                    log_similar = True
-                                    break
-                        
-                        if not log_similar:
-                            logs_limpos.append(log)
-                    
-                    # Salvar logs limpos
-                    with open('local_access_log.json', 'w', encoding='utf-8') as f:
-                        json.dump(logs_limpos, f, ensure_ascii=False, indent=2)
-                    
-                    st.success(f"Logs limpos! Removidos {len(logs) - len(logs_limpos)} duplicados.")
+                    # Manter apenas um acesso por usuário a cada 2 minutos (em todo o log local)
+                    removidos = firebase_manager.remove_local_duplicates(segundos=120)
+                    st.success(f"Logs limpos! Removidos {removidos} duplicados.")
                     st.rerun()
                     
                 except Exception as e:
@@ -246,17 +218,101 @@ def dashboard_admin():
         with col_sync:
             if st.button("☁️ Sincronizar com Firebase"):
                 try:
-                    firebase_manager.sync_to_firebase()
-                    st.success("✅ Dados sincronizados com Firebase!")
-                    st.info("Atualize a página do Firebase Console para ver os dados.")
+                    resultado = firebase_manager.sync_to_firebase()
+                    if not firebase_manager.firebase_connected:
+                        st.warning("⚠️ Firebase não conectado: nada foi enviado.")
+                    elif resultado['enviados']:
+                        st.success(
+                            f"✅ {resultado['enviados']} acessos enviados ao Firebase em "
+                            f"{resultado['segundos']:.1f}s ({resultado['por_segundo']:.0f} por segundo)"
+                        )
+                        st.info("Atualize a página do Firebase Console para ver os dados.")
+                    else:
+                        st.success("✅ Firebase já está em dia com os logs locais.")
                 except Exception as e:
                     st.error(f"Erro na sincronização: {e}")
-                    st.info("Os dados continuam salvos localmente no arquivo 'local_access_log.json'")
+                    st.info(f"Os dados continuam salvos localmente na pasta '{LOG_DIR}'")
     
     except Exception as e:
         st.error(f"Erro ao carregar dados: {str(e)}")
         st.info("Verifique se o Firebase está configurado corretamente.")
 
+def painel_cache_planilhas():
+    """Acertos/falhas e ocupação do cache em disco das planilhas"""
+    with st.expander("🗂️ Cache de Planilhas"):
+        stats = cache_planilhas.estatisticas()
+        
+        if not stats['disponivel']:
+            st.info("Cache desativado: instale o pacote 'pyarrow' para habilitar o formato Parquet.")
+            return
+        
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Acertos (hits)", stats['hits'])
+        with col2:
+            st.metric("Falhas (misses)", stats['misses'])
+        with col3:
+            st.metric("Taxa de Acerto", f"{stats['taxa_acerto']:.1f}%")
+        with col4:
+            st.metric(
+                "Ocupação",
+                f"{stats['tamanho_bytes'] / 1024 / 1024:.1f} MB",
+                help=f"Limite: {stats['limite_bytes'] / 1024 / 1024:.0f} MB • Remoções (LRU): {stats['remocoes']}"
+            )
+        
+        if stats['entradas']:
+            df_cache = pd.DataFrame(stats['entradas'])
+            df_cache['tamanho'] = (df_cache['tamanho'] / 1024 / 1024).round(2)
+            df_cache['sha256'] = df_cache['sha256'].str[:12]
+            if 'artefato' not in df_cache.columns:
+                df_cache['artefato'] = 'dados'
+            df_cache['artefato'] = df_cache['artefato'].fillna('dados')
+            df_cache = df_cache[['sha256', 'tipo_planilha', 'artefato', 'linhas', 'tamanho', 'criado_em', 'ultimo_acesso']]
+            df_cache.columns = ['SHA-256', 'Tipo', 'Conteúdo', 'Linhas', 'Tamanho (MB)', 'Criado em', 'Último Acesso']
+            st.dataframe(df_cache, use_container_width=True, hide_index=True)
+        else:
+            st.info("Nenhuma planilha em cache.")
+        
+        if st.button("🧹 Limpar Cache de Planilhas"):
+            cache_planilhas.limpar()
+            st.success("Cache de planilhas limpo!")
+            st.rerun()
+
+def painel_usuarios():
+    """Base de usuários (SQLite) x planilha login_senha.xlsx"""
+    try:
+        banco_usuarios.preparar()
+        alterada = banco_usuarios.planilha_alterada()
+    except Exception as e:
+        st.error(f"Erro ao abrir a base de usuários: {e}")
+        return
+    
+    if alterada:
+        st.warning(f"⚠️ '{USUARIOS_FILE}' foi alterada, mas não pôde ser reimportada (veja o log do servidor): as mudanças ainda não valem para o login.")
+    
+    with st.expander("👤 Usuários", expanded=alterada):
+        st.caption(
+            f"O login usa a base de usuários, reimportada sozinha quando '{USUARIOS_FILE}' muda "
+            "(senhas trocadas no painel depois da última exportação são mantidas). "
+            "Importar substitui a base inteira pela planilha (essas senhas são perdidas); "
+            "exportar grava na planilha os usuários com as senhas atuais."
+        )
+        col_imp, col_exp = st.columns(2)
+        with col_imp:
+            if st.button("📥 Importar planilha de usuários"):
+                try:
+                    total = banco_usuarios.importar_excel()
+                    st.success(f"✅ {total} usuários importados de '{USUARIOS_FILE}'.")
+                except Exception as e:
+                    st.error(f"Erro ao importar: {e}")
+        with col_exp:
+            if st.button("📤 Exportar base para a planilha"):
+                try:
+                    total = banco_usuarios.exportar_excel()
+                    st.success(f"✅ {total} usuários gravados em '{USUARIOS_FILE}'.")
+                except Exception as e:
+                    st.error(f"Erro ao exportar: {e}")
+
 def relatorio_completo():
     """Relatório completo de acessos"""
     st.markdown("### 📊 Relatório Completo de Acessos")
@@ -273,15 +329,9 @@ def relatorio_completo():
             if st.session_state.get('confirm_reset', False):
                 # Confirmar reset
                 try:
-                    # Limpar arquivo local
-                    with open('local_access_log.json', 'w', encoding='utf-8') as f:
-                        json.dump([], f, ensure_ascii=False, indent=2)
-                    
-                    # Tentar limpar Firebase também
-                    try:
-                        firebase_manager.clear_all_logs()
-                    except:
-                        pass
+                    # Limpar log local (e o Firebase, se conectado)
+                    if not firebase_manager.clear_all_logs():
+                        raise Exception("não foi possível limpar os logs")
                     
                     st.success("✅ Dados resetados com sucesso!")
                     st.session_state.confirm_reset = False
@@ -298,22 +348,19 @@ def relatorio_completo():
             st.rerun()
     
     try:
-        logs = firebase_manager.get_access_logs(limit=1000)
+        resumo = firebase_manager.get_access_summary()
         
-        if not logs:
+        if not resumo['total']:
             st.warning("Nenhum log encontrado.")
             return
         
-        # Converter para DataFrame simples
-        df_logs = pd.DataFrame(logs)
-        
         # Criar lista de todos os acessos (como planilha)
         st.markdown("#### 📋 Lista Completa de Todos os Acessos")
         
-        # Preparar dados para exibição
-        df_display = df_logs[['data_hora', 'usuario', 'ip', 'user_agent']].copy()
-        df_display.columns = ['Data/Hora', 'Usuário', 'IP', 'Navegador']
-        df_display = df_display.sort_values('Data/Hora', ascending=False)
+        # Preparar dados para exibição (mais recentes primeiro)
+        df_display = _tabela_acessos(firebase_manager.get_access_list(limit=LIMITE_TABELA_LOGS))
+        if resumo['total'] > len(df_display):
+            st.caption(f"Mostrando os {len(df_display)} acessos mais recentes de {resumo['total']}; a exportação traz todos.")
         
         # Exibir tabela completa
         st.dataframe(
@@ -327,20 +374,17 @@ def relatorio_completo():
         col_stats1, col_stats2, col_stats3, col_stats4 = st.columns(4)
         
         with col_stats1:
-            total_acessos = len(df_logs)
-            st.metric("Total de Acessos", total_acessos)
+            st.metric("Total de Acessos", resumo['total'])
         
         with col_stats2:
-            usuarios_unicos = df_logs['usuario'].nunique()
-            st.metric("Usuários Únicos", usuarios_unicos)
+            st.metric("Usuários Únicos", resumo['usuarios'])
         
         with col_stats3:
-            ips_unicos = df_logs['ip'].nunique()
-            st.metric("IPs Únicos", ips_unicos)
+            st.metric("IPs Únicos", resumo['ips'])
         
         with col_stats4:
-            if len(df_logs) > 0:
-                ultimo_acesso = df_logs['data_hora'].iloc[0]  # Primeiro da lista ordenada
+            if len(df_display) > 0:
+                ultimo_acesso = df_display['Data/Hora'].iloc[0]  # Primeiro da lista ordenada
                 st.metric("Último Acesso", ultimo_acesso)
         
         # Botões de exportação
@@ -350,7 +394,7 @@ def relatorio_completo():
             if st.button("📥 Exportar Lista Completa para Excel"):
                 output = BytesIO()
                 with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    df_display.to_excel(writer, sheet_name='Todos os Acessos', index=False)
+                    _tabela_acessos(firebase_manager.get_access_list()).to_excel(writer, sheet_name='Todos os Acessos', index=False)
                 
                 st.download_button(
                     label="⬇️ Baixar Lista Completa",
@@ -361,13 +405,12 @@ def relatorio_completo():
         
         with col_export2:
             # Lista resumida por usuário
-            stats_usuarios = df_logs.groupby('usuario').agg({
-                'data_hora': ['count', 'first', 'last']
-            })
-            stats_usuarios.columns = ['Total_Acessos', 'Primeiro_Acesso', 'Ultimo_Acesso']
-            stats_usuarios = stats_usuarios.reset_index()
+            stats_usuarios = pd.DataFrame(
+                firebase_manager.get_users_summary(), columns=['usuario', 'total', 'primeiro', 'ultimo']
+            )
+            for coluna in ['primeiro', 'ultimo']:
+                stats_usuarios[coluna] = stats_usuarios[coluna].str[:19].str.replace('T', ' ')
             stats_usuarios.columns = ['Usuário', 'Total de Acessos', 'Primeiro Acesso', 'Último Acesso']
-            stats_usuarios = stats_usuarios.sort_values('Total de Acessos', ascending=False)
             
             if st.button("📊 Exportar Resumo por Usuário"):
                 output = BytesIO()
@@ -394,17 +437,13 @@ def estatisticas_usuario():
         st.rerun()
     
     try:
-        logs = firebase_manager.get_access_logs(limit=1000)
+        # Lista de usuários únicos
+        usuarios_unicos = firebase_manager.get_access_values('usuario')
         
-        if not logs:
+        if not usuarios_unicos:
             st.warning("Nenhum log encontrado.")
             return
         
-        df_logs = pd.DataFrame(logs)
-        
-        # Lista de usuários únicos
-        usuarios_unicos = sorted(df_logs['usuario'].unique())
-        
         # Campo de busca por nome
         st.markdown("#### 🔍 Buscar Usuário")
         busca_nome = st.text_input("Digite o nome para buscar:", placeholder="Ex: ALEXANDRE")
@@ -449,11 +488,8 @@ def estatisticas_usuario():
             # Histórico do usuário
             st.markdown("#### 📋 Histórico de Acessos")
             
-            df_usuario = df_logs[df_logs['usuario'] == usuario_selecionado].copy()
-            df_usuario = df_usuario.sort_values('timestamp', ascending=False)
-            
-            df_exibicao = df_usuario[['data_hora', 'ip', 'user_agent']].copy()
-            df_exibicao.columns = ['Data/Hora', 'IP', 'Navegador']
+            df_exibicao = _tabela_acessos(firebase_manager.get_access_list(usuario=usuario_selecionado))
+            df_exibicao = df_exibicao[['Data/Hora', 'IP', 'Navegador']]
             
             st.dataframe(df_exibicao, use_container_width=True)
     
@@ -14,6 +14,28 @@ import os
 import json
 import random
 
+from cache_planilhas import cache_planilhas
+from codigos_login import codigos_login
+from duplicados import AlunosMultiplasTurmas, DuplicadosCenso
+from fila_email import configuracao_smtp, fila_email
+from filtros import IndiceFiltros, aplicar_filtros, mascara_filtros, normalizar_filtros
+from leitura_planilhas import codificar_categoria, detectar_tipo_por_colunas, identificar_planilha, ler_planilha_por_tipo
+from usuarios import USUARIOS_FILE, banco_usuarios, normalizar_email, somente_digitos
+from indicadores import (
+    MEDIA_APROVACAO,
+    FAIXAS_FREQUENCIA_ORDEM,
+    NOMES_BIMESTRE,
+    SOMA_FINAL_ALVO,
+    ResumoFrequencia,
+    ResumoNotasBaixas,
+    calcula_indicadores,
+    classificar_frequencia_faixas,
+    classificar_status_b1_b2_b3_vetorizado,
+    coluna_bimestre,
+    indicadores_exatos,
+    mapear_bimestres,
+)
+
 # Carregar variáveis de ambiente
 try:
     from dotenv import load_dotenv
@@ -100,48 +122,22 @@ def _styler_map_cells_twice(df, fn1, subset1, fn2, subset2):
 # -----------------------------
 # Sistema de Autenticação (login por código enviado por e-mail)
 # -----------------------------
-CODIGOS_LOGIN_FILE = "codigos_login.json"
 CODIGO_VALIDADE_MINUTOS = 30
 SESSAO_VALIDADE_MINUTOS = 30  # após este tempo a sessão expira e é preciso entrar de novo com código por e-mail
 
-def _normalizar_email(email):
-    """Normaliza e-mail para comparação (minúsculo, sem espaços)."""
-    if not email or not isinstance(email, str):
-        return ""
-    return email.strip().lower()
-
-def _carregar_codigos():
-    """Carrega códigos de login do arquivo."""
-    try:
-        if os.path.exists(CODIGOS_LOGIN_FILE):
-            with open(CODIGOS_LOGIN_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-    except Exception:
-        pass
-    return {}
-
-def _salvar_codigos(data):
-    """Salva códigos de login no arquivo."""
-    try:
-        with open(CODIGOS_LOGIN_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        return True
-    except Exception:
-        return False
-
 def gerar_e_salvar_codigo(email):
     """Gera código de 6 dígitos, salva com validade de 30 minutos e retorna (codigo, sucesso, mensagem)."""
-    email_norm = _normalizar_email(email)
+    email_norm = normalizar_email(email)
     if not email_norm:
         return None, False, "E-mail inválido."
     usuario = obter_usuario_por_email(email_norm)
     if not usuario:
         return None, False, "E-mail não cadastrado no sistema."
     codigo = "".join(str(random.randint(0, 9)) for _ in range(6))
-    expires_at = (datetime.now() + timedelta(minutes=CODIGO_VALIDADE_MINUTOS)).isoformat()
-    codigos = _carregar_codigos()
-    codigos[email_norm] = {"code": codigo, "expires_at": expires_at}
-    _salvar_codigos(codigos)
+    try:
+        codigos_login.salvar(email_norm, codigo, CODIGO_VALIDADE_MINUTOS)
+    except Exception as e:
+        return None, False, f"Erro ao gerar código: {e}"
     return codigo, True, "Código gerado e enviado por e-mail."
 
 def enviar_codigo_por_email(email):
@@ -162,34 +158,32 @@ Se você não solicitou este código, ignore este e-mail.
 Superintendência Regional de Educação de Gurupi - TO
 Painel SGE"""
     sucesso_envio, msg_envio = enviar_email(email, assunto, corpo)
+    if sucesso_envio and configuracao_smtp()["simulado"]:
+        # Sem GMAIL_USER/GMAIL_PASSWORD o e-mail não sai; em desenvolvimento o código aparece na tela
+        if os.getenv("PAINEL_MODO_DEV") == "1":
+            return True, f"Envio de e-mail simulado (modo de desenvolvimento). Seu código é: {codigo}"
+        return True, "Código gerado, mas o envio de e-mail está simulado neste servidor (GMAIL_USER/GMAIL_PASSWORD não configurados). Procure o administrador."
+    if sucesso_envio and fila_email.erro_servidor:
+        return True, "Código gerado, mas o servidor de e-mail está com falhas: o envio pode atrasar alguns minutos."
     if sucesso_envio:
         return True, "Código enviado para seu e-mail. Verifique a caixa de entrada (e o spam)."
     return False, f"Código gerado, mas falha ao enviar e-mail: {msg_envio}"
 
 def validar_codigo_login(email, codigo):
     """Valida e-mail + código. Se válido, retorna dict do usuário e invalida o código."""
-    email_norm = _normalizar_email(email)
+    email_norm = normalizar_email(email)
     if not email_norm or not codigo or not str(codigo).strip():
         return None
-    codigos = _carregar_codigos()
-    entry = codigos.get(email_norm)
-    if not entry:
-        return None
-    if entry.get("code") != str(codigo).strip():
-        return None
+    # Confere e apaga o código na mesma transação (o mesmo código não entra duas vezes)
     try:
-        expires_at = datetime.fromisoformat(entry["expires_at"])
-        if datetime.now() > expires_at:
-            del codigos[email_norm]
-            _salvar_codigos(codigos)
+        if not codigos_login.consumir(email_norm, str(codigo).strip()):
             return None
-    except Exception:
+    except Exception as e:
+        print(f"Erro ao validar código: {e}")
         return None
     usuario = obter_usuario_por_email(email_norm)
     if not usuario:
         return None
-    del codigos[email_norm]
-    _salvar_codigos(codigos)
     if MONITORING_AVAILABLE:
         try:
             client_info = get_client_info()
@@ -204,46 +198,26 @@ def validar_codigo_login(email, codigo):
 
 def obter_usuario_por_email(email):
     """Retorna o dict do usuário da planilha pelo e-mail (coluna EMAIL ou E-MAIL)."""
-    df_usuarios = carregar_usuarios()
-    if df_usuarios is None:
+    banco = carregar_usuarios()
+    if banco is None:
         return None
-    email_norm = _normalizar_email(email)
-    col_email = None
-    for c in df_usuarios.columns:
-        if str(c).strip().upper() in ("EMAIL", "E-MAIL", "E_MAIL"):
-            col_email = c
-            break
-    if col_email is None:
+    usuario = banco.por_email(email)
+    if not usuario:
         return None
-    for _, row in df_usuarios.iterrows():
-        val = row.get(col_email)
-        if pd.isna(val) or val == "":
-            continue
-        if _normalizar_email(str(val)) == email_norm:
-            cpf_val = row.get("CPF", "")
-            inep_val = row.get("INEP", "")
-            cpf_usuario = re.sub(r"[^0-9]", "", str(cpf_val)) if not pd.isna(cpf_val) and cpf_val != "" else None
-            if inep_val != "" and not pd.isna(inep_val):
-                inep_str = str(int(float(inep_val)))
-                inep_usuario = re.sub(r"[^0-9]", "", inep_str)
-            else:
-                inep_usuario = None
-            return {
-                "nome": row.get("NOME", "Usuário"),
-                "cpf": cpf_usuario,
-                "inep": inep_usuario,
-                "email": email_norm,
-            }
-    return None
+    return {
+        "nome": usuario["nome"],
+        "cpf": usuario["cpf"] or None,
+        "inep": usuario["inep"] or None,
+        "email": usuario["email"],
+    }
 
 def carregar_usuarios():
-    """Carrega a planilha de usuários"""
+    """Base de usuários (SQLite); na primeira vez é importada da planilha login_senha.xlsx"""
     try:
-        # Tenta carregar a planilha de login
-        df_usuarios = pd.read_excel("login_senha.xlsx")
-        return df_usuarios
+        banco_usuarios.preparar()
+        return banco_usuarios
     except FileNotFoundError:
-        st.error("Arquivo 'login_senha.xlsx' não encontrado!")
+        st.error(f"Arquivo '{USUARIOS_FILE}' não encontrado!")
         return None
     except Exception as e:
         st.error(f"Erro ao carregar usuários: {str(e)}")
@@ -272,94 +246,56 @@ def _has_recent_access(usuario_nome):
 
 def autenticar_usuario(identificador, senha):
     """Autentica usuário com CPF ou INEP e senha"""
-    df_usuarios = carregar_usuarios()
-    if df_usuarios is None:
+    banco = carregar_usuarios()
+    if banco is None:
         return None
     
-    # Normalizar identificador (remover pontos, traços, espaços)
-    id_limpo = re.sub(r'[^0-9]', '', str(identificador))
     # Normalizar senha (remover pontos, traços, espaços - apenas números)
-    senha_limpa = re.sub(r'[^0-9]', '', str(senha))
-    
-    # Buscar usuário na planilha
-    for _, usuario in df_usuarios.iterrows():
-        # Verificar CPF
-        cpf_usuario = re.sub(r'[^0-9]', '', str(usuario.get('CPF', '')))
-        # Verificar INEP - tratar NaN e float
-        inep_valor = usuario.get('INEP', '')
-        if pd.isna(inep_valor) or inep_valor == '':
-            inep_usuario = ''
-        else:
-            # Converter float para int primeiro para remover o .0, depois para string
-            inep_str = str(int(float(inep_valor)))
-            inep_usuario = re.sub(r'[^0-9]', '', inep_str)
-        
-        # Comparar com CPF ou INEP
-        if (cpf_usuario and cpf_usuario == id_limpo) or (inep_usuario and inep_usuario == id_limpo):
-            # Verificar senha (comparação com senha limpa - apenas números)
-            senha_usuario = re.sub(r'[^0-9]', '', str(usuario.get('SENHA', '')))
-            if senha_usuario == senha_limpa:
-                # Registrar acesso apenas no momento do login
-                if MONITORING_AVAILABLE:
-                    try:
-                        client_info = get_client_info()
-                        # Sempre registrar o acesso (removida verificação de acesso recente)
-                        firebase_manager.log_access(
-                            usuario=usuario.get('NOME', 'Usuário'),
-                            ip=client_info['ip'],
-                            user_agent=client_info['user_agent']
-                        )
-                    except Exception as e:
-                        print(f"Erro ao registrar acesso: {e}")
-                
-                return {
-                    'nome': usuario.get('NOME', 'Usuário'),
-                    'cpf': cpf_usuario if cpf_usuario else None,
-                    'inep': inep_usuario if inep_usuario else None,
-                    'senha_atual': str(usuario.get('SENHA', '')),
-                    'linha': _
-                }
+    senha_limpa = somente_digitos(senha)
+    
+    # Usuários com esse CPF/INEP (um INEP pode ter mais de um cadastro)
+    for usuario in banco.por_identificador(identificador):
+        if usuario["senha_limpa"] == senha_limpa:
+            # Registrar acesso apenas no momento do login
+            if MONITORING_AVAILABLE:
+                try:
+                    client_info = get_client_info()
+                    # Sempre registrar o acesso (removida verificação de acesso recente)
+                    firebase_manager.log_access(
+                        usuario=usuario['nome'],
+                        ip=client_info['ip'],
+                        user_agent=client_info['user_agent']
+                    )
+                except Exception as e:
+                    print(f"Erro ao registrar acesso: {e}")
+            
+            return {
+                'nome': usuario['nome'],
+                'cpf': usuario['cpf'] or None,
+                'inep': usuario['inep'] or None,
+                'senha_atual': usuario['senha'],
+                'linha': usuario['linha']
+            }
     return None
 
 def alterar_senha(identificador, senha_atual, nova_senha):
-    """Altera a senha do usuário na planilha"""
+    """Altera a senha do usuário na base (UPDATE atômico; a planilha é gerada com `python usuarios.py exportar`)"""
     try:
-        df_usuarios = carregar_usuarios()
-        if df_usuarios is None:
-            return False, "Erro ao carregar planilha"
+        banco = carregar_usuarios()
+        if banco is None:
+            return False, "Erro ao carregar base de usuários"
         
-        id_limpo = re.sub(r'[^0-9]', '', str(identificador))
         # Normalizar senhas (remover pontos, traços, espaços - apenas números)
-        senha_atual_limpa = re.sub(r'[^0-9]', '', str(senha_atual))
-        nova_senha_limpa = re.sub(r'[^0-9]', '', str(nova_senha))
-        
-        # Encontrar usuário
-        for idx, usuario in df_usuarios.iterrows():
-            # Verificar CPF
-            cpf_usuario = re.sub(r'[^0-9]', '', str(usuario.get('CPF', '')))
-            # Verificar INEP - tratar NaN e float
-            inep_valor = usuario.get('INEP', '')
-            if pd.isna(inep_valor) or inep_valor == '':
-                inep_usuario = ''
-            else:
-                # Converter float para int primeiro para remover o .0, depois para string
-                inep_str = str(int(float(inep_valor)))
-                inep_usuario = re.sub(r'[^0-9]', '', inep_str)
-            
-            # Comparar com CPF ou INEP
-            if (cpf_usuario and cpf_usuario == id_limpo) or (inep_usuario and inep_usuario == id_limpo):
-                senha_usuario = re.sub(r'[^0-9]', '', str(usuario.get('SENHA', '')))
-                if senha_usuario == senha_atual_limpa:
-                    # Atualizar senha (salvar apenas números)
-                    df_usuarios.at[idx, 'SENHA'] = nova_senha_limpa
-                    
-                    # Salvar planilha
-                    df_usuarios.to_excel("login_senha.xlsx", index=False)
-                    return True, "Senha alterada com sucesso!"
-                else:
-                    return False, "Senha atual incorreta"
+        senha_atual_limpa = somente_digitos(senha_atual)
+        nova_senha_limpa = somente_digitos(nova_senha)
         
-        return False, "Usuário não encontrado"
+        # Primeiro cadastro com esse CPF/INEP; confere a senha atual e grava (apenas números) na mesma transação
+        alterada = banco.alterar_senha(identificador, senha_atual_limpa, nova_senha_limpa)
+        if alterada is None:
+            return False, "Usuário não encontrado"
+        if not alterada:
+            return False, "Senha atual incorreta"
+        return True, "Senha alterada com sucesso!"
     except Exception as e:
         return False, f"Erro ao alterar senha: {str(e)}"
 
@@ -589,7 +525,7 @@ def tela_login():
                     st.rerun()
         
         if solicitar_btn:
-            email_limpo = _normalizar_email(email)
+            email_limpo = normalizar_email(email)
             if not email_limpo:
                 st.error("Digite seu e-mail para solicitar o código.")
             else:
@@ -600,7 +536,7 @@ def tela_login():
                     st.error(msg)
         
         if login_btn:
-            email_limpo = _normalizar_email(email)
+            email_limpo = normalizar_email(email)
             codigo_limpo = (codigo or "").strip()
             if not email_limpo:
                 st.error("Digite seu e-mail.")
@@ -833,99 +769,20 @@ def salvar_config_email(email, senha):
         return False
 
 def enviar_email(destinatario, assunto, corpo, anexo=None):
-    """Envia email real com Gmail SMTP"""
+    """Coloca o email na fila de envio (SMTP em segundo plano, com novas tentativas) e retorna na hora"""
     try:
-        import smtplib
-        from email.mime.multipart import MIMEMultipart
-        from email.mime.text import MIMEText
-        from email.mime.base import MIMEBase
-        from email import encoders
-        import os
-        
-        # Configurações do Gmail (você precisa configurar)
-        gmail_user = os.getenv('GMAIL_USER', 'seu_email@gmail.com')
-        gmail_password = os.getenv('GMAIL_PASSWORD', 'sua_senha_app')
-        
-        # Se não tiver configuração, usar simulação
-        if gmail_user == 'seu_email@gmail.com' or not gmail_password:
-            return enviar_email_simulado(destinatario, assunto, corpo, anexo)
-        
-        # Criar mensagem
-        msg = MIMEMultipart()
-        msg['From'] = gmail_user
-        msg['To'] = destinatario
-        msg['Subject'] = assunto
-        
-        # Adicionar corpo do email
-        msg.attach(MIMEText(corpo, 'plain', 'utf-8'))
-        
-        # Adicionar anexo se existir
-        if anexo:
-            part = MIMEBase('application', 'octet-stream')
-            part.set_payload(anexo)
-            encoders.encode_base64(part)
-            part.add_header(
-                'Content-Disposition',
-                f'attachment; filename= relatorio_sge_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
-            )
-            msg.attach(part)
-        
-        # Enviar email
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(gmail_user, gmail_password)
-        text = msg.as_string()
-        server.sendmail(gmail_user, destinatario, text)
-        server.quit()
-        
-        # Salvar log
         remetente = (st.session_state.get("usuario") or {}).get("nome", "Sistema")
-        log_info = {
-            "destinatario": destinatario,
-            "assunto": assunto,
-            "data": datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
-            "remetente": remetente,
-            "status": "Enviado (Real)"
-        }
-        
-        try:
-            with open("email_log.json", "a", encoding="utf-8") as f:
-                f.write(f"{json.dumps(log_info, ensure_ascii=False)}\n")
-        except:
-            pass
-        
-        return True, f"Email enviado para {destinatario} com sucesso!"
-        
+        fila_email.enfileirar(destinatario, assunto, corpo, anexo=anexo, remetente=remetente)
+        if configuracao_smtp()["simulado"]:
+            return True, f"Email simulado enviado para {destinatario} com sucesso!"
+        return True, f"Email para {destinatario} na fila de envio."
     except Exception as e:
         return False, f"Erro ao enviar email: {str(e)}"
 
-def enviar_email_simulado(destinatario, assunto, corpo, anexo=None):
-    """Simula envio de email (fallback)"""
-    try:
-        import time
-        time.sleep(1)  # Simular processamento
-        
-        # Salvar informações do "envio" em um arquivo de log
-        remetente = (st.session_state.get("usuario") or {}).get("nome", "Sistema")
-        log_info = {
-            "destinatario": destinatario,
-            "assunto": assunto,
-            "data": datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
-            "remetente": remetente,
-            "status": "Enviado (Simulado)"
-        }
-        
-        # Salvar log (opcional)
-        try:
-            with open("email_log.json", "a", encoding="utf-8") as f:
-                f.write(f"{json.dumps(log_info, ensure_ascii=False)}\n")
-        except:
-            pass
-        
-        return True, f"Email simulado enviado para {destinatario} com sucesso!"
-    except Exception as e:
-        return False, f"Erro ao simular envio: {str(e)}"
-
+# Retoma os emails que ficaram na fila em execuções anteriores
+fila_email.iniciar()
+# Apaga os códigos de login vencidos periodicamente
+codigos_login.iniciar()
 
 
 # -----------------------------
@@ -933,9 +790,6 @@ def enviar_email_simulado(destinatario, assunto, corpo, anexo=None):
 # -----------------------------
 st.set_page_config(page_title="Painel SGE – Notas e Alertas", layout="wide")
 
-MEDIA_APROVACAO = 6.0
-MEDIA_FINAL_ALVO = 6.0   # média final desejada após 4 bimestres
-SOMA_FINAL_ALVO = MEDIA_FINAL_ALVO * 4  # 24 pontos no ano
 
 # -----------------------------
 # Utilidades
@@ -945,68 +799,52 @@ def detectar_tipo_planilha(df):
     Detecta automaticamente o tipo de planilha baseado nas colunas disponíveis
     Retorna: 'notas_frequencia', 'conteudo_aplicado' ou 'censo_escolar'
     """
-    colunas = [col.lower().strip() for col in df.columns]
-
-    # Verificar se é planilha de censo escolar
-    censo_indicators = [
-        'código', 'superv', 'convên', 'entidade', 'inep', 'situação', 'classific',
-        'nome', 'endereço', 'bairro', 'distrito', 'cep', 'cnpj', 'telefone', 'email',
-        'nível de', 'categoria', 'tipo de estrutura', 'etapas', 'ano letivo', 'calendário',
-        'curso', 'avaliação', 'conceito', 'servidor', 'turno', 'horário', 'tempo',
-        'média', 'salário', 'língua', 'professor', 'área de cargo', 'data na', 'cpf'
-    ]
+    return detectar_tipo_por_colunas(df.columns)
 
-    # Verificar se é planilha de conteúdo aplicado
-    conteudo_indicators = [
-        'componente curricu', 'atividade/conteúdo', 'situação', 'data', 'horário'
-    ]
-
-    # Verificar se é planilha de notas/frequência
-    notas_indicators = [
-        'aluno', 'nota', 'frequencia', 'turma', 'escola', 'disciplina', 'periodo'
-    ]
-
-    censo_score = sum(1 for indicator in censo_indicators
-                      if any(indicator in col for col in colunas))
-    conteudo_score = sum(1 for indicator in conteudo_indicators
-                         if any(indicator in col for col in colunas))
-    notas_score = sum(1 for indicator in notas_indicators
-                      if any(indicator in col for col in colunas))
-
-    # Se tem mais indicadores de censo escolar, é esse tipo
-    if censo_score >= 8:
-        return 'censo_escolar'
-    elif conteudo_score >= 3:
-        return 'conteudo_aplicado'
-    elif notas_score >= 3:
-        return 'notas_frequencia'
-    else:
-        # Se não conseguir detectar claramente, assume notas/frequência como padrão
-        return 'notas_frequencia'
+# Incrementar sempre que a normalização ou os indicadores mudarem (invalida o cache em disco)
+VERSAO_PROCESSAMENTO = 5
+# Formato do artefato "indicadores" do cache (entra no nome do artefato); incrementar quando
+# calcula_indicadores mudar as colunas ou o cálculo
+VERSAO_INDICADORES = 1
 
 @st.cache_data(show_spinner=False)
 def carregar_dados(arquivo, sheet=None):
     if arquivo is None:
         # Tenta ler o padrão local "dados.xlsx"
-        df = pd.read_excel("dados.xlsx", sheet_name=sheet) if sheet else pd.read_excel("dados.xlsx")
+        with open("dados.xlsx", "rb") as f:
+            conteudo = f.read()
     else:
-        df = pd.read_excel(arquivo, sheet_name=sheet) if sheet else pd.read_excel(arquivo)
+        conteudo = arquivo.getvalue()
+
+    # Mesmo arquivo (re-upload ou reinício do servidor) -> lê o Parquet já normalizado
+    hash_planilha = cache_planilhas.calcular_hash(conteudo, sheet)
+    df = cache_planilhas.obter(hash_planilha, VERSAO_PROCESSAMENTO)
+    if df is not None:
+        df.attrs['hash_planilha'] = hash_planilha
+        return df
+
+    # Detectar tipo de planilha só pelo cabeçalho e usar o leitor específico do tipo
+    tipo_planilha, _ = identificar_planilha(conteudo, sheet)
+    df = ler_planilha_por_tipo(conteudo, tipo_planilha, sheet)
+    if df is None:
+        df = pd.read_excel(BytesIO(conteudo), sheet_name=sheet) if sheet else pd.read_excel(BytesIO(conteudo))
 
     # Normalizar nomes de colunas
     df.columns = [c.strip() for c in df.columns]
     
-    # Detectar tipo de planilha
-    tipo_planilha = detectar_tipo_planilha(df)
-    
     if tipo_planilha == 'conteudo_aplicado':
         # Processar planilha de conteúdo aplicado
-        return processar_conteudo_aplicado(df)
+        df = processar_conteudo_aplicado(df)
     elif tipo_planilha == 'censo_escolar':
         # Processar planilha do censo escolar
-        return processar_censo_escolar(df)
+        df = processar_censo_escolar(df)
     else:
         # Processar planilha de notas/frequência (padrão atual)
-        return processar_notas_frequencia(df)
+        df = processar_notas_frequencia(df)
+
+    cache_planilhas.salvar(hash_planilha, df.attrs['tipo_planilha'], df, VERSAO_PROCESSAMENTO)
+    df.attrs['hash_planilha'] = hash_planilha
+    return df
 
 def processar_conteudo_aplicado(df):
     """Processa planilha de conteúdo aplicado"""
@@ -1058,8 +896,8 @@ def processar_notas_frequencia(df):
     if "Frequência Anual" in df.columns and "Frequencia Anual" not in df.columns:
         df = df.rename(columns={"Frequência Anual": "Frequencia Anual"})
 
-    # Converter Nota (vírgula -> ponto, texto -> float)
-    if "Nota" in df.columns:
+    # Converter Nota (vírgula -> ponto, texto -> float); a leitura em streaming já entrega float
+    if "Nota" in df.columns and not pd.api.types.is_float_dtype(df["Nota"]):
         df["Nota"] = (
             df["Nota"]
             .astype(str)
@@ -1078,10 +916,11 @@ def processar_notas_frequencia(df):
     if "Frequencia Anual" in df.columns:
         df["Frequencia Anual"] = pd.to_numeric(df["Frequencia Anual"], errors="coerce")
 
-    # Padronizar texto dos campos principais (evita diferenças por espaços)
+    # Padronizar texto dos campos principais (evita diferenças por espaços).
+    # Ficam como category: filtros, groupby e nunique trabalham sobre códigos inteiros
     for col in ["Escola", "Turma", "Turno", "Status", "Periodo", "Disciplina"]:
         if col in df.columns:
-            df[col] = df[col].astype(str).str.strip()
+            df[col] = codificar_categoria(df[col])
     
     # Detectar coluna de aluno/estudante
     coluna_aluno = None
@@ -1091,7 +930,11 @@ def processar_notas_frequencia(df):
             break
     
     if coluna_aluno:
-        df[coluna_aluno] = df[coluna_aluno].astype(str).str.strip()
+        df[coluna_aluno] = codificar_categoria(df[coluna_aluno])
+
+    # Bimestre numérico (1..4; 0 = período não reconhecido), calculado uma vez por planilha
+    if "Periodo" in df.columns:
+        df["Bimestre"] = mapear_bimestres(df["Periodo"])
     
     # Adicionar tipo de planilha para identificação
     df.attrs['tipo_planilha'] = 'notas_frequencia'
@@ -1267,20 +1110,10 @@ def criar_interface_censo_escolar(df):
     st.markdown("### 🔍 Duplicatas Encontradas")
     
     if 'Nome_Estudante' in df_filt.columns and 'Escola' in df_filt.columns:
-        # 1. Duplicatas por Escola (estudante em múltiplas escolas)
-        duplicatas_escola = df_filt.groupby('Nome_Estudante').agg({
-            'Escola': 'nunique',
-            'Turma': 'nunique' if 'Turma' in df_filt.columns else 'count'
-        }).reset_index()
-        
-        estudantes_multiplas_escolas = duplicatas_escola[duplicatas_escola['Escola'] > 1]
-        
-        # 2. Duplicatas por Turma (estudante em múltiplas turmas na mesma escola)
-        duplicatas_turma = df_filt.groupby(['Nome_Estudante', 'Escola']).agg({
-            'Turma': 'nunique' if 'Turma' in df_filt.columns else 'count'
-        }).reset_index()
-        
-        estudantes_multiplas_turmas = duplicatas_turma[duplicatas_turma['Turma'] > 1]
+        # Múltiplas escolas e múltiplas turmas (mesma escola), com as tabelas detalhadas
+        duplicados = DuplicadosCenso(df_filt, 'Nome_Estudante')
+        estudantes_multiplas_escolas = duplicados.multiplas_escolas
+        estudantes_multiplas_turmas = duplicados.multiplas_turmas
         
         # Métricas Principais
         col1, col2, col3, col4 = st.columns(4)
@@ -1292,11 +1125,11 @@ def criar_interface_censo_escolar(df):
             st.metric("Em Múltiplas Turmas", len(estudantes_multiplas_turmas))
         
         with col3:
-            total_duplicatas = len(estudantes_multiplas_escolas) + len(estudantes_multiplas_turmas)
+            total_duplicatas = duplicados.total
             st.metric("Total Duplicatas", total_duplicatas)
         
         with col4:
-            percentual = (total_duplicatas / len(df_filt['Nome_Estudante'].unique())) * 100 if len(df_filt['Nome_Estudante'].unique()) > 0 else 0
+            percentual = duplicados.percentual(total_duplicatas)
             st.metric("Percentual", f"{percentual:.1f}%")
         
         # Tabelas Detalhadas
@@ -1305,50 +1138,12 @@ def criar_interface_censo_escolar(df):
             # 1. Estudantes em Múltiplas Escolas (Detalhado)
             if len(estudantes_multiplas_escolas) > 0:
                 st.markdown("#### 🏫 Estudantes em Múltiplas Escolas")
-                
-                # Criar tabela detalhada mostrando escola + turma para cada estudante
-                duplicatas_escola_detalhadas = []
-                for _, row in estudantes_multiplas_escolas.iterrows():
-                    nome = row['Nome_Estudante']
-                    dados_estudante = df_filt[df_filt['Nome_Estudante'] == nome]
-                    
-                    # Para cada escola do estudante, mostrar a turma correspondente
-                    for _, linha in dados_estudante.iterrows():
-                        duplicatas_escola_detalhadas.append({
-                            'Nome': nome,
-                            'Escola': linha['Escola'],
-                            'Turma': linha['Turma'] if 'Turma' in linha else 'N/A',
-                            'CPF': linha['CPF'] if 'CPF' in linha else 'N/A',
-                            'Situacao': linha['Situacao'] if 'Situacao' in linha else 'N/A'
-                        })
-                
-                df_duplicatas_escola = pd.DataFrame(duplicatas_escola_detalhadas)
-                st.dataframe(df_duplicatas_escola, use_container_width=True)
+                st.dataframe(duplicados.detalhe_escolas, use_container_width=True)
             
             # 2. Estudantes em Múltiplas Turmas (mesma escola) - Detalhado
             if len(estudantes_multiplas_turmas) > 0:
                 st.markdown("#### 🎓 Estudantes em Múltiplas Turmas (Mesma Escola)")
-                
-                # Criar tabela detalhada mostrando cada linha de turma
-                duplicatas_turma_detalhadas = []
-                for _, row in estudantes_multiplas_turmas.iterrows():
-                    nome = row['Nome_Estudante']
-                    escola = row['Escola']
-                    dados_estudante = df_filt[(df_filt['Nome_Estudante'] == nome) & 
-                                            (df_filt['Escola'] == escola)]
-                    
-                    # Para cada turma do estudante na mesma escola
-                    for _, linha in dados_estudante.iterrows():
-                        duplicatas_turma_detalhadas.append({
-                            'Nome': nome,
-                            'Escola': escola,
-                            'Turma': linha['Turma'] if 'Turma' in linha else 'N/A',
-                            'CPF': linha['CPF'] if 'CPF' in linha else 'N/A',
-                            'Situacao': linha['Situacao'] if 'Situacao' in linha else 'N/A'
-                        })
-                
-                df_duplicatas_turma = pd.DataFrame(duplicatas_turma_detalhadas)
-                st.dataframe(df_duplicatas_turma, use_container_width=True)
+                st.dataframe(duplicados.detalhe_turmas, use_container_width=True)
             else:
                 st.info("ℹ️ Nenhum estudante encontrado em múltiplas turmas da mesma escola.")
             
@@ -1358,64 +1153,30 @@ def criar_interface_censo_escolar(df):
             # Preparar dados para download em abas separadas
             if len(estudantes_multiplas_escolas) > 0 or len(estudantes_multiplas_turmas) > 0:
                 
-                # Converter para Excel com abas separadas
+                # Converter para Excel com abas separadas (mesmas tabelas da tela)
                 output = BytesIO()
                 with pd.ExcelWriter(output, engine='openpyxl') as writer:
                     
                     # Aba 1: Duplicatas por Escola (Detalhado)
                     if len(estudantes_multiplas_escolas) > 0:
-                        duplicatas_escola_download = []
-                        for _, row in estudantes_multiplas_escolas.iterrows():
-                            nome = row['Nome_Estudante']
-                            dados_estudante = df_filt[df_filt['Nome_Estudante'] == nome]
-                            
-                            # Para cada escola do estudante, mostrar a turma correspondente
-                            for _, linha in dados_estudante.iterrows():
-                                duplicatas_escola_download.append({
-                                    'Nome': nome,
-                                    'Escola': linha['Escola'],
-                                    'Turma': linha['Turma'] if 'Turma' in linha else 'N/A',
-                                    'CPF': linha['CPF'] if 'CPF' in linha else 'N/A',
-                                    'Situacao': linha['Situacao'] if 'Situacao' in linha else 'N/A'
-                                })
-                        
-                        df_escola_download = pd.DataFrame(duplicatas_escola_download)
-                        df_escola_download.to_excel(writer, sheet_name='Múltiplas_Escolas', index=False)
+                        duplicados.detalhe_escolas.to_excel(writer, sheet_name='Múltiplas_Escolas', index=False)
                     
                     # Aba 2: Duplicatas por Turma (Detalhado)
                     if len(estudantes_multiplas_turmas) > 0:
-                        duplicatas_turma_download = []
-                        for _, row in estudantes_multiplas_turmas.iterrows():
-                            nome = row['Nome_Estudante']
-                            escola = row['Escola']
-                            dados_estudante = df_filt[(df_filt['Nome_Estudante'] == nome) & 
-                                                    (df_filt['Escola'] == escola)]
-                            
-                            # Para cada turma do estudante na mesma escola
-                            for _, linha in dados_estudante.iterrows():
-                                duplicatas_turma_download.append({
-                                    'Nome': nome,
-                                    'Escola': escola,
-                                    'Turma': linha['Turma'] if 'Turma' in linha else 'N/A',
-                                    'CPF': linha['CPF'] if 'CPF' in linha else 'N/A',
-                                    'Situacao': linha['Situacao'] if 'Situacao' in linha else 'N/A'
-                                })
-                        
-                        df_turma_download = pd.DataFrame(duplicatas_turma_download)
-                        df_turma_download.to_excel(writer, sheet_name='Múltiplas_Turmas', index=False)
+                        duplicados.detalhe_turmas.to_excel(writer, sheet_name='Múltiplas_Turmas', index=False)
                     
                     # Aba 3: Resumo Geral
+                    quantidades = [
+                        len(estudantes_multiplas_escolas),
+                        len(estudantes_multiplas_turmas),
+                        duplicados.total,
+                    ]
                     resumo_geral = pd.DataFrame({
                         'Tipo_Duplicata': ['Múltiplas Escolas', 'Múltiplas Turmas', 'Total'],
-                        'Quantidade': [
-                            len(estudantes_multiplas_escolas),
-                            len(estudantes_multiplas_turmas),
-                            len(estudantes_multiplas_escolas) + len(estudantes_multiplas_turmas)
-                        ],
+                        'Quantidade': quantidades,
                         'Percentual': [
-                            f"{(len(estudantes_multiplas_escolas) / len(df_filt['Nome_Estudante'].unique())) * 100:.1f}%" if len(df_filt['Nome_Estudante'].unique()) > 0 else "0%",
-                            f"{(len(estudantes_multiplas_turmas) / len(df_filt['Nome_Estudante'].unique())) * 100:.1f}%" if len(df_filt['Nome_Estudante'].unique()) > 0 else "0%",
-                            f"{((len(estudantes_multiplas_escolas) + len(estudantes_multiplas_turmas)) / len(df_filt['Nome_Estudante'].unique())) * 100:.1f}%" if len(df_filt['Nome_Estudante'].unique()) > 0 else "0%"
+                            f"{duplicados.percentual(q):.1f}%" if duplicados.total_estudantes > 0 else "0%"
+                            for q in quantidades
                         ]
                     })
                     resumo_geral.to_excel(writer, sheet_name='Resumo', index=False)
@@ -1907,70 +1668,6 @@ def criar_interface_conteudo_aplicado(df):
     else:
         st.info("Nenhum registro encontrado com os filtros aplicados.")
 
-def mapear_bimestre(periodo: str) -> int | None:
-    """Mapeia 'Primeiro Bimestre' -> 1, 'Segundo Bimestre' -> 2, etc."""
-    if not isinstance(periodo, str):
-        return None
-    p = periodo.lower()
-    if "primeiro" in p or "1º" in p or "1o" in p:
-        return 1
-    if "segundo" in p or "2º" in p or "2o" in p:
-        return 2
-    if "terceiro" in p or "3º" in p or "3o" in p:
-        return 3
-    if "quarto" in p or "4º" in p or "4o" in p:
-        return 4
-    return None
-
-def classificar_status_b1_b2(n1, n2, media12):
-    """
-    Regras:
-      - 'Vermelho Duplo': n1<6 e n2<6
-      - 'Queda p/ Vermelho': n1>=6 e n2<6
-      - 'Recuperou': n1<6 e n2>=6
-      - 'Verde': n1>=6 e n2>=6
-      - Se faltar n1 ou n2, retorna 'Incompleto'
-    """
-    if pd.isna(n1) or pd.isna(n2):
-        return "Incompleto"
-    if n1 < MEDIA_APROVACAO and n2 < MEDIA_APROVACAO:
-        return "Vermelho Duplo"
-    if n1 >= MEDIA_APROVACAO and n2 < MEDIA_APROVACAO:
-        return "Queda p/ Vermelho"
-    if n1 < MEDIA_APROVACAO and n2 >= MEDIA_APROVACAO:
-        return "Recuperou"
-    return "Verde"
-
-def classificar_status_b1_b2_b3(n1, n2, n3, media123):
-    """
-    Classificação considerando 3 bimestres:
-      - 'Vermelho Triplo': n1<6, n2<6 e n3<6
-      - 'Vermelho Duplo': duas notas abaixo de 6
-      - 'Queda Recente': n1>=6 e/ou n2>=6, mas n3<6
-      - 'Recuperação': estava abaixo e melhorou no 3º bimestre
-      - 'Verde': todas as notas >= 6
-      - 'Incompleto': falta alguma nota
-    """
-    # Verificar se falta alguma nota
-    if pd.isna(n1) or pd.isna(n2) or pd.isna(n3):
-        return "Incompleto"
-    
-    # Contar quantas notas estão abaixo da média
-    notas_abaixo = sum([n1 < MEDIA_APROVACAO, n2 < MEDIA_APROVACAO, n3 < MEDIA_APROVACAO])
-    
-    if notas_abaixo == 0:
-        return "Verde"  # Todas acima de 6
-    elif notas_abaixo == 3:
-        return "Vermelho Triplo"  # Todas abaixo de 6
-    elif notas_abaixo == 2:
-        return "Vermelho Duplo"  # Duas abaixo de 6
-    else:  # notas_abaixo == 1
-        # Verificar se é queda recente ou recuperação
-        if n3 < MEDIA_APROVACAO:
-            return "Queda Recente"  # Estava bem mas caiu no 3º
-        else:
-            return "Recuperação"  # Estava mal mas melhorou
-
 def criar_excel_formatado(df, nome_planilha="Dados"):
     """
     Cria um arquivo Excel formatado usando pandas (método mais simples e confiável)
@@ -2011,28 +1708,6 @@ def criar_excel_formatado(df, nome_planilha="Dados"):
     output.seek(0)
     return output.getvalue()
 
-def classificar_frequencia_faixa(freq):
-    """Classifica percentual de frequência em faixas de risco."""
-    if pd.isna(freq):
-        return "Sem dados"
-    if freq < 75:
-        return "Reprovado"
-    if freq < 80:
-        return "Alto Risco"
-    if freq < 90:
-        return "Risco Moderado"
-    if freq < 95:
-        return "Ponto de Atenção"
-    return "Meta Favorável"
-
-FAIXAS_FREQUENCIA_ORDEM = [
-    "Reprovado",
-    "Alto Risco",
-    "Risco Moderado",
-    "Ponto de Atenção",
-    "Meta Favorável",
-]
-
 CORES_FAIXAS_FREQUENCIA = {
     "Reprovado": "#dc2626",
     "Alto Risco": "#ea580c",
@@ -2055,18 +1730,9 @@ def frequencia_alunos_anual(df, coluna_aluno):
     """Uma linha por aluno com Frequência Anual consolidada."""
     if "Frequencia Anual" not in df.columns or not coluna_aluno:
         return None
-    freq = df.groupby(coluna_aluno)["Frequencia Anual"].last().reset_index()
+    freq = df.groupby(coluna_aluno, observed=True)["Frequencia Anual"].last().reset_index()
     return freq.rename(columns={"Frequencia Anual": "Frequencia"})
 
-def frequencia_media_alunos_bimestre(df, coluna_aluno, periodo_chave):
-    """Média da coluna Frequencia por aluno em todas as disciplinas do bimestre."""
-    if "Frequencia" not in df.columns or "Periodo" not in df.columns or not coluna_aluno:
-        return None
-    df_bim = df[df["Periodo"].str.contains(periodo_chave, case=False, na=False)]
-    if df_bim.empty:
-        return None
-    return df_bim.groupby(coluna_aluno)["Frequencia"].mean().reset_index()
-
 _PRIORIDADE_CLASSIFICACAO_NOTAS = {
     "Vermelho Triplo": 7,
     "Vermelho Duplo": 6,
@@ -2091,7 +1757,7 @@ def montar_cruzada_alunos_unicos(indic_df, df_filt, coluna_aluno):
         return None
 
     notas_aluno = (
-        indic_df.groupby(coluna_aluno, as_index=False)
+        indic_df.groupby(coluna_aluno, as_index=False, observed=True)
         .agg(
             Classificacao=("Classificacao", pior_classificacao_notas),
             Turma=("Turma", "first"),
@@ -2101,21 +1767,13 @@ def montar_cruzada_alunos_unicos(indic_df, df_filt, coluna_aluno):
     if "Frequencia Anual" in df_filt.columns:
         freq_alunos = frequencia_alunos_anual(df_filt, coluna_aluno)
     elif "Frequencia" in df_filt.columns:
-        freq_alunos = df_filt.groupby(coluna_aluno)["Frequencia"].last().reset_index()
+        freq_alunos = df_filt.groupby(coluna_aluno, observed=True)["Frequencia"].last().reset_index()
     else:
         return notas_aluno.assign(Frequencia=np.nan, Classificacao_Freq="Sem dados")
 
-    freq_alunos["Classificacao_Freq"] = freq_alunos["Frequencia"].apply(classificar_frequencia_faixa)
+    freq_alunos["Classificacao_Freq"] = classificar_frequencia_faixas(freq_alunos["Frequencia"])
     return notas_aluno.merge(freq_alunos, on=coluna_aluno, how="left")
 
-def contagem_frequencia_por_faixa(freq_alunos):
-    """Retorna contagem por faixa e total de alunos (exclui 'Sem dados' do denominador)."""
-    freq_alunos = freq_alunos.copy()
-    freq_alunos["Classificacao_Freq"] = freq_alunos["Frequencia"].apply(classificar_frequencia_faixa)
-    contagem = freq_alunos["Classificacao_Freq"].value_counts()
-    total = int(contagem.sum() - contagem.get("Sem dados", 0))
-    return contagem, total
-
 def medias_notas_turma_por_bimestre(df, bimestres=(1, 2, 3)):
     """
     Retorna (evolucao_por_turma, media_geral_por_bimestre) com média de todas as notas/disciplinas.
@@ -2123,20 +1781,20 @@ def medias_notas_turma_por_bimestre(df, bimestres=(1, 2, 3)):
     if "Nota" not in df.columns or df["Nota"].dropna().empty:
         return None, None
 
-    base = df.copy()
+    base = df
     if "Bimestre" not in base.columns and "Periodo" in base.columns:
-        base["Bimestre"] = base["Periodo"].apply(mapear_bimestre)
+        base = base.assign(Bimestre=mapear_bimestres(base["Periodo"]))
     if "Bimestre" not in base.columns or "Turma" not in base.columns:
         return None, None
 
-    base = base[base["Bimestre"].isin(bimestres) & base["Nota"].notna()].copy()
+    base = base[base["Bimestre"].isin(bimestres) & base["Nota"].notna()]
     if base.empty:
         return None, None
 
     rotulos = {1: "1º Bimestre", 2: "2º Bimestre", 3: "3º Bimestre", 4: "4º Bimestre"}
 
     evolucao = (
-        base.groupby(["Turma", "Bimestre"], as_index=False)["Nota"]
+        base.groupby(["Turma", "Bimestre"], as_index=False, observed=True)["Nota"]
         .mean()
         .rename(columns={"Nota": "Media"})
     )
@@ -2144,7 +1802,7 @@ def medias_notas_turma_por_bimestre(df, bimestres=(1, 2, 3)):
     evolucao["Bimestre_label"] = evolucao["Bimestre"].map(rotulos)
 
     media_geral = (
-        base.groupby("Bimestre", as_index=False)["Nota"]
+        base.groupby("Bimestre", as_index=False, observed=True)["Nota"]
         .mean()
         .rename(columns={"Nota": "Media"})
     )
@@ -2172,7 +1830,7 @@ def montar_top10_melhores_alunos(indic_df, coluna_aluno, col_media_geral, medias
             agg_spec[f"Media_{col}"] = (col, "mean")
             rename_bim[f"Media_{col}"] = rotulo
 
-    medias_aluno = indic_df.groupby([coluna_aluno, "Turma"], as_index=False).agg(**agg_spec)
+    medias_aluno = indic_df.groupby([coluna_aluno, "Turma"], as_index=False, observed=True).agg(**agg_spec)
     medias_aluno = medias_aluno.dropna(subset=["Media_Geral"])
     if medias_aluno.empty:
         st.info(
@@ -2236,96 +1894,57 @@ def renderizar_cards_frequencia_resumo(contagem_freq, total_alunos):
             </div>
             """, unsafe_allow_html=True)
 
-def calcula_indicadores(df):
-    """
-    Cria um dataframe por Aluno-Disciplina com:
-      N1, N2, N3, N4, Media123, Soma123, ReqMediaProx1 (quanto precisa no próximo bimestre para fechar 6 no ano), Classificacao
-    """
-    # Criar coluna Bimestre
-    df = df.copy()
-    df["Bimestre"] = df["Periodo"].apply(mapear_bimestre)
+# Quantas combinações (planilha, filtros) ficam guardadas; as mais antigas saem primeiro
+CACHE_INDICADORES_MAX = 64
 
-    # Pivot por (Aluno, Turma, Disciplina)
-    # Detectar coluna de aluno/estudante
-    coluna_aluno = None
-    for col in ["Aluno", "Nome_Estudante", "Estudante"]:
-        if col in df.columns:
-            coluna_aluno = col
-            break
-    
-    pivot = df.pivot_table(
-        index=["Escola", "Turma", coluna_aluno, "Disciplina"],
-        columns="Bimestre",
-        values="Nota",
-        aggfunc="mean"
-    ).reset_index()
-
-    # Renomear colunas 1..4 para N1..N4 (se existirem)
-    rename_cols = {}
-    for b in [1, 2, 3, 4]:
-        if b in pivot.columns:
-            rename_cols[b] = f"N{b}"
-    pivot = pivot.rename(columns=rename_cols)
-
-    # Obter as notas dos 3 primeiros bimestres
-    n1 = pivot.get("N1", pd.Series([np.nan] * len(pivot)))
-    n2 = pivot.get("N2", pd.Series([np.nan] * len(pivot)))
-    n3 = pivot.get("N3", pd.Series([np.nan] * len(pivot)))
-    
-    # Se não existir a coluna, criar uma série de NaN
-    if isinstance(n1, float):
-        n1 = pd.Series([np.nan] * len(pivot))
-    if isinstance(n2, float):
-        n2 = pd.Series([np.nan] * len(pivot))
-    if isinstance(n3, float):
-        n3 = pd.Series([np.nan] * len(pivot))
-
-    # Garantir que as colunas existam no pivot (evita KeyError em filtros/relatórios)
-    pivot["N1"] = n1
-    pivot["N2"] = n2
-    pivot["N3"] = n3
-    
-    # Calcular métricas dos 3 primeiros bimestres
-    pivot["Soma123"] = n1.fillna(0) + n2.fillna(0) + n3.fillna(0)
-    # Média dos bimestres com nota (ignora NaN — ex.: sem 3º bimestre usa só 1º e 2º)
-    pivot["Media123"] = pd.concat([n1, n2, n3], axis=1).mean(axis=1, skipna=True)
-    
-    # Manter também as métricas antigas para compatibilidade
-    pivot["Soma12"] = n1.fillna(0) + n2.fillna(0)
-    pivot["Media12"] = pd.concat([n1, n2], axis=1).mean(axis=1, skipna=True)
-
-    # Quanto precisa no próximo bimestre (N4) para fechar soma >= 24
-    pivot["PrecisaSomarProx1"] = SOMA_FINAL_ALVO - pivot["Soma123"]
-    pivot["ReqMediaProx1"] = pivot["PrecisaSomarProx1"]
-    
-    # Manter também as métricas antigas para compatibilidade
-    pivot["PrecisaSomarProx2"] = SOMA_FINAL_ALVO - pivot["Soma12"]
-    pivot["ReqMediaProx2"] = pivot["PrecisaSomarProx2"] / 2
-
-    # Classificação com 3 bimestres
-    # Se N3 não existe (None/NaN), marca como Incompleto já que esperamos 3 bimestres
-    pivot["Classificacao"] = [
-        classificar_status_b1_b2_b3(_n1, _n2, _n3, _m123) if pd.notna(_n3) 
-        else "Incompleto"  # Se falta N3, é incompleto
-        for _n1, _n2, _n3, _m123, _m12 in zip(
-            n1,
-            n2,
-            n3,
-            pivot["Media123"],
-            pivot["Media12"]
-        )
-    ]
+@st.cache_resource(show_spinner=False, max_entries=8)
+def indice_filtros_planilha(_df, hash_planilha, coluna_aluno):
+    """Índice dos filtros laterais, montado uma vez por planilha e compartilhado entre sessões."""
+    return IndiceFiltros(_df, coluna_aluno)
 
-    # Flags de alerta
-    # "Corda Bamba": precisa de nota >= 7 no próximo bimestre (ou média >= 7 nos próximos 2)
-    pivot["CordaBamba"] = (pivot["ReqMediaProx1"] >= 7) | (pivot["ReqMediaProx2"] >= 7)
+@st.cache_data(show_spinner=False, max_entries=8)
+def indicadores_planilha(_df, hash_planilha):
+    """
+    Indicadores da planilha inteira, uma linha por (Escola, Turma, Aluno, Disciplina, Status).
+    Calculados uma vez por planilha e guardados no cache em disco junto com os dados.
 
-    # "Alerta": qualquer situação crítica ou Corda Bamba
-    pivot["Alerta"] = pivot["Classificacao"].isin([
-        "Vermelho Triplo", "Vermelho Duplo", "Queda p/ Vermelho", "Queda Recente"
-    ]) | pivot["CordaBamba"]
+    Retorna (indicadores, exato). `exato` é False quando algum aluno-disciplina
+    tem mais de um Status (ou Status vazio): aí filtrar o resultado não equivale
+    a filtrar as linhas, e o pivot precisa ser refeito sobre os dados filtrados.
+    """
+    artefato = f"indicadores_v{VERSAO_INDICADORES}"
+    indic = cache_planilhas.obter(hash_planilha, VERSAO_PROCESSAMENTO, artefato=artefato)
+    if indic is None:
+        indic = calcula_indicadores(_df, por_status=True)
+        cache_planilhas.salvar(hash_planilha, 'notas_frequencia', indic, VERSAO_PROCESSAMENTO,
+                               artefato=artefato)
+
+    return indic, indicadores_exatos(_df, indic)
+
+def filtrar_indicadores(indic_completo, coluna_aluno, filtros):
+    """Aplica os filtros ao quadro de indicadores pré-calculado (mesmo formato de calcula_indicadores)."""
+    indic = indic_completo[mascara_filtros(indic_completo, coluna_aluno, filtros)]
+    if "Status" in indic.columns:
+        indic = indic.drop(columns="Status")
+    return indic.reset_index(drop=True)
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_INDICADORES_MAX)
+def indicadores_por_filtro(_df_filt, hash_planilha, filtros):
+    """
+    calcula_indicadores memoizado por (hash da planilha, filtros normalizados).
+    O DataFrame filtrado não entra no hash: ele é determinado pela chave.
+    """
+    return calcula_indicadores(_df_filt)
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_INDICADORES_MAX)
+def frequencia_por_filtro(_df_filt, coluna_aluno, hash_planilha, filtros):
+    """ResumoFrequencia memoizado com a mesma chave dos indicadores."""
+    return ResumoFrequencia(_df_filt, coluna_aluno)
 
-    return pivot
+@st.cache_data(show_spinner=False, max_entries=CACHE_INDICADORES_MAX)
+def cruzada_por_filtro(_indic_df, _df_filt, coluna_aluno, hash_planilha, filtros):
+    """montar_cruzada_alunos_unicos memoizado com a mesma chave dos indicadores."""
+    return montar_cruzada_alunos_unicos(_indic_df, _df_filt, coluna_aluno)
 
 # -----------------------------
 # Controle de Acesso
@@ -2612,8 +2231,9 @@ st.sidebar.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-escolas = sorted(df["Escola"].dropna().unique().tolist()) if "Escola" in df.columns else []
-status_opcoes = sorted(df["Status"].dropna().unique().tolist()) if "Status" in df.columns else []
+indice_filtros = indice_filtros_planilha(df, df.attrs.get("hash_planilha"), coluna_aluno)
+escolas = indice_filtros.escolas
+status_opcoes = indice_filtros.status
 
 st.sidebar.markdown("""
 <div style="background: linear-gradient(135deg, #d1fae5, #a7f3d0); border-radius: 6px; padding: 8px 12px; margin: 6px 0; box-shadow: 0 1px 4px rgba(5, 150, 105, 0.1); border-left: 3px solid #059669;">
@@ -2647,25 +2267,11 @@ status_sel = st.sidebar.multiselect(
     help="Use os botões acima para seleção rápida"
 )
 
-# Filtrar dados baseado na escola e status selecionados para mostrar opções relevantes
-df_temp = df.copy()
-if escola_sel != "Todas":
-    df_temp = df_temp[df_temp["Escola"] == escola_sel]
-if status_sel:  # Se algum status foi selecionado
-    df_temp = df_temp[df_temp["Status"].isin(status_sel)]
-else:  # Se nenhum status selecionado, mostra todos
-    pass  # Mantém todos os status
-
-turmas = sorted(df_temp["Turma"].dropna().unique().tolist()) if "Turma" in df_temp.columns else []
-disciplinas = sorted(df_temp["Disciplina"].dropna().unique().tolist()) if "Disciplina" in df_temp.columns else []
-# Detectar coluna de aluno/estudante
-coluna_aluno_temp = None
-for col in ["Aluno", "Nome_Estudante", "Estudante"]:
-    if col in df_temp.columns:
-        coluna_aluno_temp = col
-        break
-
-alunos = sorted(df_temp[coluna_aluno_temp].dropna().unique().tolist()) if coluna_aluno_temp else []
+# Opções relevantes para a escola e os status selecionados (índice pré-calculado)
+opcoes_filtros = indice_filtros.opcoes(escola_sel, status_sel)
+turmas = opcoes_filtros.get("Turma", [])
+disciplinas = opcoes_filtros.get("Disciplina", [])
+alunos = opcoes_filtros.get(coluna_aluno, []) if coluna_aluno else []
 
 # Filtros com interface melhorada
 st.sidebar.markdown("""
@@ -2725,24 +2331,11 @@ st.sidebar.markdown("""
 """, unsafe_allow_html=True)
 aluno_sel = st.sidebar.selectbox("Selecione o aluno:", ["Todos"] + alunos, help="Filtre por aluno específico")
 
-df_filt = df.copy()
-if escola_sel != "Todas":
-    df_filt = df_filt[df_filt["Escola"] == escola_sel]
-if status_sel:  # Se algum status foi selecionado
-    df_filt = df_filt[df_filt["Status"].isin(status_sel)]
-else:  # Se nenhum status selecionado, mostra todos
-    pass  # Mantém todos os status
-if turma_sel:  # Se alguma turma foi selecionada
-    df_filt = df_filt[df_filt["Turma"].isin(turma_sel)]
-else:  # Se nenhuma turma selecionada, mostra todas
-    pass  # Mantém todas as turmas
-
-if disc_sel:  # Se alguma disciplina foi selecionada
-    df_filt = df_filt[df_filt["Disciplina"].isin(disc_sel)]
-else:  # Se nenhuma disciplina selecionada, mostra todas
-    pass  # Mantém todas as disciplinas
-if aluno_sel != "Todos":
-    df_filt = df_filt[df_filt[coluna_aluno] == aluno_sel]
+# Todos os filtros numa máscara só; sem filtro ativo df_filt é o próprio df
+filtros_normalizados = normalizar_filtros(escola_sel, status_sel, turma_sel, disc_sel, aluno_sel)
+df_filt = aplicar_filtros(df, coluna_aluno, filtros_normalizados)
+bimestres_filt = coluna_bimestre(df_filt)
+hash_planilha = df.attrs.get("hash_planilha")
 
 # Total de Estudantes Únicos (após filtros)
 st.markdown("""
@@ -2782,29 +2375,31 @@ if "Frequencia Anual" in df_filt.columns or "Frequencia" in df_filt.columns:
     </div>
     """, unsafe_allow_html=True)
 
+    # Frequência consolidada e por bimestre, calculadas juntas e reaproveitadas abaixo
+    resumo_freq = frequencia_por_filtro(df_filt, coluna_aluno, hash_planilha, filtros_normalizados)
+
     # Frequência anual (coluna Frequência Anual da planilha)
-    if "Frequencia Anual" in df_filt.columns:
+    if resumo_freq.tem_anual:
         st.markdown("#### Frequência anual (consolidada)")
         st.caption("Coluna Frequência Anual da planilha — resultado acumulado do ano letivo.")
-        freq_anual = frequencia_alunos_anual(df_filt, coluna_aluno)
-        if freq_anual is not None and not freq_anual.empty:
-            contagem_anual, total_anual = contagem_frequencia_por_faixa(freq_anual)
+        if resumo_freq.consolidada is not None and not resumo_freq.consolidada.empty:
+            contagem_anual, total_anual = resumo_freq.contagem()
             renderizar_cards_frequencia_resumo(contagem_anual, total_anual)
 
     # Frequência por bimestre (média da coluna Frequência por aluno em todas as disciplinas)
     bimestres_freq = [
-        ("Primeiro", "1º Bimestre", "Primeiro Bimestre"),
-        ("Segundo", "2º Bimestre", "Segundo Bimestre"),
-        ("Terceiro", "3º Bimestre", "Terceiro Bimestre"),
+        (1, "1º Bimestre", "Primeiro Bimestre"),
+        (2, "2º Bimestre", "Segundo Bimestre"),
+        (3, "3º Bimestre", "Terceiro Bimestre"),
     ]
-    for chave_periodo, titulo_bim, nome_periodo in bimestres_freq:
+    for bimestre, titulo_bim, nome_periodo in bimestres_freq:
         st.markdown(f"#### {titulo_bim}")
         st.caption(
             f"Média da coluna Frequência por aluno em todas as disciplinas do {nome_periodo}."
         )
-        freq_bim = frequencia_media_alunos_bimestre(df_filt, coluna_aluno, chave_periodo)
+        freq_bim = resumo_freq.bimestre(bimestre)
         if freq_bim is not None and not freq_bim.empty:
-            contagem_bim, total_bim = contagem_frequencia_por_faixa(freq_bim)
+            contagem_bim, total_bim = resumo_freq.contagem(bimestre)
             renderizar_cards_frequencia_resumo(contagem_bim, total_bim)
         else:
             st.info(f"Sem registros de frequência para o {titulo_bim} com os filtros atuais.")
@@ -2812,7 +2407,12 @@ if "Frequencia Anual" in df_filt.columns or "Frequencia" in df_filt.columns:
 # -----------------------------
 # Indicadores e tabelas de risco
 # -----------------------------
-indic = calcula_indicadores(df_filt)
+# Indicadores já calculados para a planilha inteira: os filtros viram uma máscara
+indic_completo, indic_exato = indicadores_planilha(df, hash_planilha)
+if indic_exato:
+    indic = filtrar_indicadores(indic_completo, coluna_aluno, filtros_normalizados)
+else:
+    indic = indicadores_por_filtro(df_filt, hash_planilha, filtros_normalizados)
 
 # KPIs - Análise de Notas Baixas
 st.markdown("""
@@ -2826,27 +2426,29 @@ st.markdown("""
 st.markdown("#### 📉 Total de Notas Abaixo de 6 por Bimestre")
 col1, col2, col3 = st.columns(3)
 
-notas_baixas_b1 = df_filt[df_filt["Periodo"].str.contains("Primeiro", case=False, na=False) & (df_filt["Nota"] < MEDIA_APROVACAO)]
-notas_baixas_b2 = df_filt[df_filt["Periodo"].str.contains("Segundo", case=False, na=False) & (df_filt["Nota"] < MEDIA_APROVACAO)]
-notas_baixas_b3 = df_filt[df_filt["Periodo"].str.contains("Terceiro", case=False, na=False) & (df_filt["Nota"] < MEDIA_APROVACAO)]
+# Notas abaixo da média agregadas uma vez por (Bimestre, Disciplina, Aluno)
+notas_baixas = ResumoNotasBaixas(df_filt, coluna_aluno)
+qtd_notas_baixas_b1 = notas_baixas.qtd_notas(1)
+qtd_notas_baixas_b2 = notas_baixas.qtd_notas(2)
+qtd_notas_baixas_b3 = notas_baixas.qtd_notas(3)
 
 # Número de alunos únicos com notas baixas (não disciplinas)
-alunos_notas_baixas_b1 = notas_baixas_b1[coluna_aluno].nunique() if coluna_aluno in notas_baixas_b1.columns else 0
-alunos_notas_baixas_b2 = notas_baixas_b2[coluna_aluno].nunique() if coluna_aluno in notas_baixas_b2.columns else 0
-alunos_notas_baixas_b3 = notas_baixas_b3[coluna_aluno].nunique() if coluna_aluno in notas_baixas_b3.columns else 0
+alunos_notas_baixas_b1 = notas_baixas.qtd_alunos(1)
+alunos_notas_baixas_b2 = notas_baixas.qtd_alunos(2)
+alunos_notas_baixas_b3 = notas_baixas.qtd_alunos(3)
 
 # Calcular porcentagens baseadas no total de estudantes filtrados
 total_estudantes_para_percent = total_estudantes_filt
 
 with col1:
-    percent_notas_b1 = (len(notas_baixas_b1) / len(df_filt) * 100) if len(df_filt) > 0 else 0
+    percent_notas_b1 = (qtd_notas_baixas_b1 / len(df_filt) * 100) if len(df_filt) > 0 else 0
     st.markdown(f"""
     <div style="background: linear-gradient(135deg, #dbeafe, #bfdbfe); border-radius: 10px; padding: 18px; margin: 5px 0; box-shadow: 0 2px 8px rgba(59, 130, 246, 0.15); border-left: 4px solid #3b82f6;">
         <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px;">
             <div style="font-size: 0.95em; font-weight: 600; color: #1e40af;">Notas < 6 – 1º Bim</div>
             <div style="background: rgba(30, 64, 175, 0.1); border-radius: 50%; width: 25px; height: 25px; display: flex; align-items: center; justify-content: center; font-size: 12px; font-weight: bold; color: #1e40af;">?</div>
         </div>
-        <div style="font-size: 2em; font-weight: 700; color: #1e40af; margin: 8px 0;">{len(notas_baixas_b1)}</div>
+        <div style="font-size: 2em; font-weight: 700; color: #1e40af; margin: 8px 0;">{qtd_notas_baixas_b1}</div>
         <div style="font-size: 1.3em; color: #64748b; font-weight: 600;">({percent_notas_b1:.1f}%)</div>
     </div>
     """, unsafe_allow_html=True)
@@ -2855,14 +2457,14 @@ with col1:
     st.metric("", "", help="Total de notas abaixo de 6 no 1º bimestre. Inclui todas as disciplinas e alunos.")
 
 with col2:
-    percent_notas_b2 = (len(notas_baixas_b2) / len(df_filt) * 100) if len(df_filt) > 0 else 0
+    percent_notas_b2 = (qtd_notas_baixas_b2 / len(df_filt) * 100) if len(df_filt) > 0 else 0
     st.markdown(f"""
     <div style="background: linear-gradient(135deg, #e0f2fe, #b3e5fc); border-radius: 10px; padding: 18px; margin: 5px 0; box-shadow: 0 2px 8px rgba(14, 165, 233, 0.15); border-left: 4px solid #0ea5e9;">
         <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px;">
             <div style="font-size: 0.95em; font-weight: 600; color: #0c4a6e;">Notas < 6 – 2º Bim</div>
             <div style="background: rgba(12, 74, 110, 0.1); border-radius: 50%; width: 25px; height: 25px; display: flex; align-items: center; justify-content: center; font-size: 12px; font-weight: bold; color: #0c4a6e;">?</div>
         </div>
-        <div style="font-size: 2em; font-weight: 700; color: #0c4a6e; margin: 8px 0;">{len(notas_baixas_b2)}</div>
+        <div style="font-size: 2em; font-weight: 700; color: #0c4a6e; margin: 8px 0;">{qtd_notas_baixas_b2}</div>
         <div style="font-size: 1.3em; color: #64748b; font-weight: 600;">({percent_notas_b2:.1f}%)</div>
     </div>
     """, unsafe_allow_html=True)
@@ -2871,14 +2473,14 @@ with col2:
     st.metric("", "", help="Total de notas abaixo de 6 no 2º bimestre. Inclui todas as disciplinas e alunos.")
 
 with col3:
-    percent_notas_b3 = (len(notas_baixas_b3) / len(df_filt) * 100) if len(df_filt) > 0 else 0
+    percent_notas_b3 = (qtd_notas_baixas_b3 / len(df_filt) * 100) if len(df_filt) > 0 else 0
     st.markdown(f"""
     <div style="background: linear-gradient(135deg, #dbeafe, #bfdbfe); border-radius: 10px; padding: 18px; margin: 5px 0; box-shadow: 0 2px 8px rgba(59, 130, 246, 0.15); border-left: 4px solid #3b82f6;">
         <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px;">
             <div style="font-size: 0.95em; font-weight: 600; color: #1e40af;">Notas < 6 – 3º Bim</div>
             <div style="background: rgba(30, 64, 175, 0.1); border-radius: 50%; width: 25px; height: 25px; display: flex; align-items: center; justify-content: center; font-size: 12px; font-weight: bold; color: #1e40af;">?</div>
         </div>
-        <div style="font-size: 2em; font-weight: 700; color: #1e40af; margin: 8px 0;">{len(notas_baixas_b3)}</div>
+        <div style="font-size: 2em; font-weight: 700; color: #1e40af; margin: 8px 0;">{qtd_notas_baixas_b3}</div>
         <div style="font-size: 1.3em; color: #64748b; font-weight: 600;">({percent_notas_b3:.1f}%)</div>
     </div>
     """, unsafe_allow_html=True)
@@ -2958,18 +2560,13 @@ st.markdown(f"""
 
 col7, col8, col9, col10, col11 = st.columns(5)
 
-classificar_frequencia = classificar_frequencia_faixa
-
-# Calcular frequências se a coluna existir
+# Frequência consolidada por aluno (mesmo resumo dos cartões de frequência)
 freq_atual = None
-if "Frequencia Anual" in df_filt.columns:
-    freq_atual = frequencia_alunos_anual(df_filt, coluna_aluno)
-elif "Frequencia" in df_filt.columns:
-    freq_atual = df_filt.groupby(coluna_aluno)["Frequencia"].last().reset_index()
+if "Frequencia Anual" in df_filt.columns or "Frequencia" in df_filt.columns:
+    freq_atual = resumo_freq.consolidada
 
 if freq_atual is not None and not freq_atual.empty:
-    freq_atual["Classificacao_Freq"] = freq_atual["Frequencia"].apply(classificar_frequencia)
-    contagem_freq = freq_atual["Classificacao_Freq"].value_counts()
+    contagem_freq, _ = resumo_freq.contagem()
     with col7:
         st.metric(
             label="< 75% (Reprovado)",
@@ -3033,17 +2630,17 @@ with st.expander(expander_title):
                 return "background-color: #d4edda; color: #155724"
             return "background-color: #e2e3e5; color: #383d41"
 
-        def _faltas_por_periodo(df_base, periodo_chave):
-            if "Falta" not in df_base.columns or "Periodo" not in df_base.columns:
+        def _faltas_por_periodo(df_base, bimestre):
+            if "Falta" not in df_base.columns or not ({"Bimestre", "Periodo"} & set(df_base.columns)):
                 return None
-            base = df_base[df_base["Periodo"].str.contains(periodo_chave, case=False, na=False)]
+            base = df_base[coluna_bimestre(df_base) == bimestre]
             if base.empty:
                 return None
             return (
-                base.groupby([coluna_aluno, "Turma"])["Falta"]
+                base.groupby([coluna_aluno, "Turma"], observed=True)["Falta"]
                 .sum()
                 .reset_index()
-                .rename(columns={"Falta": f"Faltas_{periodo_chave}_Bimestre"})
+                .rename(columns={"Falta": f"Faltas_{NOMES_BIMESTRE[bimestre]}_Bimestre"})
             )
 
         def _render_tabela_frequencia(freq_df, faltas_dfs, titulo, subtitulo, export_key, export_filename, nota_rodape=None):
@@ -3056,7 +2653,7 @@ with st.expander(expander_title):
                 return
 
             tabela = freq_df.copy()
-            tabela["Classificacao_Freq"] = tabela["Frequencia"].apply(classificar_frequencia)
+            tabela["Classificacao_Freq"] = classificar_frequencia_faixas(tabela["Frequencia"])
             tabela["Frequencia_Formatada"] = tabela["Frequencia"].apply(lambda x: f"{x:.1f}%" if pd.notna(x) else "N/A")
 
             # Merge das faltas (quando disponíveis)
@@ -3110,15 +2707,15 @@ with st.expander(expander_title):
         tab_anual, tab_b1, tab_b2, tab_b3 = st.tabs(["Anual", "1º Bimestre", "2º Bimestre", "3º Bimestre"])
 
         # Pré-cálculo de faltas (para reaproveitar nas abas)
-        faltas_b1 = _faltas_por_periodo(df_filt, "Primeiro")
-        faltas_b2 = _faltas_por_periodo(df_filt, "Segundo")
-        faltas_b3 = _faltas_por_periodo(df_filt, "Terceiro")
+        faltas_b1 = _faltas_por_periodo(df_filt, 1)
+        faltas_b2 = _faltas_por_periodo(df_filt, 2)
+        faltas_b3 = _faltas_por_periodo(df_filt, 3)
 
         with tab_anual:
             if "Frequencia Anual" not in df_filt.columns:
                 st.info("A planilha não tem a coluna 'Frequência Anual'.")
             else:
-                freq_anual = df_filt.groupby([coluna_aluno, "Turma"])["Frequencia Anual"].last().reset_index()
+                freq_anual = df_filt.groupby([coluna_aluno, "Turma"], observed=True)["Frequencia Anual"].last().reset_index()
                 freq_anual = freq_anual.rename(columns={"Frequencia Anual": "Frequencia"})
                 _render_tabela_frequencia(
                     freq_anual,
@@ -3131,12 +2728,12 @@ with st.expander(expander_title):
                 )
 
         with tab_b1:
-            freq_b1 = frequencia_media_alunos_bimestre(df_filt, coluna_aluno, "Primeiro")
+            freq_b1 = resumo_freq.bimestre(1)
             if freq_b1 is not None and not freq_b1.empty:
                 # juntar turma (bimestre tem várias linhas por turma; usamos a(s) turma(s) existente(s) no df_filt)
                 turmas = (
-                    df_filt[df_filt["Periodo"].str.contains("Primeiro", case=False, na=False)]
-                    .groupby([coluna_aluno, "Turma"])
+                    df_filt[bimestres_filt == 1]
+                    .groupby([coluna_aluno, "Turma"], observed=True)
                     .size()
                     .reset_index()[[coluna_aluno, "Turma"]]
                 )
@@ -3152,11 +2749,11 @@ with st.expander(expander_title):
             )
 
         with tab_b2:
-            freq_b2 = frequencia_media_alunos_bimestre(df_filt, coluna_aluno, "Segundo")
+            freq_b2 = resumo_freq.bimestre(2)
             if freq_b2 is not None and not freq_b2.empty:
                 turmas = (
-                    df_filt[df_filt["Periodo"].str.contains("Segundo", case=False, na=False)]
-                    .groupby([coluna_aluno, "Turma"])
+                    df_filt[bimestres_filt == 2]
+                    .groupby([coluna_aluno, "Turma"], observed=True)
                     .size()
                     .reset_index()[[coluna_aluno, "Turma"]]
                 )
@@ -3172,11 +2769,11 @@ with st.expander(expander_title):
             )
 
         with tab_b3:
-            freq_b3 = frequencia_media_alunos_bimestre(df_filt, coluna_aluno, "Terceiro")
+            freq_b3 = resumo_freq.bimestre(3)
             if freq_b3 is not None and not freq_b3.empty:
                 turmas = (
-                    df_filt[df_filt["Periodo"].str.contains("Terceiro", case=False, na=False)]
-                    .groupby([coluna_aluno, "Turma"])
+                    df_filt[bimestres_filt == 3]
+                    .groupby([coluna_aluno, "Turma"], observed=True)
                     .size()
                     .reset_index()[[coluna_aluno, "Turma"]]
                 )
@@ -3223,7 +2820,6 @@ st.markdown("""
 cols_visiveis = [coluna_aluno, "Turma", "Disciplina", "N1", "N2", "N3", "Media123", "Classificacao", "ReqMediaProx1", "CordaBamba"]
 # Filtrar alertas excluindo os "Incompleto" (que agora têm seção própria)
 tabela_alerta = (indic[indic["Alerta"] & (indic["Classificacao"] != "Incompleto")]
-                 .copy()
                  .sort_values(["Turma", coluna_aluno, "Disciplina"]))
 for c in ["N1", "N2", "N3", "Media123", "ReqMediaProx1"]:
     if c in tabela_alerta.columns:
@@ -3276,18 +2872,18 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Filtrar apenas os incompletos
-incompletos = indic[indic["Classificacao"] == "Incompleto"].copy()
+incompletos = indic[indic["Classificacao"] == "Incompleto"]
 
 if len(incompletos) > 0:
     # Separar incompletos por bimestres
     # Incompletos do 1º bimestre: falta N1
-    incompletos_b1 = incompletos[pd.isna(incompletos["N1"])].copy()
+    incompletos_b1 = incompletos[pd.isna(incompletos["N1"])]
     
     # Incompletos do 2º bimestre: falta N2
-    incompletos_b2 = incompletos[pd.isna(incompletos["N2"])].copy()
+    incompletos_b2 = incompletos[pd.isna(incompletos["N2"])]
     
     # Incompletos do 3º bimestre: falta N3
-    incompletos_b3 = incompletos[pd.isna(incompletos["N3"])].copy()
+    incompletos_b3 = incompletos[pd.isna(incompletos["N3"])]
     
     # Criar abas para cada bimestre
     tab1, tab2, tab3, tab4 = st.tabs(["📊 Resumo Geral", "1️⃣ 1º Bimestre", "2️⃣ 2º Bimestre", "3️⃣ 3º Bimestre"])
@@ -3593,16 +3189,9 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Calcular estudantes únicos por bimestre
-alunos_notas_baixas_b1_unicos = set()
-alunos_notas_baixas_b2_unicos = set()
-alunos_notas_baixas_b3_unicos = set()
-
-if len(notas_baixas_b1) > 0:
-    alunos_notas_baixas_b1_unicos = set(notas_baixas_b1[coluna_aluno].unique())
-if len(notas_baixas_b2) > 0:
-    alunos_notas_baixas_b2_unicos = set(notas_baixas_b2[coluna_aluno].unique())
-if len(notas_baixas_b3) > 0:
-    alunos_notas_baixas_b3_unicos = set(notas_baixas_b3[coluna_aluno].unique())
+alunos_notas_baixas_b1_unicos = notas_baixas.alunos(1)
+alunos_notas_baixas_b2_unicos = notas_baixas.alunos(2)
+alunos_notas_baixas_b3_unicos = notas_baixas.alunos(3)
 
 alunos_incompletos_b1_unicos = set()
 alunos_incompletos_b2_unicos = set()
@@ -3925,7 +3514,7 @@ else:
     # Ranking em barras (média dos 3 bimestres) — visão complementar
     with st.expander("📊 Ranking das turmas — média nos 3 bimestres (da melhor para a pior)"):
         media_3bim = (
-            evolucao_turmas.groupby("Turma", as_index=False)["Media"]
+            evolucao_turmas.groupby("Turma", as_index=False, observed=True)["Media"]
             .mean()
             .rename(columns={"Media": "Media_notas"})
         )
@@ -3956,14 +3545,9 @@ st.markdown("### 📊 Gráficos de Notas Abaixo da Média por Disciplina")
 
 # Gráfico Geral (1º + 2º + 3º Bimestre)
 with st.expander("📈 Geral - Notas Abaixo da Média por Disciplina (1º + 2º + 3º Bimestre)"):
-    base_baixas = pd.concat([notas_baixas_b1, notas_baixas_b2, notas_baixas_b3], ignore_index=True)
-    if len(base_baixas) > 0:
-        # Contar notas por disciplina
-        contagem = base_baixas.groupby("Disciplina")["Nota"].count().reset_index()
-        contagem = contagem.rename(columns={"Nota": "Qtd Notas < 6"})
-        
-        # Ordenar em ordem decrescente (maior para menor)
-        contagem = contagem.sort_values("Qtd Notas < 6", ascending=False).reset_index(drop=True)
+    if qtd_notas_baixas_b1 + qtd_notas_baixas_b2 + qtd_notas_baixas_b3 > 0:
+        # Notas por disciplina, em ordem decrescente (maior para menor)
+        contagem = notas_baixas.por_disciplina((1, 2, 3))
         
         # Adicionar coluna de cores intercaladas baseada na posição após ordenação
         contagem['Cor'] = ['#1e40af' if i % 2 == 0 else '#059669' for i in range(len(contagem))]
@@ -4008,13 +3592,9 @@ col_graf1, col_graf2, col_graf3 = st.columns(3)
 # Gráfico 1º Bimestre
 with col_graf1:
     with st.expander("📊 1º Bimestre - Notas Abaixo da Média por Disciplina"):
-        if len(notas_baixas_b1) > 0:
-            # Contar notas por disciplina no 1º bimestre
-            contagem_b1 = notas_baixas_b1.groupby("Disciplina")["Nota"].count().reset_index()
-            contagem_b1 = contagem_b1.rename(columns={"Nota": "Qtd Notas < 6"})
-            
-            # Ordenar em ordem decrescente (maior para menor)
-            contagem_b1 = contagem_b1.sort_values("Qtd Notas < 6", ascending=False).reset_index(drop=True)
+        if qtd_notas_baixas_b1 > 0:
+            # Notas por disciplina no 1º bimestre, em ordem decrescente (maior para menor)
+            contagem_b1 = notas_baixas.por_disciplina(1)
             
             # Adicionar coluna de cores intercaladas baseada na posição após ordenação
             contagem_b1['Cor'] = ['#dc2626' if i % 2 == 0 else '#ea580c' for i in range(len(contagem_b1))]
@@ -4054,13 +3634,9 @@ with col_graf1:
 # Gráfico 2º Bimestre
 with col_graf2:
     with st.expander("📊 2º Bimestre - Notas Abaixo da Média por Disciplina"):
-        if len(notas_baixas_b2) > 0:
-            # Contar notas por disciplina no 2º bimestre
-            contagem_b2 = notas_baixas_b2.groupby("Disciplina")["Nota"].count().reset_index()
-            contagem_b2 = contagem_b2.rename(columns={"Nota": "Qtd Notas < 6"})
-            
-            # Ordenar em ordem decrescente (maior para menor)
-            contagem_b2 = contagem_b2.sort_values("Qtd Notas < 6", ascending=False).reset_index(drop=True)
+        if qtd_notas_baixas_b2 > 0:
+            # Notas por disciplina no 2º bimestre, em ordem decrescente (maior para menor)
+            contagem_b2 = notas_baixas.por_disciplina(2)
             
             # Adicionar coluna de cores intercaladas baseada na posição após ordenação
             contagem_b2['Cor'] = ['#7c3aed' if i % 2 == 0 else '#a855f7' for i in range(len(contagem_b2))]
@@ -4100,13 +3676,9 @@ with col_graf2:
 # Gráfico 3º Bimestre
 with col_graf3:
     with st.expander("📊 3º Bimestre - Notas Abaixo da Média por Disciplina"):
-        if len(notas_baixas_b3) > 0:
-            # Contar notas por disciplina no 3º bimestre
-            contagem_b3 = notas_baixas_b3.groupby("Disciplina")["Nota"].count().reset_index()
-            contagem_b3 = contagem_b3.rename(columns={"Nota": "Qtd Notas < 6"})
-            
-            # Ordenar em ordem decrescente (maior para menor)
-            contagem_b3 = contagem_b3.sort_values("Qtd Notas < 6", ascending=False).reset_index(drop=True)
+        if qtd_notas_baixas_b3 > 0:
+            # Notas por disciplina no 3º bimestre, em ordem decrescente (maior para menor)
+            contagem_b3 = notas_baixas.por_disciplina(3)
             
             # Adicionar coluna de cores intercaladas baseada na posição após ordenação
             contagem_b3['Cor'] = ['#3b82f6' if i % 2 == 0 else '#60a5fa' for i in range(len(contagem_b3))]
@@ -4153,7 +3725,7 @@ col_pizza1, col_pizza2, col_pizza3 = st.columns(3)
 # 1º Bimestre
 with col_pizza1:
     st.markdown("#### 1º Bimestre")
-    total_alunos_b1 = df_filt[df_filt["Periodo"].str.contains("Primeiro", case=False, na=False)][coluna_aluno].nunique()
+    total_alunos_b1 = df_filt[bimestres_filt == 1][coluna_aluno].nunique()
     aprovados_b1 = total_alunos_b1 - alunos_notas_baixas_b1
     
     if total_alunos_b1 > 0:
@@ -4180,7 +3752,7 @@ with col_pizza1:
 # 2º Bimestre
 with col_pizza2:
     st.markdown("#### 2º Bimestre")
-    total_alunos_b2 = df_filt[df_filt["Periodo"].str.contains("Segundo", case=False, na=False)][coluna_aluno].nunique()
+    total_alunos_b2 = df_filt[bimestres_filt == 2][coluna_aluno].nunique()
     aprovados_b2 = total_alunos_b2 - alunos_notas_baixas_b2
     
     if total_alunos_b2 > 0:
@@ -4207,7 +3779,7 @@ with col_pizza2:
 # 3º Bimestre
 with col_pizza3:
     st.markdown("#### 3º Bimestre")
-    total_alunos_b3 = df_filt[df_filt["Periodo"].str.contains("Terceiro", case=False, na=False)][coluna_aluno].nunique()
+    total_alunos_b3 = df_filt[bimestres_filt == 3][coluna_aluno].nunique()
     aprovados_b3 = total_alunos_b3 - alunos_notas_baixas_b3
     
     if total_alunos_b3 > 0:
@@ -4238,17 +3810,8 @@ col_graf1, col_graf2 = st.columns(2)
 with col_graf2:
     with st.expander("Distribuição de Frequência por Faixas"):
         if "Frequencia Anual" in df_filt.columns or "Frequencia" in df_filt.columns:
-            # Usar os mesmos dados do Resumo de Frequência
-            if "Frequencia Anual" in df_filt.columns:
-                # Aluno único (sem duplicar por turma/disciplinas)
-                freq_geral = df_filt.groupby(coluna_aluno)["Frequencia Anual"].last().reset_index()
-                freq_geral = freq_geral.rename(columns={"Frequencia Anual": "Frequencia"})
-            else:
-                # Aluno único (sem duplicar por turma/disciplinas)
-                freq_geral = df_filt.groupby(coluna_aluno)["Frequencia"].last().reset_index()
-            
-            freq_geral["Classificacao_Freq"] = freq_geral["Frequencia"].apply(classificar_frequencia_faixa)
-            contagem_freq_geral = freq_geral["Classificacao_Freq"].value_counts()
+            # Usar os mesmos dados do Resumo de Frequência (aluno único, sem duplicar por turma/disciplinas)
+            contagem_freq_geral, _ = resumo_freq.contagem()
 
             # Gráfico com todas as faixas (inclui 0 para faixas sem alunos)
             df_grafico = dataframe_frequencia_todas_faixas(contagem_freq_geral)
@@ -4324,14 +3887,16 @@ st.markdown("""
 
 with st.expander("Análise Cruzada: Notas x Frequência"):
     if ("Frequencia Anual" in df_filt.columns or "Frequencia" in df_filt.columns) and len(indic) > 0:
-        cruzada_alunos = montar_cruzada_alunos_unicos(indic, df_filt, coluna_aluno)
+        cruzada_alunos = cruzada_por_filtro(indic, df_filt, coluna_aluno, hash_planilha, filtros_normalizados)
 
         if cruzada_alunos is not None and not cruzada_alunos.empty:
             matriz_cruzada = (
-                cruzada_alunos.groupby(["Classificacao", "Classificacao_Freq"])
+                cruzada_alunos.groupby(["Classificacao", "Classificacao_Freq"], observed=True)
                 .size()
                 .unstack(fill_value=0)
             )
+            # Colunas na ordem das faixas (índice simples, sem o categórico)
+            matriz_cruzada.columns = pd.Index(list(matriz_cruzada.columns), name="Classificacao_Freq")
         else:
             matriz_cruzada = pd.DataFrame()
         
@@ -4447,6 +4012,9 @@ with st.expander("Análise Cruzada: Notas x Frequência"):
     else:
         st.info("Dados de frequência ou notas não disponíveis para análise cruzada.")
 
+# Alunos em múltiplas turmas: usado pela exportação completa e pela seção de duplicados
+multiplas_turmas = AlunosMultiplasTurmas(df_filt, coluna_aluno)
+
 # Botão para baixar todas as planilhas em uma única planilha Excel
 st.markdown("---")
 st.markdown("""
@@ -4474,12 +4042,12 @@ with col_export_all1:
             # Aba 3: Análise de Frequência (se disponível)
             if "Frequencia Anual" in df_filt.columns or "Frequencia" in df_filt.columns:
                 if "Frequencia Anual" in df_filt.columns:
-                    freq_detalhada = df_filt.groupby([coluna_aluno, "Turma"])["Frequencia Anual"].last().reset_index()
+                    freq_detalhada = df_filt.groupby([coluna_aluno, "Turma"], observed=True)["Frequencia Anual"].last().reset_index()
                     freq_detalhada = freq_detalhada.rename(columns={"Frequencia Anual": "Frequencia"})
                 else:
-                    freq_detalhada = df_filt.groupby([coluna_aluno, "Turma"])["Frequencia"].last().reset_index()
+                    freq_detalhada = df_filt.groupby([coluna_aluno, "Turma"], observed=True)["Frequencia"].last().reset_index()
                 
-                freq_detalhada["Classificacao_Freq"] = freq_detalhada["Frequencia"].apply(classificar_frequencia)
+                freq_detalhada["Classificacao_Freq"] = classificar_frequencia_faixas(freq_detalhada["Frequencia"])
                 freq_detalhada["Frequencia_Formatada"] = freq_detalhada["Frequencia"].apply(
                     lambda x: f"{x:.1f}%" if pd.notna(x) else "N/A"
                 )
@@ -4487,23 +4055,14 @@ with col_export_all1:
                     writer, sheet_name="Analise_Frequencia", index=False)
             
             # Aba 4: Notas por Disciplina (se houver dados)
-            base_baixas = pd.concat([notas_baixas_b1, notas_baixas_b2], ignore_index=True)
-            if len(base_baixas) > 0:
-                contagem = base_baixas.groupby("Disciplina")["Nota"].count().reset_index()
-                contagem = contagem.rename(columns={"Nota": "Quantidade_Notas_Abaixo_6"})
-                contagem = contagem.sort_values("Quantidade_Notas_Abaixo_6", ascending=False).reset_index(drop=True)
+            if qtd_notas_baixas_b1 + qtd_notas_baixas_b2 > 0:
+                contagem = notas_baixas.por_disciplina((1, 2))
+                contagem = contagem.rename(columns={ResumoNotasBaixas.COLUNA_QTD: "Quantidade_Notas_Abaixo_6"})
                 contagem.to_excel(writer, sheet_name="Notas_Por_Disciplina", index=False)
             
             # Aba 5: Frequência por Faixas (se disponível)
             if "Frequencia Anual" in df_filt.columns or "Frequencia" in df_filt.columns:
-                if "Frequencia Anual" in df_filt.columns:
-                    freq_geral = df_filt.groupby(coluna_aluno)["Frequencia Anual"].last().reset_index()
-                    freq_geral = freq_geral.rename(columns={"Frequencia Anual": "Frequencia"})
-                else:
-                    freq_geral = df_filt.groupby(coluna_aluno)["Frequencia"].last().reset_index()
-                
-                freq_geral["Classificacao_Freq"] = freq_geral["Frequencia"].apply(classificar_frequencia_faixa)
-                contagem_freq_geral = freq_geral["Classificacao_Freq"].value_counts()
+                contagem_freq_geral, _ = resumo_freq.contagem()
                 df_grafico_exp = dataframe_frequencia_todas_faixas(contagem_freq_geral).rename(
                     columns={"Quantidade": "Numero_Alunos"}
                 )
@@ -4512,7 +4071,7 @@ with col_export_all1:
             
             # Aba 6: Cruzamento Notas x Frequência (alunos únicos)
             if ("Frequencia Anual" in df_filt.columns or "Frequencia" in df_filt.columns) and len(indic) > 0:
-                cruzada_export = montar_cruzada_alunos_unicos(indic, df_filt, coluna_aluno)
+                cruzada_export = cruzada_por_filtro(indic, df_filt, coluna_aluno, hash_planilha, filtros_normalizados)
                 if cruzada_export is not None and not cruzada_export.empty:
                     freq_baixa_export = cruzada_export[cruzada_export["Frequencia"] < 95].copy()
                     if len(freq_baixa_export) > 0:
@@ -4525,39 +4084,9 @@ with col_export_all1:
                         freq_baixa_display.to_excel(writer, sheet_name="Cruzamento_Notas_Freq", index=False)
             
             # Aba 7: Alunos Duplicados (se houver)
-            alunos_turmas = df_filt.groupby(coluna_aluno)["Turma"].nunique().reset_index()
-            alunos_turmas = alunos_turmas.rename(columns={"Turma": "Qtd_Turmas"})
-            alunos_duplicados = alunos_turmas[alunos_turmas["Qtd_Turmas"] > 1].copy()
-            
-            if len(alunos_duplicados) > 0:
-                # Criar formato com colunas separadas para cada turma
-                export_data = []
-                for _, row in alunos_duplicados.iterrows():
-                    aluno = row[coluna_aluno]
-                    qtd_turmas = row["Qtd_Turmas"]
-                    turmas_aluno = df_filt[df_filt[coluna_aluno] == aluno]["Turma"].unique().tolist()
-                    turmas_aluno = sorted(turmas_aluno)
-                    
-                    # Criar linha com colunas separadas
-                    linha = {
-                        coluna_aluno: aluno,
-                        "Qtd_Turmas": qtd_turmas
-                    }
-                    
-                    # Adicionar cada turma em uma coluna separada
-                    for i, turma in enumerate(turmas_aluno, 1):
-                        linha[f"Turma_{i}"] = turma
-                    
-                    # Preencher colunas vazias com None para alunos com menos turmas
-                    max_turmas = alunos_duplicados["Qtd_Turmas"].max()
-                    for i in range(len(turmas_aluno) + 1, max_turmas + 1):
-                        linha[f"Turma_{i}"] = None
-                    
-                    export_data.append(linha)
-                
-                df_export = pd.DataFrame(export_data)
-                df_export = df_export.sort_values(["Qtd_Turmas", coluna_aluno], ascending=[False, True])
-                df_export.to_excel(writer, sheet_name="Alunos_Duplicados", index=False)
+            if len(multiplas_turmas) > 0:
+                # Formato com colunas separadas para cada turma
+                multiplas_turmas.tabela_larga().to_excel(writer, sheet_name="Alunos_Duplicados", index=False)
         
         output.seek(0)
         st.download_button(
@@ -4576,33 +4105,9 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-# Identificar alunos em múltiplas turmas
-alunos_turmas = df_filt.groupby(coluna_aluno)["Turma"].nunique().reset_index()
-alunos_turmas = alunos_turmas.rename(columns={"Turma": "Qtd_Turmas"})
-
-# Filtrar apenas alunos com mais de uma turma
-alunos_duplicados = alunos_turmas[alunos_turmas["Qtd_Turmas"] > 1].copy()
-
-if len(alunos_duplicados) > 0:
-    # Criar dataframe detalhado com todas as turmas de cada aluno duplicado
-    alunos_detalhados = []
-    
-    for _, row in alunos_duplicados.iterrows():
-        aluno = row[coluna_aluno]
-        qtd_turmas = row["Qtd_Turmas"]
-        
-        # Obter todas as turmas deste aluno
-        turmas_aluno = df_filt[df_filt[coluna_aluno] == aluno]["Turma"].unique().tolist()
-        turmas_str = ", ".join(sorted(turmas_aluno))
-        
-        alunos_detalhados.append({
-            coluna_aluno: aluno,
-            "Qtd_Turmas": qtd_turmas,
-            "Turmas": turmas_str
-        })
-    
-    df_alunos_duplicados = pd.DataFrame(alunos_detalhados)
-    df_alunos_duplicados = df_alunos_duplicados.sort_values(["Qtd_Turmas", coluna_aluno], ascending=[False, True])
+# Alunos em múltiplas turmas (turmas de cada aluno em ordem alfabética)
+if len(multiplas_turmas) > 0:
+    df_alunos_duplicados = multiplas_turmas.resumo
     
     # Função para colorir quantidade de turmas
     def color_qtd_turmas(val):
@@ -4651,32 +4156,8 @@ if len(alunos_duplicados) > 0:
     col_export_dup1, col_export_dup2 = st.columns([1, 4])
     with col_export_dup1:
         if st.button("📊 Exportar Duplicados", key="export_duplicados", help="Baixar planilha com alunos em múltiplas turmas"):
-            # Criar formato com colunas separadas para cada turma
-            export_data = []
-            for _, row in df_alunos_duplicados.iterrows():
-                aluno = row[coluna_aluno]
-                qtd_turmas = row["Qtd_Turmas"]
-                turmas_aluno = df_filt[df_filt[coluna_aluno] == aluno]["Turma"].unique().tolist()
-                turmas_aluno = sorted(turmas_aluno)
-                
-                # Criar linha com colunas separadas
-                linha = {
-                    coluna_aluno: aluno,
-                    "Qtd_Turmas": qtd_turmas
-                }
-                
-                # Adicionar cada turma em uma coluna separada
-                for i, turma in enumerate(turmas_aluno, 1):
-                    linha[f"Turma_{i}"] = turma
-                
-                # Preencher colunas vazias com None para alunos com menos turmas
-                max_turmas = df_alunos_duplicados["Qtd_Turmas"].max()
-                for i in range(len(turmas_aluno) + 1, max_turmas + 1):
-                    linha[f"Turma_{i}"] = None
-                
-                export_data.append(linha)
-            
-            df_export = pd.DataFrame(export_data)
+            # Formato com colunas separadas para cada turma
+            df_export = multiplas_turmas.tabela_larga()
             excel_data = criar_excel_formatado(df_export, "Alunos_Duplicados")
             st.download_button(
                 label="Baixar Excel",
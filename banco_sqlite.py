@@ -0,0 +1,40 @@
+"""
+Conexões SQLite compartilhadas pelas bases locais do painel (usuários, códigos de login)
+"""
+import sqlite3
+from contextlib import contextmanager
+
+
+def conectar(caminho: str) -> sqlite3.Connection:
+    """Conexão em autocommit (transações explícitas) com linhas acessíveis por nome."""
+    conexao = sqlite3.connect(caminho, timeout=30, isolation_level=None)
+    conexao.row_factory = sqlite3.Row
+    # Em WAL, NORMAL continua íntegro após queda; só o último commit pode se perder
+    conexao.execute("PRAGMA synchronous=NORMAL")
+    return conexao
+
+
+def criar_tabelas(caminho: str, esquema: str):
+    """Aplica o esquema (CREATE ... IF NOT EXISTS) com o journal em WAL."""
+    conexao = conectar(caminho)
+    try:
+        conexao.execute("PRAGMA journal_mode=WAL")
+        conexao.executescript(esquema)
+    finally:
+        conexao.close()
+
+
+@contextmanager
+def transacao(caminho: str):
+    """Transação de escrita (BEGIN IMMEDIATE: um escritor por vez, leitores seguem no WAL)."""
+    conexao = conectar(caminho)
+    try:
+        conexao.execute("BEGIN IMMEDIATE")
+        try:
+            yield conexao
+        except BaseException:
+            conexao.execute("ROLLBACK")
+            raise
+        conexao.execute("COMMIT")
+    finally:
+        conexao.close()
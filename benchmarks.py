@@ -0,0 +1,398 @@
+"""
+Benchmarks das rotinas de cálculo do painel (paridade + tempo)
+
+Uso:
+    python benchmarks.py              # todos
+    python benchmarks.py classificacao
+    python benchmarks.py duplicados
+    python benchmarks.py codigos
+    python benchmarks.py email        # requer aiosmtpd (servidor SMTP local)
+    python benchmarks.py firebase     # Firebase falso com latência e queda
+    python benchmarks.py sincronizacao
+"""
+import json
+import os
+import smtplib
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    from aiosmtpd.controller import Controller
+    AIOSMTPD_AVAILABLE = True
+except ImportError:
+    AIOSMTPD_AVAILABLE = False
+
+from banco_sqlite import transacao
+from codigos_login import CodigosLogin
+from duplicados import AlunosMultiplasTurmas
+import fila_email
+from fila_email import FilaEmail, montar_mensagem
+from fila_firebase import FilaFirebase, sincronizar
+from indicadores import (
+    classificar_frequencia_faixa,
+    classificar_frequencia_faixas,
+    classificar_status_b1_b2,
+    classificar_status_b1_b2_b3,
+    classificar_status_b1_b2_vetorizado,
+    classificar_status_b1_b2_b3_vetorizado,
+)
+from indice_acessos import IndiceAcessos
+from log_acessos import LogAcessos
+
+
+def _cronometrar(func, repeticoes=3):
+    """Melhor tempo (s) entre as repetições e o resultado da última."""
+    melhor = float("inf")
+    resultado = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = func()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+
+def _notas_aleatorias(rng, n):
+    """Notas de 0 a 10 com uma casa, ~10% faltando e muitos valores exatamente 6."""
+    notas = np.round(rng.uniform(0, 10, n), 1)
+    notas[rng.random(n) < 0.15] = 6.0
+    notas[rng.random(n) < 0.10] = np.nan
+    return notas
+
+
+def _relatorio(nome, t_antes, t_depois, iguais):
+    print(f"   {nome}")
+    print(f"      por linha:   {t_antes * 1000:10.1f} ms")
+    print(f"      vetorizado:  {t_depois * 1000:10.1f} ms   ({t_antes / t_depois:.0f}x)")
+    print(f"      paridade:    {'OK' if iguais else 'DIFERENTE'}")
+    return iguais
+
+
+def benchmark_classificacao(n=300_000):
+    rng = np.random.default_rng(42)
+    n1, n2, n3 = (_notas_aleatorias(rng, n) for _ in range(3))
+
+    t_antes, esperado = _cronometrar(lambda: [
+        classificar_status_b1_b2_b3(a, b, c, None) for a, b, c in zip(n1, n2, n3)
+    ], repeticoes=1)
+    t_depois, obtido = _cronometrar(lambda: classificar_status_b1_b2_b3_vetorizado(n1, n2, n3))
+    ok3 = _relatorio("classificar_status_b1_b2_b3", t_antes, t_depois, list(obtido) == esperado)
+
+    t_antes, esperado = _cronometrar(lambda: [
+        classificar_status_b1_b2(a, b, None) for a, b in zip(n1, n2)
+    ], repeticoes=1)
+    t_depois, obtido = _cronometrar(lambda: classificar_status_b1_b2_vetorizado(n1, n2))
+    ok2 = _relatorio("classificar_status_b1_b2", t_antes, t_depois, list(obtido) == esperado)
+
+    contagem = pd.Series(obtido).value_counts()
+    print(f"      rótulos:     { {k: int(v) for k, v in contagem.items()} }")
+    return ok3 and ok2
+
+
+def benchmark_frequencia(n=300_000):
+    rng = np.random.default_rng(7)
+    freq = pd.Series(np.round(rng.uniform(50, 100, n), 1))
+    # Valores exatamente nos limites das faixas e sem dados
+    limites = rng.random(n) < 0.05
+    freq[limites] = rng.choice([75.0, 80.0, 90.0, 95.0], limites.sum())
+    freq[rng.random(n) < 0.05] = np.nan
+
+    t_antes, esperado = _cronometrar(lambda: freq.apply(classificar_frequencia_faixa), repeticoes=1)
+    t_depois, obtido = _cronometrar(lambda: classificar_frequencia_faixas(freq))
+    return _relatorio(
+        "classificar_frequencia_faixa", t_antes, t_depois, obtido.astype(object).tolist() == esperado.tolist()
+    )
+
+
+def _turmas_por_aluno_por_linha(df, coluna_aluno, alunos):
+    """Versão anterior: filtra o DataFrame inteiro para cada aluno duplicado."""
+    return {
+        aluno: ", ".join(sorted(df[df[coluna_aluno] == aluno]["Turma"].unique().tolist()))
+        for aluno in alunos
+    }
+
+
+def benchmark_duplicados(n_alunos=100_000, linhas_por_aluno=6, amostra=200):
+    rng = np.random.default_rng(11)
+    alunos = np.repeat(np.arange(n_alunos), linhas_por_aluno)
+    turmas = np.repeat(rng.integers(0, 400, n_alunos), linhas_por_aluno)
+    # ~10% das linhas em outra turma: alunos em 2 ou mais turmas
+    trocadas = rng.random(len(turmas)) < 0.10
+    turmas[trocadas] = rng.integers(0, 400, trocadas.sum())
+    df = pd.DataFrame({
+        "Aluno": pd.Categorical([f"Aluno {i:06d}" for i in alunos]),
+        "Turma": pd.Categorical([f"Turma {t:03d}" for t in turmas]),
+    })
+
+    def vetorizado():
+        resultado = AlunosMultiplasTurmas(df, "Aluno")
+        resultado.tabela_larga()
+        return resultado
+
+    t_depois, resultado = _cronometrar(vetorizado)
+    # A versão por linha é O(duplicados x linhas): mede uma amostra e extrapola
+    nomes = resultado.resumo["Aluno"].head(amostra).tolist()
+    t_amostra, esperado = _cronometrar(lambda: _turmas_por_aluno_por_linha(df, "Aluno", nomes), repeticoes=1)
+    t_antes = t_amostra * len(resultado) / max(len(nomes), 1)
+
+    obtido = dict(zip(nomes, resultado.resumo["Turmas"].head(amostra)))
+    print(f"   {n_alunos:,} alunos, {len(df):,} linhas, {len(resultado):,} em mais de uma turma")
+    print(f"      (por linha estimado a partir de {len(nomes)} alunos)")
+    return _relatorio("alunos em múltiplas turmas", t_antes, t_depois, obtido == esperado)
+
+
+def _salvar_codigo_json(caminho, email, codigo, expira_em):
+    """Versão anterior: lê o JSON inteiro, troca uma chave e regrava o arquivo."""
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            codigos = json.load(f)
+    except Exception:
+        codigos = {}
+    codigos[email] = {"code": codigo, "expires_at": expira_em}
+    try:
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump(codigos, f, indent=2, ensure_ascii=False)
+    except Exception:
+        pass
+
+
+def benchmark_codigos(n_pedidos=2_000, n_vencidos=5_000, threads=16):
+    """Pedidos simultâneos de código (início do turno): tempo e códigos perdidos."""
+    emails = [f"professor{i:05d}@escola.gov.br" for i in range(n_pedidos)]
+    vencidos = {f"antigo{i:05d}@escola.gov.br": "000000" for i in range(n_vencidos)}
+    with tempfile.TemporaryDirectory() as pasta:
+        arquivo = os.path.join(pasta, "codigos_login.json")
+        with open(arquivo, "w", encoding="utf-8") as f:
+            json.dump({e: {"code": c, "expires_at": 0} for e, c in vencidos.items()}, f)
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(threads) as executor:
+            list(executor.map(lambda e: _salvar_codigo_json(arquivo, e, "123456", time.time() + 1800), emails))
+        t_antes = time.perf_counter() - inicio
+        try:
+            with open(arquivo, "r", encoding="utf-8") as f:
+                perdidos_antes = n_pedidos - len(set(json.load(f)) & set(emails))
+        except ValueError:
+            perdidos_antes = n_pedidos
+
+        banco = CodigosLogin(os.path.join(pasta, "codigos_login.db"))
+        banco.limpar_expirados()  # cria a tabela
+        with transacao(banco.caminho) as conexao:
+            conexao.executemany(
+                "INSERT INTO codigos (email, codigo, expira_em) VALUES (?, ?, 0)", vencidos.items()
+            )
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(threads) as executor:
+            list(executor.map(lambda e: banco.salvar(e, "123456", 30), emails))
+        t_depois = time.perf_counter() - inicio
+        # A limpeza periódica do primeiro pedido já tirou os vencidos pelo índice
+        restantes = banco.limpar_expirados()
+        perdidos_depois = n_pedidos - len(banco)
+        # Dois logins com o mesmo código ao mesmo tempo: só um pode entrar
+        with ThreadPoolExecutor(threads) as executor:
+            aceitos = sum(executor.map(lambda e: banco.consumir(e, "123456"), emails + emails))
+
+    print(f"   {n_pedidos:,} pedidos em {threads} threads, {n_vencidos:,} códigos vencidos no arquivo")
+    print(f"      JSON inteiro: {t_antes * 1000:10.1f} ms   códigos perdidos: {perdidos_antes:,}")
+    print(f"      SQLite:       {t_depois * 1000:10.1f} ms   códigos perdidos: {perdidos_depois:,}")
+    print(f"      vencidos restantes: {restantes:,}   códigos aceitos (2 tentativas cada): {aceitos:,}")
+    return perdidos_depois == 0 and restantes == 0 and aceitos == n_pedidos
+
+
+class _CaixaSMTP:
+    """Servidor SMTP local (aiosmtpd) que só conta mensagens e conexões."""
+
+    def __init__(self):
+        self.mensagens = 0
+        self.conexoes = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.conexoes += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.mensagens += 1
+        return "250 OK"
+
+
+def benchmark_email(n_emails=300, porta=8025):
+    """Envio de relatórios: uma conexão por e-mail (versão anterior) x fila com sessão reaproveitada."""
+    if not AIOSMTPD_AVAILABLE:
+        print("   aiosmtpd não instalado (pip install aiosmtpd): benchmark ignorado")
+        return True
+    caixa = _CaixaSMTP()
+    servidor = Controller(caixa, hostname="127.0.0.1", port=porta)
+    servidor.start()
+    ambiente = {"SMTP_HOST": "127.0.0.1", "SMTP_PORT": str(porta), "SMTP_STARTTLS": "0"}
+    anterior = {chave: os.environ.get(chave) for chave in ambiente}
+    os.environ.update(ambiente)
+    destinatarios = [f"escola{i:04d}@seduc.gov.br" for i in range(n_emails)]
+    log_anterior = fila_email.EMAIL_LOG_FILE
+    try:
+        def uma_conexao_por_email():
+            for destinatario in destinatarios:
+                msg = montar_mensagem("painel@localhost", destinatario, "Relatório", "corpo", b"xlsx", "r.xlsx")
+                smtp = smtplib.SMTP("127.0.0.1", porta)
+                smtp.ehlo()
+                smtp.sendmail("painel@localhost", destinatario, msg.as_string())
+                smtp.quit()
+
+        t_antes, _ = _cronometrar(uma_conexao_por_email, repeticoes=1)
+        conexoes_antes, caixa.conexoes, caixa.mensagens = caixa.conexoes, 0, 0
+
+        with tempfile.TemporaryDirectory() as pasta:
+            # O log de envios do benchmark não vai para o email_log.json do painel
+            fila_email.EMAIL_LOG_FILE = os.path.join(pasta, "email_log.json")
+            fila = FilaEmail(os.path.join(pasta, "fila_email.db"), intervalo=0.05)
+            inicio = time.perf_counter()
+            fila.enfileirar_lote(destinatarios, "Relatório", "corpo", anexo=b"xlsx", nome_anexo="r.xlsx")
+            t_enfileirar = time.perf_counter() - inicio
+            while fila.situacao().get("enviado", 0) < n_emails and time.perf_counter() - inicio < 60:
+                time.sleep(0.01)
+            t_depois = time.perf_counter() - inicio
+            fila.parar()
+            situacao = fila.situacao()
+    finally:
+        servidor.stop()
+        fila_email.EMAIL_LOG_FILE = log_anterior
+        for chave, valor in anterior.items():
+            if valor is None:
+                os.environ.pop(chave, None)
+            else:
+                os.environ[chave] = valor
+
+    print(f"   {n_emails} e-mails com anexo para o servidor local")
+    print(f"      uma conexão por e-mail: {t_antes * 1000:10.1f} ms   conexões: {conexoes_antes}")
+    print(f"      fila (entrega total):   {t_depois * 1000:10.1f} ms   conexões: {caixa.conexoes}")
+    print(f"      fila (quem chama):      {t_enfileirar * 1000:10.1f} ms")
+    return situacao == {"enviado": n_emails} and caixa.mensagens == n_emails
+
+
+class _FirebaseFalso:
+    """Realtime Database em memória: cada chamada custa `latencia` s e pode estar fora do ar."""
+
+    def __init__(self, latencia):
+        self.latencia = latencia
+        self.fora_do_ar = False
+        self.dados = {}
+        self.chamadas = 0
+
+    def push(self, registro):
+        time.sleep(self.latencia)
+        self.chamadas += 1
+        self.dados[f"push{len(self.dados)}"] = registro
+
+    def update(self, atualizacoes):
+        time.sleep(self.latencia)
+        if self.fora_do_ar:
+            raise ConnectionError("Firebase fora do ar")
+        self.chamadas += 1
+        self.dados.update(atualizacoes)
+
+
+def benchmark_firebase(n_logins=200, latencia=0.02):
+    """Registro de acesso no login: push síncrono (versão anterior) x fila em segundo plano."""
+    registros = [{"usuario": f"professor{i:04d}", "ip": "10.0.0.1", "timestamp": f"{i:06d}"} for i in range(n_logins)]
+    remoto = _FirebaseFalso(latencia)
+    t_antes, _ = _cronometrar(lambda: [remoto.push(r) for r in registros], repeticoes=1)
+    chamadas_antes, remoto.chamadas, remoto.dados = remoto.chamadas, 0, {}
+
+    with tempfile.TemporaryDirectory() as pasta:
+        fila = FilaFirebase(remoto.update, os.path.join(pasta, "fila_firebase.jsonl"), intervalo=0.05)
+        inicio = time.perf_counter()
+        pior = 0.0
+        for registro in registros:
+            antes = time.perf_counter()
+            fila.enfileirar(registro)
+            pior = max(pior, time.perf_counter() - antes)
+        t_login = time.perf_counter() - inicio
+        while fila.pendentes() and time.perf_counter() - inicio < 60:
+            time.sleep(0.01)
+        t_depois = time.perf_counter() - inicio
+        chamadas_depois = remoto.chamadas
+
+        # Queda: os logins continuam, o lote vai para o disco e sobe quando o Firebase volta
+        remoto.fora_do_ar = True
+        for i, registro in enumerate(registros):
+            fila.enfileirar({**registro, "timestamp": f"queda{i:06d}"})
+        time.sleep(0.5)
+        no_disco = os.path.exists(fila.arquivo) or os.path.exists(fila.arquivo + ".enviando")
+        remoto.fora_do_ar = False
+        while fila.pendentes() and time.perf_counter() - inicio < 60:
+            time.sleep(0.01)
+        fila.parar()
+
+    print(f"   {n_logins} logins, {latencia * 1000:.0f} ms por chamada ao Firebase")
+    print(f"      push por login: {t_antes * 1000:10.1f} ms   chamadas: {chamadas_antes}")
+    print(f"      fila (entrega): {t_depois * 1000:10.1f} ms   chamadas: {chamadas_depois}")
+    print(f"      fila (logins):  {t_login * 1000:10.1f} ms   pior login: {pior * 1000:.2f} ms")
+    print(f"      queda: reserva em disco {'OK' if no_disco else 'NÃO USADA'}, "
+          f"{len(remoto.dados)} de {2 * n_logins} registros no Firebase após a volta")
+    return no_disco and len(remoto.dados) == 2 * n_logins
+
+
+def benchmark_sincronizacao(n_registros=5_000, n_novos=100, latencia=0.005):
+    """Botão "Sincronizar": push dos últimos 1000 logs (versão anterior) x envio incremental em lote."""
+    with tempfile.TemporaryDirectory() as pasta:
+        log = LogAcessos(os.path.join(pasta, "logs"), legado=None)
+        indice = IndiceAcessos(log, os.path.join(pasta, "indice.db"))
+        for i in range(n_registros):
+            log.registrar({"usuario": f"professor{i % 300:03d}", "ip": "10.0.0.1", "user_agent": "Unknown",
+                           "timestamp": f"2025-08-{1 + i // 1000:02d}T{i % 24:02d}:00:{i % 60:02d}-03:00",
+                           "data_hora": str(i)})
+        indice.atualizar()
+
+        remoto = _FirebaseFalso(latencia)
+        inicio = time.perf_counter()
+        for _ in range(2):
+            for registro in log.ultimos(1000):
+                remoto.push(registro)
+        t_antes = (time.perf_counter() - inicio) / 2
+        gravados_antes, remoto.chamadas, remoto.dados = len(remoto.dados), 0, {}
+
+        primeira = sincronizar(indice, remoto.update)
+        repetida = sincronizar(indice, remoto.update)
+        for i in range(n_novos):
+            log.registrar({"usuario": "novo", "ip": "10.0.0.2", "user_agent": "Unknown",
+                           "timestamp": f"2025-09-01T08:00:{i % 60:02d}-03:00", "data_hora": f"novo{i}"})
+        novos = sincronizar(indice, remoto.update)
+
+    print(f"   {n_registros:,} acessos no log local, {latencia * 1000:.0f} ms por chamada ao Firebase")
+    print(f"      push dos últimos 1000: {t_antes * 1000:10.1f} ms por clique   "
+          f"2 cliques gravam {gravados_antes:,} registros (só 1000 acessos)")
+    for nome, r in (("1ª sincronização", primeira), ("repetida", repetida), (f"+{n_novos} novos", novos)):
+        print(f"      {nome:<17}      {r['segundos'] * 1000:10.1f} ms   enviados: {r['enviados']:,} "
+              f"em {r['lotes']} lotes ({r['por_segundo']:,.0f}/s)")
+    print(f"      registros no Firebase: {len(remoto.dados):,}")
+    return (primeira["enviados"] == n_registros and repetida["enviados"] == 0
+            and novos["enviados"] == n_novos and len(remoto.dados) == n_registros + n_novos)
+
+
+BENCHMARKS = {
+    "classificacao": benchmark_classificacao,
+    "frequencia": benchmark_frequencia,
+    "duplicados": benchmark_duplicados,
+    "codigos": benchmark_codigos,
+    "email": benchmark_email,
+    "firebase": benchmark_firebase,
+    "sincronizacao": benchmark_sincronizacao,
+}
+
+
+if __name__ == "__main__":
+    escolhidos = sys.argv[1:] or list(BENCHMARKS)
+    falhas = []
+    for nome in escolhidos:
+        print("=" * 60)
+        print(f"BENCHMARK: {nome}")
+        print("=" * 60)
+        if not BENCHMARKS[nome]():
+            falhas.append(nome)
+    if falhas:
+        print(f"\n❌ Paridade falhou em: {', '.join(falhas)}")
+        sys.exit(1)
+    print("\n✅ Todos os resultados conferem com a implementação anterior")
@@ -0,0 +1,185 @@
+"""
+Cache em disco das planilhas do SGE já processadas (formato Parquet)
+"""
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401 - engine usada por pandas.to_parquet/read_parquet
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+CACHE_DIR = os.getenv("PAINEL_CACHE_DIR", ".cache_planilhas")
+CACHE_MAX_MB = float(os.getenv("PAINEL_CACHE_MAX_MB", "512"))
+INDICE_FILE = "indice.json"
+
+
+class CachePlanilhas:
+    """
+    Guarda os DataFrames normalizados por (SHA-256 do arquivo, tipo_planilha).
+    Tabelas derivadas da mesma planilha (ex.: indicadores) ficam ao lado,
+    como outro `artefato` com o mesmo SHA-256.
+
+    Um novo upload do mesmo arquivo (ou um reinício do servidor) lê o Parquet
+    em vez de passar de novo pelo openpyxl. O diretório tem tamanho máximo e
+    remove primeiro as entradas usadas há mais tempo (LRU).
+    """
+
+    def __init__(self, diretorio: str = CACHE_DIR, limite_mb: float = CACHE_MAX_MB):
+        self.diretorio = diretorio
+        self.limite_bytes = int(limite_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._indice = None
+
+    @staticmethod
+    def calcular_hash(conteudo: bytes, sheet=None) -> str:
+        """SHA-256 dos bytes da planilha (a aba selecionada entra na chave)."""
+        h = hashlib.sha256(conteudo)
+        if sheet is not None:
+            h.update(f"|sheet={sheet}".encode("utf-8"))
+        return h.hexdigest()
+
+    # -----------------------------
+    # Índice (entradas + estatísticas)
+    # -----------------------------
+    def _caminho(self, nome: str) -> str:
+        return os.path.join(self.diretorio, nome)
+
+    def _carregar_indice(self) -> Dict[str, Any]:
+        if self._indice is None:
+            indice = {"entradas": {}, "estatisticas": {"hits": 0, "misses": 0, "remocoes": 0}}
+            try:
+                with open(self._caminho(INDICE_FILE), "r", encoding="utf-8") as f:
+                    indice.update(json.load(f))
+            except (FileNotFoundError, ValueError):
+                pass
+            self._indice = indice
+        return self._indice
+
+    def _salvar_indice(self):
+        os.makedirs(self.diretorio, exist_ok=True)
+        tmp = self._caminho(INDICE_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._indice, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self._caminho(INDICE_FILE))
+
+    def _remover_entrada(self, indice: Dict[str, Any], chave: str):
+        entrada = indice["entradas"].pop(chave, None)
+        if entrada:
+            try:
+                os.remove(self._caminho(entrada["arquivo"]))
+            except FileNotFoundError:
+                pass
+
+    def _aplicar_limite(self, indice: Dict[str, Any]):
+        """Remove as entradas menos usadas recentemente até caber no limite."""
+        entradas = indice["entradas"]
+        total = sum(e.get("tamanho", 0) for e in entradas.values())
+        for chave in sorted(entradas, key=lambda c: entradas[c].get("ultimo_acesso", "")):
+            if total <= self.limite_bytes:
+                break
+            total -= entradas[chave].get("tamanho", 0)
+            self._remover_entrada(indice, chave)
+            indice["estatisticas"]["remocoes"] += 1
+
+    # -----------------------------
+    # API pública
+    # -----------------------------
+    def obter(self, hash_planilha: str, versao: int = 0, artefato: str = "dados") -> Optional[pd.DataFrame]:
+        """Retorna o DataFrame em cache para o hash, ou None (miss)."""
+        if not PARQUET_AVAILABLE:
+            return None
+        with self._lock:
+            indice = self._carregar_indice()
+            for chave, entrada in list(indice["entradas"].items()):
+                if entrada.get("sha256") != hash_planilha or entrada.get("artefato", "dados") != artefato:
+                    continue
+                if entrada.get("versao") != versao:
+                    # Processamento mudou desde que a entrada foi gravada
+                    self._remover_entrada(indice, chave)
+                    continue
+                try:
+                    df = pd.read_parquet(self._caminho(entrada["arquivo"]))
+                except Exception as e:
+                    print(f"Erro ao ler cache de planilha: {e}")
+                    self._remover_entrada(indice, chave)
+                    continue
+                df.attrs["tipo_planilha"] = entrada["tipo_planilha"]
+                entrada["ultimo_acesso"] = datetime.now().isoformat()
+                indice["estatisticas"]["hits"] += 1
+                self._salvar_indice()
+                return df
+            indice["estatisticas"]["misses"] += 1
+            self._salvar_indice()
+            return None
+
+    def salvar(self, hash_planilha: str, tipo_planilha: str, df: pd.DataFrame, versao: int = 0,
+               artefato: str = "dados") -> bool:
+        """Grava o DataFrame processado; retorna False se não foi possível."""
+        if not PARQUET_AVAILABLE:
+            return False
+        chave = f"{hash_planilha}_{tipo_planilha}"
+        if artefato != "dados":
+            chave = f"{chave}_{artefato}"
+        arquivo = f"{chave}.parquet"
+        with self._lock:
+            try:
+                os.makedirs(self.diretorio, exist_ok=True)
+                tmp = self._caminho(arquivo + ".tmp")
+                df.to_parquet(tmp, index=False)
+                os.replace(tmp, self._caminho(arquivo))
+            except Exception as e:
+                # Ex.: colunas de texto com tipos misturados que o Arrow não aceita
+                print(f"Planilha não armazenada no cache: {e}")
+                return False
+
+            indice = self._carregar_indice()
+            agora = datetime.now().isoformat()
+            indice["entradas"][chave] = {
+                "sha256": hash_planilha,
+                "tipo_planilha": tipo_planilha,
+                "artefato": artefato,
+                "arquivo": arquivo,
+                "tamanho": os.path.getsize(self._caminho(arquivo)),
+                "linhas": int(len(df)),
+                "versao": versao,
+                "criado_em": agora,
+                "ultimo_acesso": agora,
+            }
+            self._aplicar_limite(indice)
+            self._salvar_indice()
+            return chave in indice["entradas"]
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Acertos, falhas, remoções e ocupação do cache (para a área admin)."""
+        with self._lock:
+            indice = self._carregar_indice()
+            stats = dict(indice["estatisticas"])
+            entradas = list(indice["entradas"].values())
+        consultas = stats["hits"] + stats["misses"]
+        stats["taxa_acerto"] = (stats["hits"] / consultas * 100) if consultas else 0.0
+        stats["entradas"] = sorted(entradas, key=lambda e: e.get("ultimo_acesso", ""), reverse=True)
+        stats["tamanho_bytes"] = sum(e.get("tamanho", 0) for e in entradas)
+        stats["limite_bytes"] = self.limite_bytes
+        stats["disponivel"] = PARQUET_AVAILABLE
+        return stats
+
+    def limpar(self):
+        """Remove todas as entradas e zera as estatísticas."""
+        with self._lock:
+            indice = self._carregar_indice()
+            for chave in list(indice["entradas"]):
+                self._remover_entrada(indice, chave)
+            indice["estatisticas"] = {"hits": 0, "misses": 0, "remocoes": 0}
+            self._salvar_indice()
+
+
+# Instância global do cache de planilhas
+cache_planilhas = CachePlanilhas()
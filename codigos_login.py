@@ -0,0 +1,118 @@
+"""
+Códigos de login enviados por e-mail, guardados em SQLite com índice pela validade
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+from banco_sqlite import conectar, criar_tabelas, transacao
+
+CODIGOS_DB = os.getenv("PAINEL_CODIGOS_DB", "codigos_login.db")
+# Intervalo (s) da limpeza de códigos vencidos em segundo plano (e mínimo entre duas limpezas no `salvar`)
+LIMPEZA_INTERVALO = 300
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS codigos (
+    email TEXT PRIMARY KEY,
+    codigo TEXT NOT NULL,
+    expira_em REAL NOT NULL     -- epoch (s)
+);
+CREATE INDEX IF NOT EXISTS idx_codigos_expira_em ON codigos (expira_em);
+"""
+
+
+class CodigosLogin:
+    """
+    Um código por e-mail. Gerar é um upsert da chave e validar consome o
+    código numa transação, então pedidos simultâneos não sobrescrevem os
+    códigos uns dos outros e o mesmo código não entra duas vezes. Os vencidos
+    saem por uma faixa do índice de validade, sem percorrer a tabela, numa
+    thread periódica (`iniciar`) e também ao gerar códigos.
+    """
+
+    def __init__(self, caminho: str = CODIGOS_DB):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._pronto = False
+        self._ultima_limpeza = 0.0
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _preparar(self):
+        if self._pronto:
+            return
+        with self._lock:
+            if not self._pronto:
+                criar_tabelas(self.caminho, _ESQUEMA)
+                self._pronto = True
+
+    def salvar(self, email: str, codigo: str, validade_minutos: float):
+        """Grava (ou troca) o código do e-mail, válido por `validade_minutos`."""
+        self._preparar()
+        agora = time.time()
+        with transacao(self.caminho) as conexao:
+            conexao.execute(
+                "INSERT INTO codigos (email, codigo, expira_em) VALUES (?, ?, ?) "
+                "ON CONFLICT (email) DO UPDATE SET codigo = excluded.codigo, expira_em = excluded.expira_em",
+                (email, codigo, agora + validade_minutos * 60),
+            )
+        if agora - self._ultima_limpeza >= LIMPEZA_INTERVALO:
+            self._ultima_limpeza = agora
+            self.limpar_expirados(agora)
+
+    def consumir(self, email: str, codigo: str) -> bool:
+        """
+        True se o código confere e está na validade. Um código que confere é
+        apagado mesmo vencido; um código errado não altera nada.
+        """
+        self._preparar()
+        agora = time.time()
+        with transacao(self.caminho) as conexao:
+            linha = conexao.execute(
+                "SELECT expira_em FROM codigos WHERE email = ? AND codigo = ?", (email, codigo)
+            ).fetchone()
+            if linha is None:
+                return False
+            conexao.execute("DELETE FROM codigos WHERE email = ?", (email,))
+        return agora <= linha["expira_em"]
+
+    def limpar_expirados(self, agora: Optional[float] = None) -> int:
+        """Apaga os códigos vencidos; devolve quantos saíram."""
+        self._preparar()
+        agora = time.time() if agora is None else agora
+        with transacao(self.caminho) as conexao:
+            return conexao.execute("DELETE FROM codigos WHERE expira_em < ?", (agora,)).rowcount
+
+    def iniciar(self):
+        """Sobe a thread que apaga os vencidos a cada LIMPEZA_INTERVALO (mesmo sem novos pedidos)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._laco, name="limpeza-codigos", daemon=True)
+            self._thread.start()
+
+    def parar(self, timeout: float = 10):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _laco(self):
+        while not self._parar.wait(LIMPEZA_INTERVALO):
+            try:
+                self._ultima_limpeza = time.time()
+                self.limpar_expirados(self._ultima_limpeza)
+            except Exception as e:
+                print(f"Erro ao limpar códigos vencidos: {e}")
+
+    def __len__(self):
+        self._preparar()
+        conexao = conectar(self.caminho)
+        try:
+            return conexao.execute("SELECT COUNT(*) FROM codigos").fetchone()[0]
+        finally:
+            conexao.close()
+
+
+codigos_login = CodigosLogin()
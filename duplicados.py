@@ -0,0 +1,121 @@
+"""
+Estudantes duplicados: mesma pessoa em várias escolas ou em várias turmas
+"""
+import numpy as np
+import pandas as pd
+
+# Colunas das tabelas detalhadas (tela e download)
+COLUNAS_DETALHE_CENSO = ["Nome", "Escola", "Turma", "CPF", "Situacao"]
+
+
+def _linhas_dos_grupos(df: pd.DataFrame, grupos: pd.DataFrame, chaves) -> pd.DataFrame:
+    """
+    Semi-join: linhas de `df` cujas `chaves` aparecem em `grupos`, na ordem
+    dos grupos e, dentro de cada grupo, na ordem original das linhas.
+    """
+    ordem = grupos[chaves].reset_index(drop=True)
+    ordem["_grupo"] = range(len(ordem))
+    linhas = df[chaves].reset_index(drop=True)
+    linhas["_linha"] = range(len(linhas))
+    pares = linhas.merge(ordem, on=chaves, how="inner").sort_values(["_grupo", "_linha"], kind="mergesort")
+    return df.iloc[pares["_linha"].to_numpy()]
+
+
+class DuplicadosCenso:
+    """
+    Estudantes do Censo Escolar em mais de uma escola e em mais de uma turma
+    da mesma escola, com as tabelas detalhadas (uma linha por matrícula)
+    montadas numa passada só e reaproveitadas pela tela e pelo download.
+    """
+
+    def __init__(self, df: pd.DataFrame, coluna_nome="Nome_Estudante"):
+        coluna_turma = "Turma" if "Turma" in df.columns else "Escola"
+        agregacao_turma = "nunique" if "Turma" in df.columns else "count"
+
+        por_nome = df.groupby(coluna_nome, observed=True).agg(
+            Escola=("Escola", "nunique"), Turma=(coluna_turma, agregacao_turma)
+        ).reset_index()
+        self.multiplas_escolas = por_nome[por_nome["Escola"] > 1]
+
+        por_escola = df.groupby([coluna_nome, "Escola"], observed=True).agg(
+            Turma=(coluna_turma, agregacao_turma)
+        ).reset_index()
+        self.multiplas_turmas = por_escola[por_escola["Turma"] > 1]
+
+        self.total_estudantes = len(df[coluna_nome].unique())
+        self.detalhe_escolas = self._detalhar(
+            _linhas_dos_grupos(df, self.multiplas_escolas, [coluna_nome]), coluna_nome
+        )
+        self.detalhe_turmas = self._detalhar(
+            _linhas_dos_grupos(df, self.multiplas_turmas, [coluna_nome, "Escola"]), coluna_nome
+        )
+
+    @staticmethod
+    def _detalhar(linhas: pd.DataFrame, coluna_nome) -> pd.DataFrame:
+        detalhe = pd.DataFrame(index=range(len(linhas)))
+        origem = {"Nome": coluna_nome}
+        for coluna in COLUNAS_DETALHE_CENSO:
+            nome_origem = origem.get(coluna, coluna)
+            if nome_origem in linhas.columns:
+                detalhe[coluna] = linhas[nome_origem].astype(object).to_numpy()
+            else:
+                detalhe[coluna] = "N/A"
+        return detalhe
+
+    @property
+    def total(self) -> int:
+        return len(self.multiplas_escolas) + len(self.multiplas_turmas)
+
+    def percentual(self, quantidade) -> float:
+        """Percentual de `quantidade` sobre os estudantes únicos."""
+        return quantidade / self.total_estudantes * 100 if self.total_estudantes > 0 else 0
+
+
+class AlunosMultiplasTurmas:
+    """
+    Alunos que aparecem em mais de uma turma. Os pares (aluno, turma) únicos
+    são ordenados uma vez; a lista "T1, T2" da tela e o formato largo
+    (Turma_1..Turma_N) das exportações saem desses mesmos pares.
+    """
+
+    def __init__(self, df: pd.DataFrame, coluna_aluno):
+        self.coluna_aluno = coluna_aluno
+        pares = df[[coluna_aluno, "Turma"]].dropna().drop_duplicates()
+        qtd = pares.groupby(coluna_aluno, observed=True).size()
+        qtd = qtd[qtd > 1]
+        pares = pares[pares[coluna_aluno].isin(qtd.index)]
+
+        # Pares ordenados por (aluno na ordem do groupby, nome da turma)
+        alunos = qtd.index.astype(object).tolist()
+        linhas = pd.Index(alunos).get_indexer(pares[coluna_aluno].astype(object))
+        turmas = pares["Turma"].astype(object).to_numpy()
+        ordem = np.lexsort((pd.factorize(turmas, sort=True)[0], linhas))
+        self._linhas, self._turmas = linhas[ordem], turmas[ordem]
+        inicios = np.searchsorted(self._linhas, np.arange(len(alunos) + 1))
+        self._posicoes = np.arange(len(self._linhas)) - inicios[self._linhas]
+
+        lista = self._turmas.tolist()
+        # O índice (ordem do groupby) acompanha a ordenação final, como na tabela da tela
+        self.resumo = pd.DataFrame({
+            coluna_aluno: alunos,
+            "Qtd_Turmas": qtd.to_numpy(dtype="int64"),
+            "Turmas": [", ".join(lista[i:j]) for i, j in zip(inicios[:-1], inicios[1:])],
+        }).sort_values(["Qtd_Turmas", coluna_aluno], ascending=[False, True])
+
+    def __len__(self):
+        return len(self.resumo)
+
+    def tabela_larga(self) -> pd.DataFrame:
+        """Uma coluna Turma_i por turma (até o maior Qtd_Turmas), na ordem do resumo."""
+        max_turmas = int(self.resumo["Qtd_Turmas"].max()) if len(self.resumo) else 0
+        grade = np.full((len(self.resumo), max_turmas), None, dtype=object)
+        grade[self._linhas, self._posicoes] = self._turmas
+        grade = grade[self.resumo.index.to_numpy()]
+
+        larga = {
+            self.coluna_aluno: self.resumo[self.coluna_aluno].tolist(),
+            "Qtd_Turmas": self.resumo["Qtd_Turmas"].to_numpy(),
+        }
+        for i in range(max_turmas):
+            larga[f"Turma_{i + 1}"] = grade[:, i].tolist()
+        return pd.DataFrame(larga)
@@ -0,0 +1,342 @@
+"""
+Fila persistente de e-mails (SQLite) com envio em segundo plano
+
+Uma thread do processo retira os e-mails em lotes e envia pela mesma sessão
+SMTP enquanto houver mensagens; falhas voltam para a fila com espera
+crescente. Quem chama `enfileirar` não espera conexão, STARTTLS nem login.
+
+Configuração (variáveis de ambiente):
+    SMTP_HOST / SMTP_PORT        servidor (padrão smtp.gmail.com:587)
+    SMTP_STARTTLS                '0' para servidores sem TLS (ex.: aiosmtpd local)
+    GMAIL_USER / GMAIL_PASSWORD  remetente e senha de app (sem eles o envio é simulado,
+                                 a menos que SMTP_HOST aponte para outro servidor)
+    PAINEL_FILA_EMAIL_DB         arquivo da fila (padrão fila_email.db)
+"""
+import json
+import os
+import smtplib
+import threading
+import time
+from datetime import datetime
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Iterable, List, Optional
+
+from banco_sqlite import conectar, criar_tabelas, transacao
+
+FILA_EMAIL_DB = os.getenv("PAINEL_FILA_EMAIL_DB", "fila_email.db")
+EMAIL_LOG_FILE = "email_log.json"
+GMAIL_USER_PADRAO = "seu_email@gmail.com"
+
+LOTE_MAX = 50              # e-mails retirados da fila por vez
+MAX_TENTATIVAS = 5
+ESPERA_BASE = 30           # s; a n-ésima falha espera ESPERA_BASE * 2**(n-1)
+ESPERA_MAX = 3600
+RESERVA_SEGUNDOS = 300     # um lote reservado por um processo que caiu volta à fila depois disso
+SESSAO_OCIOSA_SEGUNDOS = 60
+RETENCAO_ENVIADOS = 24 * 3600      # s; e-mails enviados (já sem corpo) saem da fila depois disso
+RETENCAO_FALHOS = 7 * 24 * 3600    # s; os que falharam ficam mais para o admin ver o erro
+LIMPEZA_INTERVALO = 3600
+
+# Erros que são da mensagem (destinatário, conteúdo); qualquer outro é do servidor/conexão
+_ERROS_DA_MENSAGEM = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS emails (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    destinatario TEXT NOT NULL,
+    assunto TEXT NOT NULL,
+    corpo TEXT NOT NULL,
+    anexo BLOB,
+    nome_anexo TEXT,
+    remetente TEXT,
+    status TEXT NOT NULL DEFAULT 'pendente',   -- pendente | enviando | enviado | falhou
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    proxima_tentativa REAL NOT NULL,           -- epoch (s)
+    erro TEXT,
+    criado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_emails_fila ON emails (status, proxima_tentativa);
+"""
+
+
+def configuracao_smtp() -> dict:
+    """Servidor e credenciais do ambiente; `simulado` quando não há servidor configurado."""
+    usuario = os.getenv("GMAIL_USER", GMAIL_USER_PADRAO)
+    senha = os.getenv("GMAIL_PASSWORD", "sua_senha_app")
+    host = os.getenv("SMTP_HOST", "smtp.gmail.com")
+    credenciais = usuario != GMAIL_USER_PADRAO and bool(senha)
+    return {
+        "host": host,
+        "porta": int(os.getenv("SMTP_PORT", "587")),
+        "starttls": os.getenv("SMTP_STARTTLS", "1") not in ("0", "false", "False"),
+        "usuario": usuario if credenciais else None,
+        "senha": senha if credenciais else None,
+        "remetente": usuario if usuario != GMAIL_USER_PADRAO else "painel-sge@localhost",
+        "simulado": not credenciais and host == "smtp.gmail.com",
+    }
+
+
+def montar_mensagem(remetente, destinatario, assunto, corpo, anexo=None, nome_anexo=None) -> MIMEMultipart:
+    msg = MIMEMultipart()
+    msg["From"] = remetente
+    msg["To"] = destinatario
+    msg["Subject"] = assunto
+    msg.attach(MIMEText(corpo, "plain", "utf-8"))
+    if anexo:
+        parte = MIMEBase("application", "octet-stream")
+        parte.set_payload(anexo)
+        encoders.encode_base64(parte)
+        parte.add_header("Content-Disposition", f"attachment; filename= {nome_anexo}")
+        msg.attach(parte)
+    return msg
+
+
+def _registrar_log(destinatario, assunto, remetente, status):
+    """Uma linha JSON por envio em email_log.json (mesmo formato de antes)."""
+    log_info = {
+        "destinatario": destinatario,
+        "assunto": assunto,
+        "data": datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
+        "remetente": remetente,
+        "status": status,
+    }
+    try:
+        with open(EMAIL_LOG_FILE, "a", encoding="utf-8") as f:
+            f.write(f"{json.dumps(log_info, ensure_ascii=False)}\n")
+    except Exception:
+        pass
+
+
+class FilaEmail:
+    """Fila de e-mails com um entregador em segundo plano por processo."""
+
+    def __init__(self, caminho: str = FILA_EMAIL_DB, intervalo: float = 5.0):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._pronto = False
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._smtp_usado_em = 0.0
+        self._limpo_em = 0.0
+        self.erro_servidor: Optional[str] = None   # última falha de conexão, até o próximo envio bem-sucedido
+
+    def _preparar(self):
+        if self._pronto:
+            return
+        with self._lock:
+            if not self._pronto:
+                criar_tabelas(self.caminho, _ESQUEMA)
+                self._pronto = True
+
+    # --- Produtores -------------------------------------------------------
+
+    def enfileirar(self, destinatario, assunto, corpo, anexo=None, nome_anexo=None, remetente="Sistema") -> int:
+        """Guarda o e-mail na fila e volta na hora; devolve o id."""
+        return self.enfileirar_lote([destinatario], assunto, corpo, anexo, nome_anexo, remetente)[0]
+
+    def enfileirar_lote(self, destinatarios: Iterable[str], assunto, corpo, anexo=None, nome_anexo=None,
+                        remetente="Sistema") -> List[int]:
+        """Mesmo e-mail (ex.: relatório) para vários destinatários, numa transação só."""
+        self._preparar()
+        if anexo and not nome_anexo:
+            nome_anexo = f"relatorio_sge_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx"
+        agora = time.time()
+        ids = []
+        with transacao(self.caminho) as conexao:
+            for destinatario in destinatarios:
+                cursor = conexao.execute(
+                    "INSERT INTO emails (destinatario, assunto, corpo, anexo, nome_anexo, remetente, "
+                    "proxima_tentativa, criado_em) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (destinatario, assunto, corpo, anexo, nome_anexo, remetente, agora, agora),
+                )
+                ids.append(cursor.lastrowid)
+        self.iniciar()
+        self._acordar.set()
+        return ids
+
+    def situacao(self) -> dict:
+        """Quantidade de e-mails por status."""
+        self._preparar()
+        conexao = conectar(self.caminho)
+        try:
+            linhas = conexao.execute("SELECT status, COUNT(*) AS qtd FROM emails GROUP BY status").fetchall()
+        finally:
+            conexao.close()
+        return {linha["status"]: linha["qtd"] for linha in linhas}
+
+    def limpar(self, agora: Optional[float] = None) -> int:
+        """Apaga enviados com mais de RETENCAO_ENVIADOS e falhos com mais de RETENCAO_FALHOS; devolve quantos."""
+        self._preparar()
+        agora = time.time() if agora is None else agora
+        with transacao(self.caminho) as conexao:
+            cursor = conexao.execute(
+                "DELETE FROM emails WHERE (status = 'enviado' AND criado_em < ?) "
+                "OR (status = 'falhou' AND criado_em < ?)",
+                (agora - RETENCAO_ENVIADOS, agora - RETENCAO_FALHOS),
+            )
+        self._limpo_em = agora
+        return cursor.rowcount
+
+    # --- Entregador ------------------------------------------------------
+
+    def iniciar(self):
+        """Sobe a thread de envio se ela ainda não estiver rodando."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._laco, name="fila-email", daemon=True)
+            self._thread.start()
+
+    def parar(self, timeout: float = 10):
+        self._parar.set()
+        self._acordar.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._fechar_sessao()
+
+    def _laco(self):
+        while not self._parar.is_set():
+            # Limpa antes de olhar a fila: um enfileirar durante o lote não se perde
+            self._acordar.clear()
+            try:
+                enviados = self.processar_lote()
+            except Exception as e:
+                print(f"Erro na fila de e-mail: {e}")
+                enviados = 0
+            if enviados:
+                continue
+            if time.time() - self._limpo_em > LIMPEZA_INTERVALO:
+                try:
+                    self.limpar()
+                except Exception as e:
+                    print(f"Erro ao limpar a fila de e-mail: {e}")
+            if self._smtp is not None and time.time() - self._smtp_usado_em > SESSAO_OCIOSA_SEGUNDOS:
+                self._fechar_sessao()
+            self._acordar.wait(self.intervalo)
+
+    def _reservar_lote(self) -> List[dict]:
+        """Marca até LOTE_MAX e-mails vencidos como 'enviando' (outro processo não pega os mesmos)."""
+        self._preparar()
+        agora = time.time()
+        with transacao(self.caminho) as conexao:
+            linhas = conexao.execute(
+                "SELECT * FROM emails WHERE status IN ('pendente', 'enviando') AND proxima_tentativa <= ? "
+                "ORDER BY proxima_tentativa, id LIMIT ?",
+                (agora, LOTE_MAX),
+            ).fetchall()
+            conexao.executemany(
+                "UPDATE emails SET status = 'enviando', proxima_tentativa = ? WHERE id = ?",
+                [(agora + RESERVA_SEGUNDOS, linha["id"]) for linha in linhas],
+            )
+        return [dict(linha) for linha in linhas]
+
+    def processar_lote(self) -> int:
+        """
+        Envia um lote da fila; devolve quantos e-mails saíram do lote (enviados ou não).
+        Se a falha for do servidor (conexão, login), o lote para ali: o resto volta
+        para a fila com a mesma espera, sem uma tentativa de conexão por e-mail.
+        """
+        lote = self._reservar_lote()
+        if not lote:
+            return 0
+        config = configuracao_smtp()
+        enviados = []
+        for posicao, email in enumerate(lote):
+            try:
+                self._enviar(email, config)
+            except _ERROS_DA_MENSAGEM as e:
+                self._falhou(email, e)
+            except Exception as e:
+                espera = self._falhou(email, e)
+                self._fechar_sessao()
+                self.erro_servidor = str(e)
+                self._adiar(lote[posicao + 1:], espera)
+                break
+            else:
+                enviados.append(email)
+                self.erro_servidor = None
+        if enviados:
+            self._concluir(enviados, "Enviado (Simulado)" if config["simulado"] else "Enviado (Real)")
+        return len(lote)
+
+    def _sessao(self, config) -> smtplib.SMTP:
+        """Sessão SMTP reaproveitada entre mensagens (conecta/loga só quando não há uma aberta)."""
+        if self._smtp is None:
+            smtp = smtplib.SMTP(config["host"], config["porta"], timeout=30)
+            if config["starttls"]:
+                smtp.starttls()
+            if config["usuario"]:
+                smtp.login(config["usuario"], config["senha"])
+            self._smtp = smtp
+        return self._smtp
+
+    def _fechar_sessao(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def _enviar(self, email: dict, config: dict):
+        if config["simulado"]:
+            return
+        msg = montar_mensagem(
+            config["remetente"], email["destinatario"], email["assunto"], email["corpo"],
+            email["anexo"], email["nome_anexo"],
+        )
+        try:
+            self._sessao(config).sendmail(config["remetente"], email["destinatario"], msg.as_string())
+        except smtplib.SMTPServerDisconnected:
+            # Sessão fechada pelo servidor enquanto ociosa: reconecta uma vez
+            self._smtp = None
+            self._sessao(config).sendmail(config["remetente"], email["destinatario"], msg.as_string())
+        self._smtp_usado_em = time.time()
+
+    def _concluir(self, emails: List[dict], status_log: str):
+        """
+        Marca o lote enviado numa transação só (se o processo cair antes, o lote
+        é reenviado). Corpo e anexo são apagados: podem ter códigos de login.
+        """
+        with transacao(self.caminho) as conexao:
+            conexao.executemany(
+                "UPDATE emails SET status = 'enviado', tentativas = tentativas + 1, corpo = '', anexo = NULL, "
+                "erro = NULL WHERE id = ?",
+                [(email["id"],) for email in emails],
+            )
+        for email in emails:
+            _registrar_log(email["destinatario"], email["assunto"], email["remetente"], status_log)
+
+    def _adiar(self, emails: List[dict], espera: float):
+        """Devolve à fila e-mails reservados que nem foram tentados (não conta tentativa)."""
+        if not emails:
+            return
+        with transacao(self.caminho) as conexao:
+            conexao.executemany(
+                "UPDATE emails SET status = 'pendente', proxima_tentativa = ? WHERE id = ?",
+                [(time.time() + espera, email["id"]) for email in emails],
+            )
+
+    def _falhou(self, email: dict, erro: Exception) -> float:
+        """Registra a falha e agenda a nova tentativa; devolve a espera (s)."""
+        tentativas = email["tentativas"] + 1
+        status = "falhou" if tentativas >= MAX_TENTATIVAS else "pendente"
+        espera = min(ESPERA_BASE * 2 ** (tentativas - 1), ESPERA_MAX)
+        with transacao(self.caminho) as conexao:
+            conexao.execute(
+                "UPDATE emails SET status = ?, tentativas = ?, proxima_tentativa = ?, erro = ? WHERE id = ?",
+                (status, tentativas, time.time() + espera, str(erro), email["id"]),
+            )
+        if status == "falhou":
+            _registrar_log(email["destinatario"], email["assunto"], email["remetente"], f"Falhou: {erro}")
+        return espera
+
+
+fila_email = FilaEmail()
@@ -0,0 +1,234 @@
+"""
+Fila de gravação no Firebase em segundo plano (write-behind) com reserva em disco
+
+O login só coloca o registro na fila; uma thread junta os pendentes em um
+único `update()` de vários caminhos. Se o Firebase falhar, o lote vai para
+um arquivo JSONL e a thread tenta de novo com espera crescente.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from indice_acessos import IndiceAcessos
+from log_acessos import chave_registro
+
+FILA_FIREBASE_ARQUIVO = os.getenv("PAINEL_FIREBASE_FILA", "fila_firebase.jsonl")
+MEMORIA_MAX = 1000         # registros em memória antes de passar para o disco
+LOTE_MAX = 200             # registros por update()
+ESPERA_INICIAL = 1.0       # s; dobra a cada falha seguida
+ESPERA_MAX = 300.0
+
+
+def sincronizar(indice: IndiceAcessos, enviar: Callable[[Dict[str, Dict]], None], lote_max: int = LOTE_MAX) -> Dict:
+    """
+    Envia os acessos do log local ainda não sincronizados, `lote_max` por
+    update(), registrando cada lote como sincronizado. Repetir não duplica
+    nada: cada acesso vai sempre para a mesma chave (a mesma usada pela fila).
+    """
+    inicio = time.perf_counter()
+    enviados = lotes = 0
+    while True:
+        geracao, linhas = indice.nao_sincronizados(lote_max)
+        if not linhas:
+            break
+        atualizacoes = {}
+        for linha in linhas:
+            atualizacoes[linha["chave"]] = {
+                campo: valor for campo, valor in linha.items() if campo not in ("id", "chave") and valor is not None
+            }
+        enviar(atualizacoes)
+        indice.marcar_sincronizado(linhas[-1]["id"], geracao, list(atualizacoes))
+        enviados += len(linhas)
+        lotes += 1
+    segundos = time.perf_counter() - inicio
+    return {
+        "enviados": enviados,
+        "lotes": lotes,
+        "segundos": segundos,
+        "por_segundo": enviados / segundos if enviados and segundos else 0.0,
+    }
+
+
+class FilaFirebase:
+    """
+    `enviar` recebe {chave: registro} e grava tudo de uma vez (no Firebase,
+    `db.reference('access_logs').update`); um falso em memória serve para testes.
+    """
+
+    def __init__(self, enviar: Callable[[Dict[str, Dict]], None], arquivo: str = FILA_FIREBASE_ARQUIVO,
+                 memoria_max: int = MEMORIA_MAX, lote_max: int = LOTE_MAX, intervalo: float = 1.0):
+        self.enviar = enviar
+        self.arquivo = arquivo
+        self.memoria_max = memoria_max
+        self.lote_max = lote_max
+        self.intervalo = intervalo
+        self._memoria = deque()
+        self._em_envio = 0          # lote da memória sendo gravado agora
+        self._lock = threading.Lock()
+        self._lock_disco = threading.Lock()
+        self._lock_envio = threading.Lock()     # um descarregar por vez (e descartar espera por ele)
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.falhas_seguidas = 0
+        self.ultimo_erro: Optional[str] = None
+        self.enviados = 0
+        self._proxima_tentativa = 0.0
+        atexit.register(self._guardar_memoria)
+
+    # --- Produtor ----------------------------------------------------------
+
+    def enfileirar(self, registro: Dict) -> str:
+        """Coloca o registro na fila e volta na hora; devolve a chave usada no Firebase."""
+        chave = chave_registro(registro)
+        with self._lock:
+            if len(self._memoria) >= self.memoria_max:
+                excedente = list(self._memoria)
+                self._memoria.clear()
+                self._gravar_disco(excedente)
+            self._memoria.append((chave, registro))
+        self.iniciar()
+        self._acordar.set()
+        return chave
+
+    def pendentes(self) -> int:
+        """Registros ainda não gravados no Firebase (memória + disco)."""
+        with self._lock:
+            em_memoria = len(self._memoria) + self._em_envio
+        return em_memoria + sum(1 for _ in self._ler_disco(self.arquivo)) + sum(1 for _ in self._ler_disco(self._arquivo_envio))
+
+    # --- Disco -------------------------------------------------------------
+
+    @property
+    def _arquivo_envio(self) -> str:
+        return self.arquivo + ".enviando"
+
+    def _gravar_disco(self, itens: List):
+        if not itens:
+            return
+        with self._lock_disco:
+            with open(self.arquivo, "a", encoding="utf-8") as f:
+                for chave, registro in itens:
+                    f.write(json.dumps({"chave": chave, "registro": registro}, ensure_ascii=False) + "\n")
+
+    @staticmethod
+    def _ler_disco(caminho: str):
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                for linha in f:
+                    try:
+                        item = json.loads(linha)
+                        yield item["chave"], item["registro"]
+                    except (ValueError, KeyError):
+                        continue
+        except FileNotFoundError:
+            return
+
+    def _guardar_memoria(self):
+        """Na saída do processo, o que está em memória vai para o disco."""
+        with self._lock:
+            itens = list(self._memoria)
+            self._memoria.clear()
+        self._gravar_disco(itens)
+
+    # --- Envio -------------------------------------------------------------
+
+    def iniciar(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._laco, name="fila-firebase", daemon=True)
+            self._thread.start()
+
+    def parar(self, timeout: float = 10):
+        self._parar.set()
+        self._acordar.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._guardar_memoria()
+
+    def _laco(self):
+        while not self._parar.is_set():
+            self._acordar.clear()
+            espera = self._proxima_tentativa - time.monotonic()
+            if espera > 0:
+                # Em espera após falha: novos registros não antecipam a tentativa
+                self._parar.wait(espera)
+                continue
+            if self.descarregar():
+                continue
+            self._acordar.wait(self.intervalo)
+
+    def _enviar_lotes(self, itens: List):
+        for inicio in range(0, len(itens), self.lote_max):
+            self.enviar(dict(itens[inicio:inicio + self.lote_max]))
+        self.enviados += len(itens)
+
+    def descarregar(self) -> int:
+        """
+        Grava os pendentes (primeiro os do disco, que são mais antigos).
+        Devolve quantos foram enviados; numa falha, guarda no disco e agenda nova tentativa.
+        """
+        with self._lock_envio:
+            return self._descarregar()
+
+    def _descarregar(self) -> int:
+        enviados = 0
+        try:
+            with self._lock_disco:
+                if not os.path.exists(self._arquivo_envio) and os.path.exists(self.arquivo):
+                    os.replace(self.arquivo, self._arquivo_envio)
+            do_disco = list(self._ler_disco(self._arquivo_envio))
+            if do_disco:
+                # Reenviar um lote já gravado é inofensivo: as chaves são as mesmas
+                self._enviar_lotes(do_disco)
+                enviados += len(do_disco)
+            if os.path.exists(self._arquivo_envio):
+                # Também sem nenhuma linha legível (gravação interrompida): senão a rotação trava
+                os.remove(self._arquivo_envio)
+
+            while True:
+                with self._lock:
+                    lote = [self._memoria.popleft() for _ in range(min(self.lote_max, len(self._memoria)))]
+                    self._em_envio = len(lote)
+                if not lote:
+                    break
+                try:
+                    self._enviar_lotes(lote)
+                except Exception:
+                    self._gravar_disco(lote)
+                    raise
+                finally:
+                    self._em_envio = 0
+                enviados += len(lote)
+        except Exception as e:
+            self.falhas_seguidas += 1
+            self.ultimo_erro = str(e)
+            espera = min(ESPERA_INICIAL * 2 ** (self.falhas_seguidas - 1), ESPERA_MAX)
+            self._proxima_tentativa = time.monotonic() + espera
+            print(f"⚠️ Firebase temporariamente indisponível (nova tentativa em {espera:.0f}s): {e}")
+            return enviados
+        self.falhas_seguidas = 0
+        self.ultimo_erro = None
+        return enviados
+
+    def descartar(self) -> int:
+        """
+        Joga fora tudo o que ainda não foi gravado (memória e disco); espera o
+        lote em envio terminar, para nada chegar ao Firebase depois. Devolve quantos saíram.
+        """
+        with self._lock_envio:
+            with self._lock:
+                descartados = len(self._memoria)
+                self._memoria.clear()
+            with self._lock_disco:
+                for caminho in (self.arquivo, self._arquivo_envio):
+                    descartados += sum(1 for _ in self._ler_disco(caminho))
+                    if os.path.exists(caminho):
+                        os.remove(caminho)
+        return descartados
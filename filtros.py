@@ -0,0 +1,116 @@
+"""
+Índice dos filtros da barra lateral (Escola → Status → Turma / Disciplina / Aluno)
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Quantas seleções (escola, status) guardam as listas de opções já ordenadas
+OPCOES_CACHE_MAX = 256
+
+
+def _chave(valor):
+    """NaN vira None para poder ser chave de dicionário."""
+    return None if pd.isna(valor) else valor
+
+
+class IndiceFiltros:
+    """
+    Combinações distintas de Escola e Status com as turmas, disciplinas e alunos
+    de cada uma. Montado uma vez por planilha; responder quais opções valem para
+    a seleção atual percorre só os grupos escolhidos, sem copiar o DataFrame.
+    """
+
+    def __init__(self, df: pd.DataFrame, coluna_aluno=None):
+        self.coluna_aluno = coluna_aluno
+        self.dependentes = [c for c in ("Turma", "Disciplina", coluna_aluno) if c and c in df.columns]
+        self._lock = threading.Lock()
+        self._opcoes = {}
+
+        escolas = df["Escola"] if "Escola" in df.columns else pd.Series(None, index=df.index, dtype=object)
+        status = df["Status"] if "Status" in df.columns else pd.Series(None, index=df.index, dtype=object)
+        combinacoes = pd.DataFrame({"Escola": escolas, "Status": status})
+        for coluna in self.dependentes:
+            combinacoes[coluna] = df[coluna]
+        combinacoes = combinacoes.drop_duplicates()
+
+        # {escola: {status: {coluna: set(valores)}}}
+        self._arvore = {}
+        for (escola, status_grupo), grupo in combinacoes.groupby(["Escola", "Status"], dropna=False, observed=True, sort=False):
+            por_coluna = {coluna: set(grupo[coluna].dropna()) for coluna in self.dependentes}
+            self._arvore.setdefault(_chave(escola), {})[_chave(status_grupo)] = por_coluna
+
+        self.escolas = sorted(e for e in self._arvore if e is not None)
+        self.status = sorted({s for por_status in self._arvore.values() for s in por_status if s is not None})
+
+    def opcoes(self, escola_sel="Todas", status_sel=()) -> dict:
+        """
+        Listas ordenadas de Turma, Disciplina e aluno válidas para a escola e
+        os status escolhidos ('Todas' / lista vazia = sem filtro).
+        """
+        chave = (escola_sel, tuple(sorted(status_sel or ())))
+        with self._lock:
+            if chave in self._opcoes:
+                return {coluna: list(lista) for coluna, lista in self._opcoes[chave].items()}
+
+        if escola_sel == "Todas":
+            ramos = list(self._arvore.values())
+        else:
+            ramos = [self._arvore.get(escola_sel, {})]
+
+        valores = {coluna: set() for coluna in self.dependentes}
+        for por_status in ramos:
+            grupos = por_status.values() if not status_sel else (
+                por_status[s] for s in status_sel if s in por_status
+            )
+            for por_coluna in grupos:
+                for coluna, conjunto in por_coluna.items():
+                    valores[coluna] |= conjunto
+
+        resultado = {coluna: sorted(conjunto) for coluna, conjunto in valores.items()}
+        with self._lock:
+            if len(self._opcoes) >= OPCOES_CACHE_MAX:
+                self._opcoes.pop(next(iter(self._opcoes)))
+            self._opcoes[chave] = resultado
+        return {coluna: list(lista) for coluna, lista in resultado.items()}
+
+
+def normalizar_filtros(escola_sel, status_sel, turma_sel, disc_sel, aluno_sel):
+    """Chave dos filtros da barra lateral (a ordem de seleção não importa)."""
+    return (
+        escola_sel,
+        tuple(sorted(status_sel)),
+        tuple(sorted(turma_sel)),
+        tuple(sorted(disc_sel)),
+        aluno_sel,
+    )
+
+
+def mascara_filtros(frame, coluna_aluno, filtros):
+    """Máscara booleana dos filtros da barra lateral sobre `frame` (dados ou indicadores)."""
+    escola_sel, status_sel, turma_sel, disc_sel, aluno_sel = filtros
+    mascara = np.ones(len(frame), dtype=bool)
+    if escola_sel != "Todas":
+        mascara &= (frame["Escola"] == escola_sel).to_numpy()
+    if status_sel:
+        mascara &= frame["Status"].isin(status_sel).to_numpy()
+    if turma_sel:
+        mascara &= frame["Turma"].isin(turma_sel).to_numpy()
+    if disc_sel:
+        mascara &= frame["Disciplina"].isin(disc_sel).to_numpy()
+    if aluno_sel != "Todos":
+        mascara &= (frame[coluna_aluno] == aluno_sel).to_numpy()
+    return mascara
+
+
+def aplicar_filtros(df: pd.DataFrame, coluna_aluno, filtros) -> pd.DataFrame:
+    """
+    Linhas de `df` que passam em todos os filtros, selecionadas de uma vez.
+    Sem filtro ativo devolve o próprio `df` (nenhuma cópia); quem usa o
+    resultado não deve alterá-lo no lugar.
+    """
+    mascara = mascara_filtros(df, coluna_aluno, filtros)
+    if mascara.all():
+        return df
+    return df.take(np.flatnonzero(mascara))
@@ -3,9 +3,14 @@ Configuração do Firebase para monitoramento de acessos
 """
 import os
 import json
+import time
 from datetime import datetime, timezone, timedelta
 from typing import Dict, Any, Optional
 
+from fila_firebase import FilaFirebase, sincronizar
+from indice_acessos import indice_acessos
+from log_acessos import log_acessos
+
 try:
     import firebase_admin
     from firebase_admin import credentials, db
@@ -13,6 +18,13 @@ try:
 except ImportError:
     FIREBASE_AVAILABLE = False
 
+# Leitura do Firebase para o admin: no máximo uma a cada FIREBASE_LEITURA_INTERVALO segundos,
+# relendo FIREBASE_RELEITURA antes do último acesso já trazido, em páginas de FIREBASE_PAGINA
+# acessos (uma página por chamada; a carga inicial continua nas chamadas seguintes)
+FIREBASE_LEITURA_INTERVALO = 30
+FIREBASE_RELEITURA = timedelta(hours=24)
+FIREBASE_PAGINA = 5000
+
 class FirebaseManager:
     """Gerenciador do Firebase para monitoramento de acessos"""
     
@@ -20,6 +32,10 @@ class FirebaseManager:
         self.app = None
         self.initialized = False
         self.firebase_connected = False
+        self._firebase_lido_em = 0.0
+        self._firebase_cursor = None  # timestamp da próxima página, enquanto houver páginas
+        self.fila: Optional[FilaFirebase] = None
+        self._firebase_lido_em = 0.0
         
     def initialize(self, firebase_config: Dict[str, Any] = None):
         """Inicializa a conexão com o Firebase"""
@@ -43,6 +59,9 @@ class FirebaseManager:
             
             self.app = firebase_admin.get_app()
             self.firebase_connected = True
+            # Gravações vão para a fila; ela também reenvia o que ficou no disco da última execução
+            self.fila = FilaFirebase(self._gravar_firebase)
+            self.fila.iniciar()
             print("✅ Firebase conectado com sucesso!")
             
         except Exception as e:
@@ -78,144 +97,78 @@ class FirebaseManager:
         # Sempre salvar localmente (rápido)
         self._save_local_log(access_data)
         
-        # Tentar salvar no Firebase se conectado
-        if self.firebase_connected:
-            try:
-                ref = db.reference('access_logs')
-                new_ref = ref.push(access_data)
-                return new_ref.key
-            except Exception as e:
-                print(f"⚠️ Firebase temporariamente indisponível: {e}")
-                self.firebase_connected = False
+        # Firebase em segundo plano: o login não espera a gravação remota
+        if self.fila is not None:
+            return self.fila.enfileirar(access_data)
         
         return f"local_{datetime.now(timezone(timedelta(hours=-3))).timestamp()}"
     
+    def _gravar_firebase(self, atualizacoes: Dict[str, Dict[str, Any]]):
+        """Grava vários acessos num único update() (um caminho por chave)"""
+        db.reference('access_logs').update(atualizacoes)
+    
     def _save_local_log(self, access_data: Dict[str, Any]):
-        """Salva log localmente"""
+        """Salva log localmente (uma linha acrescentada ao log, sem reler o arquivo)"""
         try:
-            log_file = "local_access_log.json"
-            
-            # Carregar logs existentes
-            logs = []
-            if os.path.exists(log_file):
-                with open(log_file, 'r', encoding='utf-8') as f:
-                    logs = json.load(f)
-            
-            # Adicionar novo log
-            logs.append(access_data)
-            
-            # Salvar de volta
-            with open(log_file, 'w', encoding='utf-8') as f:
-                json.dump(logs, f, ensure_ascii=False, indent=2)
-                
+            log_acessos.registrar(access_data)
         except Exception as e:
             print(f"Erro ao salvar log local: {e}")
     
-    def get_access_logs(self, limit: int = 100) -> list:
-        """Recupera logs de acesso do sistema"""
-        if not self.initialized:
-            raise Exception("Sistema não foi inicializado")
-        
-        # Tentar Firebase primeiro se conectado
-        if self.firebase_connected:
-            try:
-                ref = db.reference('access_logs')
-                logs = ref.order_by_child('timestamp').limit_to_last(limit).get()
-                
-                if logs:
-                    logs_list = []
-                    for key, value in logs.items():
-                        logs_list.append({
-                            'id': key,
-                            **value
-                        })
-                    
-                    logs_list.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-                    return logs_list
-                    
-            except Exception as e:
-                print(f"⚠️ Firebase temporariamente indisponível: {e}")
-                self.firebase_connected = False
-        
-        # Fallback para logs locais
-        return self._get_local_logs(limit)
+    def _clear_local_logs(self):
+        """Apaga o log local"""
+        log_acessos.limpar()
+    
+    def remove_local_duplicates(self, segundos: int = 120) -> int:
+        """Remove acessos repetidos do mesmo usuário em menos de `segundos` (todo o log local); retorna quantos saíram"""
+        return log_acessos.compactar(duplicados_segundos=segundos, incluir_ativo=True)["removidos"]
     
-    def _get_local_logs(self, limit: int) -> list:
-        """Recupera logs locais"""
+    def _atualizar_do_firebase(self):
+        """
+        Traz para o índice os acessos gravados no Firebase por todas as instâncias
+        (só os novos), no máximo FIREBASE_PAGINA por chamada em ordem de timestamp
+        """
+        if not self.firebase_connected:
+            return
+        indice_acessos.atualizar()
+        desde = indice_acessos.remoto_ate()
+        agora = time.monotonic()
+        inicio = self._firebase_cursor
+        if inicio is None:
+            if desde is not None and agora - self._firebase_lido_em < FIREBASE_LEITURA_INTERVALO:
+                return
+            if desde:
+                # Com folga: acessos que ficaram na fila de alguma instância chegam atrasados
+                inicio = (datetime.fromisoformat(desde) - FIREBASE_RELEITURA).isoformat()
+        self._firebase_lido_em = agora
         try:
-            log_file = "local_access_log.json"
-            
-            if not os.path.exists(log_file):
-                return []
-            
-            with open(log_file, 'r', encoding='utf-8') as f:
-                logs = json.load(f)
-            
-            # Ordenar por timestamp e limitar
-            logs.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-            return logs[:limit]
-            
+            consulta = db.reference('access_logs').order_by_child('timestamp')
+            if inicio:
+                consulta = consulta.start_at(inicio)
+            registros = [r for r in (consulta.limit_to_first(FIREBASE_PAGINA).get() or {}).values() if isinstance(r, dict)]
+            indice_acessos.importar_remotos(registros)
+            # Página cheia: a próxima chamada continua do último timestamp (repetidos são ignorados pela chave)
+            ultimo = max((str(r.get('timestamp', '')) for r in registros), default='')
+            self._firebase_cursor = ultimo if len(registros) >= FIREBASE_PAGINA and ultimo > (inicio or '') else None
         except Exception as e:
-            print(f"Erro ao carregar logs locais: {e}")
-            return []
+            print(f"⚠️ Firebase temporariamente indisponível (usando o log local): {e}")
     
     def get_user_access_stats(self, usuario: str) -> Dict[str, Any]:
-        """Retorna estatísticas de acesso de um usuário"""
+        """Retorna estatísticas de acesso de um usuário (mesma fonte do histórico do admin)"""
         if not self.initialized:
             raise Exception("Sistema não foi inicializado")
         
-        # Tentar Firebase primeiro se conectado
-        if self.firebase_connected:
-            try:
-                ref = db.reference('access_logs')
-                user_logs = ref.order_by_child('usuario').equal_to(usuario).get()
-                
-                if user_logs:
-                    total_acessos = len(user_logs)
-                    timestamps = [log.get('timestamp', '') for log in user_logs.values()]
-                    ips = list(set([log.get('ip', '') for log in user_logs.values()]))
-                    
-                    return {
-                        'total_acessos': total_acessos,
-                        'ultimo_acesso': max(timestamps) if timestamps else None,
-                        'primeiro_acesso': min(timestamps) if timestamps else None,
-                        'ips_utilizados': ips
-                    }
-                    
-            except Exception as e:
-                print(f"⚠️ Firebase temporariamente indisponível: {e}")
-                self.firebase_connected = False
-        
-        # Fallback para logs locais
-        return self._get_local_user_stats(usuario)
-    
-    def _get_local_user_stats(self, usuario: str) -> Dict[str, Any]:
-        """Retorna estatísticas locais de um usuário"""
         try:
-            logs = self._get_local_logs(1000)  # Buscar mais logs para stats
-            user_logs = [log for log in logs if log.get('usuario') == usuario]
-            
-            if not user_logs:
-                return {
-                    'total_acessos': 0,
-                    'ultimo_acesso': None,
-                    'primeiro_acesso': None,
-                    'ips_utilizados': []
-                }
-            
-            total_acessos = len(user_logs)
-            timestamps = [log.get('timestamp', '') for log in user_logs]
-            ips = list(set([log.get('ip', '') for log in user_logs]))
-            
+            resumo = self.get_access_summary(usuario=usuario)
+            ips = indice_acessos.distintos('ip', usuario=usuario) if resumo['total'] else []
             return {
-                'total_acessos': total_acessos,
-                'ultimo_acesso': max(timestamps) if timestamps else None,
-                'primeiro_acesso': min(timestamps) if timestamps else None,
+                'total_acessos': resumo['total'],
+                'ultimo_acesso': resumo['ultimo'],
+                'primeiro_acesso': resumo['primeiro'],
                 'ips_utilizados': ips
             }
             
         except Exception as e:
-            print(f"Erro ao calcular stats locais: {e}")
+            print(f"Erro ao calcular stats: {e}")
             return {
                 'total_acessos': 0,
                 'ultimo_acesso': None,
@@ -223,25 +176,42 @@ class FirebaseManager:
                 'ips_utilizados': []
             }
     
-    def sync_to_firebase(self):
-        """Sincroniza logs locais com Firebase"""
+    # Consultas do painel admin: índice SQLite do log local mais o que está no Firebase (período, usuário, IP)
+    def get_access_summary(self, **filtros) -> Dict[str, Any]:
+        """Total de acessos, usuários e IPs únicos, primeiro e último acesso"""
+        self._atualizar_do_firebase()
+        return indice_acessos.resumo(**filtros)
+    
+    def get_access_counts(self, coluna: str, **filtros) -> list:
+        """Acessos agrupados por 'data', 'usuario', 'hora' ou 'ip'"""
+        self._atualizar_do_firebase()
+        return indice_acessos.contagem_por(coluna, **filtros)
+    
+    def get_access_values(self, coluna: str) -> list:
+        """Valores distintos de 'data', 'usuario', 'hora' ou 'ip' (opções dos filtros)"""
+        self._atualizar_do_firebase()
+        return indice_acessos.distintos(coluna)
+    
+    def get_access_list(self, limit: Optional[int] = None, **filtros) -> list:
+        """Acessos do mais recente para o mais antigo"""
+        self._atualizar_do_firebase()
+        return indice_acessos.listar(limite=limit, **filtros)
+    
+    def get_users_summary(self, **filtros) -> list:
+        """Total, primeiro e último acesso por usuário"""
+        self._atualizar_do_firebase()
+        return indice_acessos.por_usuario(**filtros)
+    
+    def sync_to_firebase(self) -> Dict[str, Any]:
+        """Envia ao Firebase só os logs locais ainda não sincronizados, em lotes (repetir não duplica)"""
         if not self.firebase_connected:
             print("⚠️ Firebase não conectado para sincronização")
-            return
+            return {'enviados': 0, 'lotes': 0, 'segundos': 0.0, 'por_segundo': 0.0}
         
-        try:
-            local_logs = self._get_local_logs(1000)
-            if not local_logs:
-                return
-            
-            ref = db.reference('access_logs')
-            for log in local_logs:
-                ref.push(log)
-            
-            print(f"✅ {len(local_logs)} logs sincronizados com Firebase")
-            
-        except Exception as e:
-            print(f"Erro na sincronização: {e}")
+        resultado = sincronizar(indice_acessos, self._gravar_firebase)
+        print(f"✅ {resultado['enviados']} logs sincronizados com Firebase "
+              f"em {resultado['segundos']:.1f}s ({resultado['por_segundo']:.0f}/s)")
+        return resultado
     
     def clear_all_logs(self):
         """Limpa todos os logs (local e Firebase)"""
@@ -249,11 +219,16 @@ class FirebaseManager:
             # Limpar logs locais
             self._clear_local_logs()
             
+            # Pendentes da fila sairiam para o Firebase depois da limpeza
+            if self.fila is not None:
+                self.fila.descartar()
+            
             # Limpar logs do Firebase se conectado
-            if self.firebase_connected and self.db:
+            if self.firebase_connected:
                 try:
-                    ref = self.db.reference('/access_logs')
+                    ref = db.reference('/access_logs')
                     ref.delete()
+                    indice_acessos.esquecer_sincronizados()
                     print("✅ Logs do Firebase limpos!")
                 except Exception as e:
                     print(f"Erro ao limpar Firebase: {e}")
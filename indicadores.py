@@ -0,0 +1,404 @@
+"""
+Regras de cálculo dos indicadores do painel (bimestres, notas e frequência)
+"""
+import numpy as np
+import pandas as pd
+
+MEDIA_APROVACAO = 6.0
+MEDIA_FINAL_ALVO = 6.0   # média final desejada após 4 bimestres
+SOMA_FINAL_ALVO = MEDIA_FINAL_ALVO * 4  # 24 pontos no ano
+
+# Valor da coluna Bimestre quando o período não é reconhecido
+BIMESTRE_DESCONHECIDO = 0
+# Nome por extenso usado em rótulos e colunas (ex.: Faltas_Primeiro_Bimestre)
+NOMES_BIMESTRE = {1: "Primeiro", 2: "Segundo", 3: "Terceiro", 4: "Quarto"}
+
+# Faixas de frequência: limite inferior (%) de cada faixa a partir da segunda
+LIMITES_FREQUENCIA = [75, 80, 90, 95]
+FAIXAS_FREQUENCIA_ORDEM = [
+    "Reprovado",
+    "Alto Risco",
+    "Risco Moderado",
+    "Ponto de Atenção",
+    "Meta Favorável",
+]
+FAIXA_SEM_DADOS = "Sem dados"
+FAIXAS_FREQUENCIA_DTYPE = pd.CategoricalDtype(FAIXAS_FREQUENCIA_ORDEM + [FAIXA_SEM_DADOS], ordered=True)
+
+
+def mapear_bimestre(periodo: str) -> int | None:
+    """Mapeia 'Primeiro Bimestre' -> 1, 'Segundo Bimestre' -> 2, etc."""
+    if not isinstance(periodo, str):
+        return None
+    p = periodo.lower()
+    if "primeiro" in p or "1º" in p or "1o" in p:
+        return 1
+    if "segundo" in p or "2º" in p or "2o" in p:
+        return 2
+    if "terceiro" in p or "3º" in p or "3o" in p:
+        return 3
+    if "quarto" in p or "4º" in p or "4o" in p:
+        return 4
+    return None
+
+
+def mapear_bimestres(periodos: pd.Series) -> pd.Series:
+    """
+    Coluna Bimestre (int8) para uma coluna Periodo inteira.
+
+    mapear_bimestre roda uma vez por valor distinto (são poucos por planilha)
+    e o resultado é espalhado pelos códigos; períodos não reconhecidos ficam
+    com BIMESTRE_DESCONHECIDO.
+    """
+    if isinstance(periodos.dtype, pd.CategoricalDtype):
+        codigos = periodos.cat.codes.to_numpy()
+        valores = periodos.cat.categories
+    else:
+        codigos, valores = pd.factorize(periodos)
+
+    # Posição extra no fim da tabela para os códigos -1 (vazio)
+    tabela = np.full(len(valores) + 1, BIMESTRE_DESCONHECIDO, dtype=np.int8)
+    for i, periodo in enumerate(valores):
+        bimestre = mapear_bimestre(periodo)
+        if bimestre is not None:
+            tabela[i] = bimestre
+    return pd.Series(tabela[codigos], index=periodos.index, name="Bimestre")
+
+
+def coluna_bimestre(df: pd.DataFrame) -> pd.Series:
+    """Coluna Bimestre calculada na carga; DataFrames sem ela derivam de Periodo."""
+    if "Bimestre" in df.columns:
+        return df["Bimestre"]
+    return mapear_bimestres(df["Periodo"])
+
+
+def classificar_status_b1_b2(n1, n2, media12):
+    """
+    Regras:
+      - 'Vermelho Duplo': n1<6 e n2<6
+      - 'Queda p/ Vermelho': n1>=6 e n2<6
+      - 'Recuperou': n1<6 e n2>=6
+      - 'Verde': n1>=6 e n2>=6
+      - Se faltar n1 ou n2, retorna 'Incompleto'
+    """
+    if pd.isna(n1) or pd.isna(n2):
+        return "Incompleto"
+    if n1 < MEDIA_APROVACAO and n2 < MEDIA_APROVACAO:
+        return "Vermelho Duplo"
+    if n1 >= MEDIA_APROVACAO and n2 < MEDIA_APROVACAO:
+        return "Queda p/ Vermelho"
+    if n1 < MEDIA_APROVACAO and n2 >= MEDIA_APROVACAO:
+        return "Recuperou"
+    return "Verde"
+
+
+def classificar_status_b1_b2_b3(n1, n2, n3, media123):
+    """
+    Classificação considerando 3 bimestres:
+      - 'Vermelho Triplo': n1<6, n2<6 e n3<6
+      - 'Vermelho Duplo': duas notas abaixo de 6
+      - 'Queda Recente': n1>=6 e/ou n2>=6, mas n3<6
+      - 'Recuperação': estava abaixo e melhorou no 3º bimestre
+      - 'Verde': todas as notas >= 6
+      - 'Incompleto': falta alguma nota
+    """
+    # Verificar se falta alguma nota
+    if pd.isna(n1) or pd.isna(n2) or pd.isna(n3):
+        return "Incompleto"
+    
+    # Contar quantas notas estão abaixo da média
+    notas_abaixo = sum([n1 < MEDIA_APROVACAO, n2 < MEDIA_APROVACAO, n3 < MEDIA_APROVACAO])
+    
+    if notas_abaixo == 0:
+        return "Verde"  # Todas acima de 6
+    elif notas_abaixo == 3:
+        return "Vermelho Triplo"  # Todas abaixo de 6
+    elif notas_abaixo == 2:
+        return "Vermelho Duplo"  # Duas abaixo de 6
+    else:  # notas_abaixo == 1
+        # Verificar se é queda recente ou recuperação
+        if n3 < MEDIA_APROVACAO:
+            return "Queda Recente"  # Estava bem mas caiu no 3º
+        else:
+            return "Recuperação"  # Estava mal mas melhorou
+
+
+# Rótulos na ordem das condições testadas por cada classificador vetorizado
+_ROTULOS_B1_B2 = np.array(
+    ["Incompleto", "Vermelho Duplo", "Queda p/ Vermelho", "Recuperou", "Verde"], dtype=object
+)
+_ROTULOS_B1_B2_B3 = np.array(
+    ["Incompleto", "Verde", "Vermelho Triplo", "Vermelho Duplo", "Queda Recente", "Recuperação"],
+    dtype=object,
+)
+
+
+def _notas(valores) -> np.ndarray:
+    return np.asarray(valores, dtype=np.float64)
+
+
+def classificar_status_b1_b2_vetorizado(n1, n2) -> np.ndarray:
+    """Mesmas regras de classificar_status_b1_b2, para colunas inteiras de notas."""
+    n1, n2 = _notas(n1), _notas(n2)
+    abaixo1, abaixo2 = n1 < MEDIA_APROVACAO, n2 < MEDIA_APROVACAO
+    indice = np.select(
+        [np.isnan(n1) | np.isnan(n2), abaixo1 & abaixo2, ~abaixo1 & abaixo2, abaixo1 & ~abaixo2],
+        [0, 1, 2, 3],
+        default=4,
+    )
+    return _ROTULOS_B1_B2[indice]
+
+
+def classificar_status_b1_b2_b3_vetorizado(n1, n2, n3) -> np.ndarray:
+    """Mesmas regras de classificar_status_b1_b2_b3, para colunas inteiras de notas."""
+    n1, n2, n3 = _notas(n1), _notas(n2), _notas(n3)
+    abaixo3 = n3 < MEDIA_APROVACAO
+    notas_abaixo = (n1 < MEDIA_APROVACAO).astype(np.int8) + (n2 < MEDIA_APROVACAO) + abaixo3
+    indice = np.select(
+        [
+            np.isnan(n1) | np.isnan(n2) | np.isnan(n3),
+            notas_abaixo == 0,
+            notas_abaixo == 3,
+            notas_abaixo == 2,
+            abaixo3,
+        ],
+        [0, 1, 2, 3, 4],
+        default=5,
+    )
+    return _ROTULOS_B1_B2_B3[indice]
+
+
+def calcula_indicadores(df: pd.DataFrame, por_status: bool = False) -> pd.DataFrame:
+    """
+    Cria um dataframe por Aluno-Disciplina com:
+      N1, N2, N3, N4, Media123, Soma123, ReqMediaProx1 (quanto precisa no próximo bimestre para fechar 6 no ano), Classificacao
+    Com por_status=True a coluna Status também entra na chave (permite filtrar por status depois).
+    """
+    # Coluna Bimestre já vem da carga; períodos não reconhecidos ficam fora do pivot
+    if "Bimestre" not in df.columns:
+        df = df.assign(Bimestre=mapear_bimestres(df["Periodo"]))
+    df = df[df["Bimestre"] != BIMESTRE_DESCONHECIDO]
+
+    # Pivot por (Escola, Turma, Aluno, Disciplina)
+    chave = chave_indicadores(df.columns)
+    if por_status and "Status" in df.columns:
+        chave.append("Status")
+
+    pivot = df.pivot_table(
+        index=chave,
+        columns="Bimestre",
+        values="Nota",
+        aggfunc="mean",
+        observed=True
+    ).reset_index()
+
+    # Renomear colunas 1..4 para N1..N4 (se existirem)
+    rename_cols = {}
+    for b in [1, 2, 3, 4]:
+        if b in pivot.columns:
+            rename_cols[b] = f"N{b}"
+    pivot = pivot.rename(columns=rename_cols)
+
+    # Obter as notas dos 3 primeiros bimestres
+    n1 = pivot.get("N1", pd.Series([np.nan] * len(pivot)))
+    n2 = pivot.get("N2", pd.Series([np.nan] * len(pivot)))
+    n3 = pivot.get("N3", pd.Series([np.nan] * len(pivot)))
+    
+    # Se não existir a coluna, criar uma série de NaN
+    if isinstance(n1, float):
+        n1 = pd.Series([np.nan] * len(pivot))
+    if isinstance(n2, float):
+        n2 = pd.Series([np.nan] * len(pivot))
+    if isinstance(n3, float):
+        n3 = pd.Series([np.nan] * len(pivot))
+
+    # Garantir que as colunas existam no pivot (evita KeyError em filtros/relatórios)
+    pivot["N1"] = n1
+    pivot["N2"] = n2
+    pivot["N3"] = n3
+    
+    # Calcular métricas dos 3 primeiros bimestres
+    pivot["Soma123"] = n1.fillna(0) + n2.fillna(0) + n3.fillna(0)
+    # Média dos bimestres com nota (ignora NaN — ex.: sem 3º bimestre usa só 1º e 2º)
+    pivot["Media123"] = pd.concat([n1, n2, n3], axis=1).mean(axis=1, skipna=True)
+    
+    # Manter também as métricas antigas para compatibilidade
+    pivot["Soma12"] = n1.fillna(0) + n2.fillna(0)
+    pivot["Media12"] = pd.concat([n1, n2], axis=1).mean(axis=1, skipna=True)
+
+    # Quanto precisa no próximo bimestre (N4) para fechar soma >= 24
+    pivot["PrecisaSomarProx1"] = SOMA_FINAL_ALVO - pivot["Soma123"]
+    pivot["ReqMediaProx1"] = pivot["PrecisaSomarProx1"]
+    
+    # Manter também as métricas antigas para compatibilidade
+    pivot["PrecisaSomarProx2"] = SOMA_FINAL_ALVO - pivot["Soma12"]
+    pivot["ReqMediaProx2"] = pivot["PrecisaSomarProx2"] / 2
+
+    # Classificação com 3 bimestres (sem N3 é Incompleto, já que esperamos 3 bimestres)
+    pivot["Classificacao"] = classificar_status_b1_b2_b3_vetorizado(n1, n2, n3)
+
+    # Flags de alerta
+    # "Corda Bamba": precisa de nota >= 7 no próximo bimestre (ou média >= 7 nos próximos 2)
+    pivot["CordaBamba"] = (pivot["ReqMediaProx1"] >= 7) | (pivot["ReqMediaProx2"] >= 7)
+
+    # "Alerta": qualquer situação crítica ou Corda Bamba
+    pivot["Alerta"] = pivot["Classificacao"].isin([
+        "Vermelho Triplo", "Vermelho Duplo", "Queda p/ Vermelho", "Queda Recente"
+    ]) | pivot["CordaBamba"]
+
+    return pivot
+
+
+def chave_indicadores(colunas) -> list:
+    """Colunas que identificam uma linha dos indicadores: (Escola, Turma, aluno, Disciplina)."""
+    coluna_aluno = next((c for c in ["Aluno", "Nome_Estudante", "Estudante"] if c in colunas), None)
+    return ["Escola", "Turma", coluna_aluno, "Disciplina"]
+
+
+def indicadores_exatos(df: pd.DataFrame, indic: pd.DataFrame) -> bool:
+    """
+    True se filtrar `indic` (calcula_indicadores com por_status=True) dá o mesmo
+    que calcular sobre as linhas filtradas de `df`: nenhum aluno-disciplina com
+    mais de um Status ou com Status vazio.
+    """
+    if "Status" not in indic.columns:
+        return True
+    chave = chave_indicadores(indic.columns)
+    return bool(df["Status"].notna().all()) and not indic.duplicated(chave).any()
+
+
+def classificar_frequencia_faixa(freq):
+    """Classifica percentual de frequência em faixas de risco."""
+    if pd.isna(freq):
+        return "Sem dados"
+    if freq < 75:
+        return "Reprovado"
+    if freq < 80:
+        return "Alto Risco"
+    if freq < 90:
+        return "Risco Moderado"
+    if freq < 95:
+        return "Ponto de Atenção"
+    return "Meta Favorável"
+
+
+def classificar_frequencia_faixas(freq: pd.Series) -> pd.Series:
+    """
+    Mesmas faixas de classificar_frequencia_faixa para uma coluna inteira.
+
+    Retorna um categórico ordenado (FAIXAS_FREQUENCIA_ORDEM + 'Sem dados'):
+    value_counts traz todas as faixas e sort_values ordena por gravidade.
+    """
+    valores = pd.to_numeric(freq, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    codigos = np.searchsorted(LIMITES_FREQUENCIA, valores, side="right")
+    codigos[np.isnan(valores)] = len(FAIXAS_FREQUENCIA_ORDEM)
+    return pd.Series(
+        pd.Categorical.from_codes(codigos, dtype=FAIXAS_FREQUENCIA_DTYPE),
+        index=freq.index,
+        name=freq.name,
+    )
+
+
+class ResumoNotasBaixas:
+    """
+    Notas abaixo de MEDIA_APROVACAO agregadas uma única vez por
+    (Bimestre, Disciplina, aluno). Quantidade de notas, alunos únicos e
+    contagem por disciplina de cada bimestre saem dessa mesma tabela.
+    Sem coluna de aluno, só as notas são contadas (nenhum aluno).
+    """
+
+    COLUNA_QTD = "Qtd Notas < 6"
+
+    def __init__(self, df: pd.DataFrame, coluna_aluno, bimestres=(1, 2, 3)):
+        self.coluna_aluno = coluna_aluno
+        chave = ["Bimestre", "Disciplina"] + ([coluna_aluno] if coluna_aluno else [])
+        df = df.assign(Bimestre=coluna_bimestre(df))
+        baixas = df.loc[df["Bimestre"].isin(bimestres) & (df["Nota"] < MEDIA_APROVACAO), chave]
+        self.tabela = (
+            baixas.groupby(chave, observed=True, dropna=False)
+            .size()
+            .rename(self.COLUNA_QTD)
+            .reset_index()
+        )
+        self._por_bimestre = {b: self.tabela[self.tabela["Bimestre"] == b] for b in bimestres}
+
+    def _linhas(self, bimestres):
+        if isinstance(bimestres, int):
+            return self._por_bimestre.get(bimestres, self.tabela.iloc[:0])
+        return self.tabela[self.tabela["Bimestre"].isin(bimestres)]
+
+    def qtd_notas(self, bimestre) -> int:
+        """Quantidade de notas abaixo da média no bimestre."""
+        return int(self._linhas(bimestre)[self.COLUNA_QTD].sum())
+
+    def alunos(self, bimestre) -> set:
+        """Alunos com alguma nota abaixo da média no bimestre."""
+        if not self.coluna_aluno:
+            return set()
+        return set(self._linhas(bimestre)[self.coluna_aluno].unique())
+
+    def qtd_alunos(self, bimestre) -> int:
+        if not self.coluna_aluno:
+            return 0
+        return self._linhas(bimestre)[self.coluna_aluno].nunique()
+
+    def por_disciplina(self, bimestres) -> pd.DataFrame:
+        """Disciplina e quantidade de notas abaixo da média, da maior para a menor."""
+        contagem = (
+            self._linhas(bimestres)
+            .groupby("Disciplina", observed=True)[self.COLUNA_QTD]
+            .sum()
+            .reset_index()
+        )
+        return contagem.sort_values(self.COLUNA_QTD, ascending=False).reset_index(drop=True)
+
+
+def contar_faixas_frequencia(classificacao: pd.Series):
+    """Contagem por faixa (todas as faixas, na ordem) e total de alunos sem 'Sem dados'."""
+    contagem = classificacao.value_counts(sort=False)
+    total = int(contagem.sum() - contagem[FAIXA_SEM_DADOS])
+    return contagem, total
+
+
+class ResumoFrequencia:
+    """
+    Frequência por aluno já classificada em faixas: a consolidada (Frequência
+    Anual, ou a última Frequência quando a planilha não tem a anual) e a média
+    de cada bimestre, com as contagens por faixa de cada uma. Os cartões, abas
+    e exportações de frequência leem todos deste resumo.
+    """
+
+    def __init__(self, df: pd.DataFrame, coluna_aluno, bimestres=(1, 2, 3)):
+        self.coluna_aluno = coluna_aluno
+        self.tem_anual = "Frequencia Anual" in df.columns
+        self.consolidada = None
+        self._bimestres = {}
+        self._contagens = {}
+        if not coluna_aluno:
+            return
+
+        origem = "Frequencia Anual" if self.tem_anual else "Frequencia"
+        if origem in df.columns:
+            freq = df.groupby(coluna_aluno, observed=True)[origem].last().reset_index()
+            self.consolidada = self._classificar(freq.rename(columns={origem: "Frequencia"}), None)
+
+        if "Frequencia" in df.columns and ("Bimestre" in df.columns or "Periodo" in df.columns):
+            medias = df.groupby([coluna_aluno, coluna_bimestre(df)], observed=True)["Frequencia"].mean()
+            presentes = set(medias.index.get_level_values("Bimestre"))
+            for bimestre in bimestres:
+                if bimestre in presentes:
+                    freq = medias.xs(bimestre, level="Bimestre").reset_index()
+                    self._bimestres[bimestre] = self._classificar(freq, bimestre)
+
+    def _classificar(self, freq, chave):
+        freq["Classificacao_Freq"] = classificar_frequencia_faixas(freq["Frequencia"])
+        self._contagens[chave] = contar_faixas_frequencia(freq["Classificacao_Freq"])
+        return freq
+
+    def bimestre(self, bimestre):
+        """Média da Frequência por aluno no bimestre (None se não houver registros)."""
+        return self._bimestres.get(bimestre)
+
+    def contagem(self, bimestre=None):
+        """(contagem por faixa, total) da consolidada ou do bimestre; None sem dados."""
+        return self._contagens.get(bimestre)
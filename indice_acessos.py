@@ -0,0 +1,299 @@
+"""
+Índice SQLite do log de acessos para as consultas do painel administrativo
+
+Com o Firebase conectado, os acessos gravados lá (por todas as instâncias)
+também entram no índice; o mesmo acesso, local e remoto, conta uma vez só.
+"""
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from banco_sqlite import conectar, criar_tabelas, transacao
+from log_acessos import LogAcessos, chave_registro, log_acessos
+
+INDICE_ACESSOS_DB = os.getenv("PAINEL_INDICE_ACESSOS_DB", os.path.join(log_acessos.pasta, "indice.db"))
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS acessos (
+    id INTEGER PRIMARY KEY,
+    usuario TEXT,
+    ip TEXT,
+    user_agent TEXT,
+    timestamp TEXT,             -- ISO 8601 com fuso, como no log
+    data TEXT,                  -- AAAA-MM-DD do próprio timestamp
+    hora INTEGER,
+    data_hora TEXT,
+    chave TEXT                  -- chave_registro(): a mesma usada no Firebase
+);
+CREATE INDEX IF NOT EXISTS idx_acessos_timestamp ON acessos (timestamp);
+CREATE INDEX IF NOT EXISTS idx_acessos_usuario ON acessos (usuario, timestamp);
+CREATE INDEX IF NOT EXISTS idx_acessos_data ON acessos (data, hora);
+CREATE INDEX IF NOT EXISTS idx_acessos_ip ON acessos (ip);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_acessos_chave ON acessos (chave);
+CREATE TABLE IF NOT EXISTS segmentos (numero INTEGER PRIMARY KEY, bytes INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT);
+-- Chaves já enviadas ao Firebase; não dependem dos ids e sobrevivem ao índice refeito
+CREATE TABLE IF NOT EXISTS sincronizados (chave TEXT PRIMARY KEY) WITHOUT ROWID;
+"""
+
+# Colunas que podem ser agrupadas/filtradas (nomes vêm do código, nunca do usuário)
+COLUNAS_AGRUPAMENTO = ("data", "usuario", "hora", "ip")
+
+
+def _linha_indice(registro: Dict) -> tuple:
+    timestamp = str(registro.get("timestamp") or "")
+    try:
+        hora = int(timestamp[11:13])
+    except ValueError:
+        hora = None
+    return (
+        registro.get("usuario"),
+        registro.get("ip"),
+        registro.get("user_agent"),
+        timestamp,
+        timestamp[:10] or None,
+        hora,
+        registro.get("data_hora"),
+        chave_registro(registro),
+    )
+
+
+class IndiceAcessos:
+    """
+    Cópia indexada (timestamp, usuário) do log JSONL. Cada consulta primeiro
+    lê só os bytes acrescentados aos segmentos desde a última vez; se o log
+    foi compactado ou limpo (nova geração), o índice é refeito do zero.
+    """
+
+    def __init__(self, log: LogAcessos = log_acessos, caminho: str = INDICE_ACESSOS_DB):
+        self.log = log
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._pronto = False
+
+    def _preparar(self):
+        if self._pronto:
+            return
+        with self._lock:
+            if not self._pronto:
+                os.makedirs(os.path.dirname(os.path.abspath(self.caminho)), exist_ok=True)
+                self._migrar()
+                criar_tabelas(self.caminho, _ESQUEMA)
+                self._pronto = True
+
+    def _migrar(self):
+        """Índice de uma versão sem a chave única por acesso: é só uma cópia do log, então é refeito."""
+        if not os.path.exists(self.caminho):
+            return
+        with transacao(self.caminho) as conexao:
+            colunas = [linha["name"] for linha in conexao.execute("PRAGMA table_info(acessos)")]
+            unica = conexao.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_acessos_chave'"
+            ).fetchone()
+            if colunas and unica is None:
+                conexao.execute("DROP TABLE acessos")
+                conexao.execute("DROP TABLE IF EXISTS segmentos")
+
+    def atualizar(self) -> int:
+        """Indexa o que foi acrescentado ao log; devolve quantos registros entraram."""
+        self._preparar()
+        geracao = str(self.log.geracao())
+        novos = 0
+        with transacao(self.caminho) as conexao:
+            linha = conexao.execute("SELECT valor FROM meta WHERE chave = 'geracao'").fetchone()
+            refeito = linha is None or linha["valor"] != geracao
+            if refeito:
+                conexao.execute("DELETE FROM acessos")
+                conexao.execute("DELETE FROM segmentos")
+                # Os acessos do Firebase também saíram: a próxima leitura traz tudo de novo
+                conexao.execute("DELETE FROM meta WHERE chave = 'remoto_ate'")
+                conexao.execute("INSERT OR REPLACE INTO meta (chave, valor) VALUES ('geracao', ?)", (geracao,))
+            lidos = {r["numero"]: r["bytes"] for r in conexao.execute("SELECT numero, bytes FROM segmentos")}
+            for numero in self.log.segmentos():
+                inicio = lidos.get(numero, 0)
+                try:
+                    with open(self.log.caminho_segmento(numero), "rb") as f:
+                        f.seek(inicio)
+                        bloco = f.read()
+                except FileNotFoundError:
+                    continue
+                # Só linhas completas; uma linha sendo escrita fica para a próxima vez
+                completo = bloco[:bloco.rfind(b"\n") + 1]
+                if not completo:
+                    continue
+                registros = []
+                for texto in completo.split(b"\n"):
+                    if texto.strip():
+                        try:
+                            registros.append(_linha_indice(json.loads(texto)))
+                        except ValueError:
+                            continue
+                conexao.executemany(
+                    "INSERT OR IGNORE INTO acessos (usuario, ip, user_agent, timestamp, data, hora, data_hora, chave) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    registros,
+                )
+                conexao.execute(
+                    "INSERT OR REPLACE INTO segmentos (numero, bytes) VALUES (?, ?)",
+                    (numero, inicio + len(completo)),
+                )
+                novos += len(registros)
+            if refeito:
+                # Os ids mudaram: a marca volta para antes do primeiro acesso cuja chave não foi enviada
+                conexao.execute(
+                    "INSERT OR REPLACE INTO meta (chave, valor) VALUES ('sincronizado_ate', "
+                    "(SELECT COALESCE((SELECT MIN(id) - 1 FROM acessos WHERE chave NOT IN "
+                    "(SELECT chave FROM sincronizados)), (SELECT MAX(id) FROM acessos), 0)))"
+                )
+        return novos
+
+    def importar_remotos(self, registros: Iterable[Dict]) -> int:
+        """
+        Acrescenta acessos lidos do Firebase (os que já estão no índice são
+        ignorados pela chave); eles contam como sincronizados. Devolve quantos entraram.
+        """
+        self._preparar()
+        linhas = [_linha_indice(registro) for registro in registros if isinstance(registro, dict)]
+        with transacao(self.caminho) as conexao:
+            antes = conexao.total_changes
+            conexao.executemany(
+                "INSERT OR IGNORE INTO acessos (usuario, ip, user_agent, timestamp, data, hora, data_hora, chave) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                linhas,
+            )
+            novos = conexao.total_changes - antes
+            conexao.executemany("INSERT OR IGNORE INTO sincronizados (chave) VALUES (?)", [(l[-1],) for l in linhas])
+            ultimo = max((l[3] for l in linhas), default="")
+            conexao.execute(
+                "INSERT INTO meta (chave, valor) VALUES ('remoto_ate', ?) "
+                "ON CONFLICT (chave) DO UPDATE SET valor = MAX(valor, excluded.valor)",
+                (ultimo,),
+            )
+        return novos
+
+    def remoto_ate(self) -> Optional[str]:
+        """Maior timestamp lido do Firebase ('' se nada veio); None se o Firebase ainda não foi lido."""
+        self._preparar()
+        conexao = conectar(self.caminho)
+        try:
+            linha = conexao.execute("SELECT valor FROM meta WHERE chave = 'remoto_ate'").fetchone()
+        finally:
+            conexao.close()
+        return None if linha is None else linha["valor"]
+
+    @staticmethod
+    def _filtro(inicio: Optional[str] = None, fim: Optional[str] = None, usuario=None, ip=None):
+        """WHERE para período (datas AAAA-MM-DD, inclusivas), usuário e IP."""
+        condicoes, parametros = [], []
+        if inicio:
+            condicoes.append("timestamp >= ?")
+            parametros.append(str(inicio))
+        if fim:
+            # Todo o dia `fim`: qualquer timestamp que comece com a data é menor que data + 'T~'
+            condicoes.append("timestamp < ?")
+            parametros.append(f"{fim}T~")
+        if usuario is not None:
+            condicoes.append("usuario = ?")
+            parametros.append(usuario)
+        if ip is not None:
+            condicoes.append("ip = ?")
+            parametros.append(ip)
+        return (" WHERE " + " AND ".join(condicoes)) if condicoes else "", parametros
+
+    def _consultar(self, sql: str, parametros=()) -> List[Dict]:
+        self.atualizar()
+        conexao = conectar(self.caminho)
+        try:
+            return [dict(linha) for linha in conexao.execute(sql, parametros).fetchall()]
+        finally:
+            conexao.close()
+
+    def resumo(self, **filtros) -> Dict:
+        """Total de acessos, usuários e IPs distintos, primeiro e último acesso."""
+        where, parametros = self._filtro(**filtros)
+        # Um DISTINCT por subconsulta: cada um percorre só o índice da sua coluna
+        e = " AND " if where else " WHERE "
+        return self._consultar(
+            f"SELECT (SELECT COUNT(*) FROM acessos{where}) AS total, "
+            f"(SELECT COUNT(*) FROM (SELECT DISTINCT usuario FROM acessos{where}{e}usuario IS NOT NULL)) AS usuarios, "
+            f"(SELECT COUNT(*) FROM (SELECT DISTINCT ip FROM acessos{where}{e}ip IS NOT NULL)) AS ips, "
+            f"(SELECT MIN(timestamp) FROM acessos{where}) AS primeiro, "
+            f"(SELECT MAX(timestamp) FROM acessos{where}) AS ultimo",
+            parametros * 5,
+        )[0]
+
+    def contagem_por(self, coluna: str, **filtros) -> List[Dict]:
+        """[{coluna: valor, 'acessos': n}] em ordem do valor."""
+        if coluna not in COLUNAS_AGRUPAMENTO:
+            raise ValueError(f"coluna inválida: {coluna}")
+        where, parametros = self._filtro(**filtros)
+        return self._consultar(
+            f"SELECT {coluna}, COUNT(*) AS acessos FROM acessos{where} GROUP BY {coluna} ORDER BY {coluna}",
+            parametros,
+        )
+
+    def distintos(self, coluna: str, **filtros) -> List:
+        """Valores distintos (não nulos) de uma coluna, ordenados."""
+        return [linha[coluna] for linha in self.contagem_por(coluna, **filtros) if linha[coluna] is not None]
+
+    def listar(self, limite: Optional[int] = None, **filtros) -> List[Dict]:
+        """Acessos do mais recente para o mais antigo."""
+        where, parametros = self._filtro(**filtros)
+        sql = f"SELECT usuario, ip, user_agent, timestamp, data_hora FROM acessos{where} ORDER BY timestamp DESC, id DESC"
+        if limite is not None:
+            sql += " LIMIT ?"
+            parametros.append(int(limite))
+        return self._consultar(sql, parametros)
+
+    def por_usuario(self, **filtros) -> List[Dict]:
+        """Total, primeiro e último acesso de cada usuário (mais acessos primeiro)."""
+        where, parametros = self._filtro(**filtros)
+        return self._consultar(
+            "SELECT usuario, COUNT(*) AS total, MIN(timestamp) AS primeiro, MAX(timestamp) AS ultimo "
+            f"FROM acessos{where} GROUP BY usuario ORDER BY total DESC, usuario",
+            parametros,
+        )
+
+    def nao_sincronizados(self, limite: int) -> Tuple[str, List[Dict]]:
+        """(geração, até `limite` acessos não enviados depois da marca de sincronização, em ordem de id)."""
+        self.atualizar()
+        conexao = conectar(self.caminho)
+        try:
+            meta = dict(conexao.execute("SELECT chave, valor FROM meta").fetchall())
+            linhas = conexao.execute(
+                "SELECT id, usuario, ip, user_agent, timestamp, data_hora, chave FROM acessos "
+                "WHERE id > ? AND chave NOT IN (SELECT chave FROM sincronizados) ORDER BY id LIMIT ?",
+                (int(meta.get("sincronizado_ate", 0)), int(limite)),
+            ).fetchall()
+        finally:
+            conexao.close()
+        return meta.get("geracao"), [dict(linha) for linha in linhas]
+
+    def marcar_sincronizado(self, ate_id: int, geracao: str, chaves: List[str]) -> bool:
+        """
+        Guarda as chaves enviadas e avança a marca até `ate_id` (nunca para
+        trás). Se o índice foi refeito nesse meio tempo, só as chaves ficam.
+        """
+        with transacao(self.caminho) as conexao:
+            conexao.executemany("INSERT OR IGNORE INTO sincronizados (chave) VALUES (?)", [(c,) for c in chaves])
+            linha = conexao.execute("SELECT valor FROM meta WHERE chave = 'geracao'").fetchone()
+            if linha is None or linha["valor"] != geracao:
+                return False
+            conexao.execute(
+                "INSERT INTO meta (chave, valor) VALUES ('sincronizado_ate', ?) "
+                "ON CONFLICT (chave) DO UPDATE SET "
+                "valor = MAX(CAST(valor AS INTEGER), CAST(excluded.valor AS INTEGER))",
+                (int(ate_id),),
+            )
+        return True
+
+    def esquecer_sincronizados(self):
+        """Depois de apagar os logs do Firebase: nada do que foi enviado está mais lá."""
+        self._preparar()
+        with transacao(self.caminho) as conexao:
+            conexao.execute("DELETE FROM sincronizados")
+            conexao.execute("DELETE FROM meta WHERE chave = 'sincronizado_ate'")
+
+
+indice_acessos = IndiceAcessos()
@@ -1,41 +1,107 @@
 """
 Utilitários para obter informações de IP e navegador do usuário
+
+IP e navegador vêm dos cabeçalhos da própria requisição (st.context), sem
+chamadas externas no login. Opcionalmente (PAINEL_IP_EXTERNO=1) o IP público
+do servidor é consultado uma vez, em segundo plano, e usado só como último
+recurso quando a requisição não traz IP (ex.: desenvolvimento local).
 """
+import os
+import threading
+from typing import Optional
+
 import streamlit as st
-import requests
+
+try:
+    import requests
+    REQUESTS_AVAILABLE = True
+except ImportError:
+    REQUESTS_AVAILABLE = False
+
+IP_EXTERNO_ATIVO = os.getenv("PAINEL_IP_EXTERNO", "0") in ("1", "true", "True")
+IP_EXTERNO_URL = "https://httpbin.org/ip"
+IP_PADRAO = "127.0.0.1"
+_CHAVE_SESSAO = "_client_info"
+
+_ip_externo: Optional[str] = None
+_consulta_externa: Optional[threading.Thread] = None
+_lock = threading.Lock()
+
+
+def _cabecalhos() -> dict:
+    try:
+        return dict(st.context.headers or {})
+    except Exception:
+        return {}
+
+
+def _cabecalho(cabecalhos: dict, nome: str) -> Optional[str]:
+    nome = nome.lower()
+    for chave, valor in cabecalhos.items():
+        if chave.lower() == nome and valor:
+            return str(valor).strip()
+    return None
+
+
+def ip_dos_cabecalhos(cabecalhos: dict) -> Optional[str]:
+    """IP do cliente: primeiro endereço de X-Forwarded-For (atrás de proxy) ou X-Real-IP."""
+    encaminhado = _cabecalho(cabecalhos, "X-Forwarded-For")
+    if encaminhado:
+        primeiro = encaminhado.split(",")[0].strip()
+        if primeiro:
+            return primeiro
+    return _cabecalho(cabecalhos, "X-Real-IP")
+
+
+def _consultar_ip_externo():
+    global _ip_externo
+    try:
+        response = requests.get(IP_EXTERNO_URL, timeout=5)
+        if response.status_code == 200:
+            _ip_externo = response.json().get("origin")
+    except Exception:
+        pass
+
+
+def ip_externo() -> Optional[str]:
+    """IP público do servidor se a consulta opcional já terminou; nunca espera por ela."""
+    global _consulta_externa
+    if not (IP_EXTERNO_ATIVO and REQUESTS_AVAILABLE):
+        return None
+    with _lock:
+        if _consulta_externa is None:
+            _consulta_externa = threading.Thread(target=_consultar_ip_externo, name="ip-externo", daemon=True)
+            _consulta_externa.start()
+    return _ip_externo
+
 
 def get_client_ip() -> str:
-    """Obtém o IP do cliente através do Streamlit"""
+    """Obtém o IP do cliente a partir da requisição do Streamlit"""
     try:
-        # Streamlit não expõe diretamente o IP, então usamos serviços externos
-        # como fallback para desenvolvimento
-        try:
-            # Tenta obter IP local primeiro (para desenvolvimento)
-            response = requests.get('https://httpbin.org/ip', timeout=5)
-            if response.status_code == 200:
-                return response.json().get('origin', '127.0.0.1')
-        except:
-            pass
-        
-        # Fallback para IP local
-        return '127.0.0.1'
+        ip = ip_dos_cabecalhos(_cabecalhos())
+        if not ip:
+            ip = getattr(st.context, "ip_address", None)
+            ip = ip if isinstance(ip, str) else None
+        return ip or ip_externo() or IP_PADRAO
     except Exception:
         return 'Unknown'
 
+
 def get_user_agent() -> str:
-    """Obtém informações do navegador do usuário"""
+    """Obtém informações do navegador do usuário (cabeçalho User-Agent)"""
     try:
-        # Streamlit não expõe user-agent diretamente
-        # Para uma implementação mais robusta, seria necessário
-        # usar headers HTTP customizados
-        return st.get_option("browser.gatherUsageStats") and "Streamlit App" or "Unknown Browser"
+        return _cabecalho(_cabecalhos(), "User-Agent") or "Unknown Browser"
     except Exception:
         return "Unknown Browser"
 
+
 def get_client_info() -> dict:
-    """Obtém informações completas do cliente"""
-    return {
-        'ip': get_client_ip(),
-        'user_agent': get_user_agent(),
-        'session_id': st.session_state.get('session_id', 'unknown')
-    }
+    """Obtém informações completas do cliente (calculadas uma vez por sessão)"""
+    info = st.session_state.get(_CHAVE_SESSAO)
+    if info is None or (info['ip'] == IP_PADRAO and ip_externo()):
+        info = {
+            'ip': get_client_ip(),
+            'user_agent': get_user_agent(),
+        }
+        st.session_state[_CHAVE_SESSAO] = info
+    return {**info, 'session_id': st.session_state.get('session_id', 'unknown')}
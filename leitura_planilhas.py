@@ -0,0 +1,418 @@
+"""
+Leitura de planilhas .xlsx em modo streaming (openpyxl read_only)
+"""
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import openpyxl
+from pandas.api.types import union_categoricals
+
+TAMANHO_BLOCO = 50_000
+
+# Textos que o pandas.read_excel trata como vazio (inclui células de erro do Excel)
+VALORES_NA = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+    "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+    "#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NUM!", "#NULL!",
+}
+
+# Indicadores (trechos de nomes de coluna) usados para reconhecer cada tipo de planilha
+CENSO_INDICATORS = [
+    'código', 'superv', 'convên', 'entidade', 'inep', 'situação', 'classific',
+    'nome', 'endereço', 'bairro', 'distrito', 'cep', 'cnpj', 'telefone', 'email',
+    'nível de', 'categoria', 'tipo de estrutura', 'etapas', 'ano letivo', 'calendário',
+    'curso', 'avaliação', 'conceito', 'servidor', 'turno', 'horário', 'tempo',
+    'média', 'salário', 'língua', 'professor', 'área de cargo', 'data na', 'cpf'
+]
+CONTEUDO_INDICATORS = [
+    'componente curricu', 'atividade/conteúdo', 'situação', 'data', 'horário'
+]
+NOTAS_INDICATORS = [
+    'aluno', 'nota', 'frequencia', 'turma', 'escola', 'disciplina', 'periodo'
+]
+
+# Colunas lidas para cada tipo de planilha e o tipo de cada uma ("texto", "nota",
+# "inteiro", "decimal"). Variações com acento são aceitas; os processar_* padronizam os nomes.
+COLUNAS_NOTAS_FREQUENCIA = {
+    "Escola": "texto",
+    "Turma": "texto",
+    "Turno": "texto",
+    "Status": "texto",
+    "Aluno": "texto",
+    "Nome_Estudante": "texto",
+    "Estudante": "texto",
+    "Periodo": "texto",
+    "Período": "texto",
+    "Disciplina": "texto",
+    "Nota": "nota",
+    "Falta": "inteiro",
+    "Frequencia": "decimal",
+    "Frequência": "decimal",
+    "Frequencia Anual": "decimal",
+    "Frequência Anual": "decimal",
+}
+
+# Censo e conteúdo aplicado exibem a planilha completa: as demais colunas são lidas
+# com o tipo inferido (como no pandas.read_excel)
+COLUNAS_CENSO_ESCOLAR = {
+    "Nome": "texto",
+    "Escola": "texto",
+    "Situação da Matrícula": "texto",
+    "Turno": "texto",
+    "Nível de Ensino": "texto",
+    "Ano/Série": "texto",
+    "Descrição Turma": "texto",
+}
+
+COLUNAS_CONTEUDO_APLICADO = {}
+
+# tipo_planilha -> (colunas declaradas, lê também as demais colunas)
+LEITORES_POR_TIPO = {
+    "notas_frequencia": (COLUNAS_NOTAS_FREQUENCIA, False),
+    "censo_escolar": (COLUNAS_CENSO_ESCOLAR, True),
+    "conteudo_aplicado": (COLUNAS_CONTEUDO_APLICADO, True),
+}
+
+
+def detectar_tipo_por_colunas(colunas) -> str:
+    """
+    Detecta o tipo de planilha pelos nomes das colunas.
+    Retorna: 'notas_frequencia', 'conteudo_aplicado' ou 'censo_escolar'
+    """
+    colunas = [str(col).lower().strip() for col in colunas]
+
+    censo_score = sum(1 for indicator in CENSO_INDICATORS
+                      if any(indicator in col for col in colunas))
+    conteudo_score = sum(1 for indicator in CONTEUDO_INDICATORS
+                         if any(indicator in col for col in colunas))
+    notas_score = sum(1 for indicator in NOTAS_INDICATORS
+                      if any(indicator in col for col in colunas))
+
+    # Se tem mais indicadores de censo escolar, é esse tipo
+    if censo_score >= 8:
+        return 'censo_escolar'
+    elif conteudo_score >= 3:
+        return 'conteudo_aplicado'
+    elif notas_score >= 3:
+        return 'notas_frequencia'
+    else:
+        # Se não conseguir detectar claramente, assume notas/frequência como padrão
+        return 'notas_frequencia'
+
+
+def _abrir_aba(conteudo: bytes, sheet=None):
+    """Abre o workbook em modo somente leitura e retorna (workbook, aba)."""
+    wb = openpyxl.load_workbook(BytesIO(conteudo), read_only=True, data_only=True)
+    if sheet is None:
+        ws = wb.worksheets[0]
+    elif isinstance(sheet, int):
+        ws = wb.worksheets[sheet]
+    else:
+        ws = wb[sheet]
+    return wb, ws
+
+
+def _valor_celula(valor):
+    """Mesma conversão do pandas.read_excel: vazio vira NaN e float inteiro vira int."""
+    if valor is None:
+        return np.nan
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    if isinstance(valor, str) and valor in VALORES_NA:
+        return np.nan
+    return valor
+
+
+def _nomes_cabecalho(linha) -> List[str]:
+    nomes = []
+    for i, valor in enumerate(linha):
+        nomes.append(f"Unnamed: {i}" if valor is None else str(_valor_celula(valor)).strip())
+    return nomes
+
+
+def _sem_namespace(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _indice_coluna(referencia: str) -> int:
+    """'C7' -> 2"""
+    idx = 0
+    for ch in referencia:
+        if not ch.isalpha():
+            break
+        idx = idx * 26 + (ord(ch.upper()) - 64)
+    return idx - 1
+
+
+def _caminho_aba_xml(zf: zipfile.ZipFile, sheet=None) -> str:
+    """Caminho (dentro do .xlsx) do XML da aba pedida, na ordem do workbook."""
+    abas = []
+    with zf.open("xl/workbook.xml") as f:
+        for _, el in ET.iterparse(f):
+            if _sem_namespace(el.tag) == "sheet":
+                rid = next((v for k, v in el.attrib.items() if _sem_namespace(k) == "id"), None)
+                abas.append((el.attrib.get("name"), rid))
+    if sheet is None:
+        _, rid = abas[0]
+    elif isinstance(sheet, int):
+        _, rid = abas[sheet]
+    else:
+        rid = next(r for nome, r in abas if nome == sheet)
+
+    with zf.open("xl/_rels/workbook.xml.rels") as f:
+        for _, el in ET.iterparse(f):
+            if _sem_namespace(el.tag) == "Relationship" and el.attrib.get("Id") == rid:
+                alvo = el.attrib["Target"]
+                return alvo.lstrip("/") if alvo.startswith("/") else posixpath.normpath(posixpath.join("xl", alvo))
+    raise KeyError(rid)
+
+
+def _textos_compartilhados(zf: zipfile.ZipFile, indices) -> Dict[int, str]:
+    """Lê a tabela de textos compartilhados só até o maior índice necessário."""
+    if not indices or "xl/sharedStrings.xml" not in zf.namelist():
+        return {}
+    maior = max(indices)
+    textos = {}
+    posicao = 0
+    with zf.open("xl/sharedStrings.xml") as f:
+        for _, el in ET.iterparse(f):
+            if _sem_namespace(el.tag) != "si":
+                continue
+            if posicao in indices:
+                # Concatena os trechos <t> (texto com formatação), ignorando a fonética <rPh>
+                partes = []
+                for filho in el:
+                    nome = _sem_namespace(filho.tag)
+                    if nome == "t":
+                        partes.append(filho.text or "")
+                    elif nome == "r":
+                        partes.extend(t.text or "" for t in filho if _sem_namespace(t.tag) == "t")
+                textos[posicao] = "".join(partes)
+            el.clear()
+            if posicao >= maior:
+                break
+            posicao += 1
+    return textos
+
+
+def _cabecalho_xml(conteudo: bytes, sheet=None) -> Optional[List[str]]:
+    """
+    Lê a primeira linha direto do XML da aba, sem openpyxl.
+
+    O openpyxl carrega a tabela inteira de textos compartilhados ao abrir o
+    arquivo, o que já custa segundos em planilhas grandes; aqui só a primeira
+    linha da aba e o início dessa tabela são lidos. Retorna None se a linha 1
+    estiver vazia (os nomes "Unnamed: n" dependem da largura da aba).
+    """
+    with zipfile.ZipFile(BytesIO(conteudo)) as zf:
+        celulas = {}
+        with zf.open(_caminho_aba_xml(zf, sheet)) as f:
+            for _, el in ET.iterparse(f):
+                nome = _sem_namespace(el.tag)
+                if nome == "c":
+                    tipo = el.attrib.get("t", "n")
+                    valor = None
+                    for filho in el.iter():
+                        tag = _sem_namespace(filho.tag)
+                        if tag == "v" or (tag == "t" and tipo == "inlineStr"):
+                            valor = filho.text
+                    if valor is not None:
+                        celulas[_indice_coluna(el.attrib.get("r", ""))] = (tipo, valor)
+                elif nome == "row":
+                    # Linha 1 ausente no XML: o cabeçalho está em branco
+                    if el.attrib.get("r", "1") != "1":
+                        celulas = {}
+                    break
+        if not celulas:
+            return None
+
+        compartilhados = _textos_compartilhados(
+            zf, {int(v) for t, v in celulas.values() if t == "s"}
+        )
+
+    linha = [None] * (max(celulas) + 1)
+    for idx, (tipo, valor) in celulas.items():
+        if tipo == "s":
+            linha[idx] = compartilhados.get(int(valor))
+        elif tipo in ("str", "inlineStr"):
+            linha[idx] = valor
+        elif tipo == "b":
+            linha[idx] = valor == "1"
+        elif tipo == "e":
+            linha[idx] = None
+        else:
+            linha[idx] = float(valor)
+    return _nomes_cabecalho(linha)
+
+
+def ler_cabecalho(conteudo: bytes, sheet=None) -> List[str]:
+    """Lê apenas a primeira linha da aba (nomes das colunas, sem espaços nas bordas)."""
+    try:
+        cabecalho = _cabecalho_xml(conteudo, sheet)
+    except Exception:
+        # Estrutura fora do padrão: deixa o openpyxl resolver
+        cabecalho = None
+    if cabecalho is not None:
+        return cabecalho
+    wb, ws = _abrir_aba(conteudo, sheet)
+    try:
+        for linha in ws.iter_rows(min_row=1, max_row=1, values_only=True):
+            return _nomes_cabecalho(linha)
+        return []
+    finally:
+        wb.close()
+
+
+def identificar_planilha(conteudo: bytes, sheet=None) -> Tuple[str, List[str]]:
+    """Detecta o tipo da planilha só pelo cabeçalho. Retorna (tipo_planilha, colunas)."""
+    cabecalho = ler_cabecalho(conteudo, sheet)
+    return detectar_tipo_por_colunas(cabecalho), cabecalho
+
+
+def _converter_bloco(valores: list, tipo: str) -> pd.Series:
+    """Converte os valores brutos de um bloco para o tipo declarado da coluna."""
+    serie = pd.Series(valores, dtype=object)
+    if tipo == "nota":
+        # Vírgula -> ponto, texto -> float (mesma regra de processar_notas_frequencia)
+        texto = serie.astype(str).str.replace(",", ".", regex=False).str.replace(" ", "", regex=False)
+        return pd.to_numeric(texto, errors="coerce").astype(np.float64)
+    if tipo == "inteiro":
+        return pd.to_numeric(serie, errors="coerce").fillna(0).astype(int)
+    if tipo == "decimal":
+        return pd.to_numeric(serie, errors="coerce").astype(np.float64)
+    if tipo == "bruto":
+        return serie
+    return codificar_categoria(serie)
+
+
+def codificar_categoria(serie: pd.Series) -> pd.Series:
+    """
+    Texto padronizado (mesmo resultado de astype(str).str.strip()) como dtype category.
+
+    A normalização roda só sobre os valores distintos e as categorias ficam
+    em ordem alfabética, então sort_values/groupby ordenam como o texto puro.
+    """
+    codigos, valores = pd.factorize(serie, use_na_sentinel=False)
+    textos = pd.Series(valores, dtype=object).astype(str).str.strip()
+    categorias = pd.Index(sorted(set(textos.dropna())))
+    posicoes = categorias.get_indexer(textos)
+    return pd.Series(
+        pd.Categorical.from_codes(posicoes[codigos], categories=categorias),
+        index=serie.index,
+        name=serie.name,
+    )
+
+
+def _inferir_tipo(serie: pd.Series) -> pd.Series:
+    """Tipo final de uma coluna não declarada (texto numérico vira número, como no pandas)."""
+    serie = serie.infer_objects()
+    if serie.dtype == object or pd.api.types.is_string_dtype(serie):
+        try:
+            return pd.to_numeric(serie)
+        except (ValueError, TypeError):
+            pass
+    return serie
+
+
+def _nomes_unicos(cabecalho: List[str]) -> List[str]:
+    """Renomeia colunas repetidas para 'X.1', 'X.2'... (como o pandas)."""
+    vistos = {}
+    nomes = []
+    for nome in cabecalho:
+        if nome in vistos:
+            vistos[nome] += 1
+            nomes.append(f"{nome}.{vistos[nome]}")
+        else:
+            vistos[nome] = 0
+            nomes.append(nome)
+    return nomes
+
+
+def ler_colunas_streaming(
+    conteudo: bytes,
+    colunas: Dict[str, str],
+    sheet=None,
+    tamanho_bloco: int = TAMANHO_BLOCO,
+    incluir_demais: bool = False,
+) -> Optional[pd.DataFrame]:
+    """
+    Lê só as colunas pedidas, linha a linha, convertendo em blocos.
+
+    O workbook nunca é carregado inteiro: cada bloco de `tamanho_bloco`
+    linhas vira arrays tipados e a lista de valores Python é descartada,
+    então o pico de memória depende do bloco e não do tamanho do arquivo.
+    Com `incluir_demais`, as colunas não declaradas também são lidas, com o
+    tipo inferido ao final. Retorna None se nenhuma coluna for selecionada.
+    """
+    wb, ws = _abrir_aba(conteudo, sheet)
+    try:
+        linhas = ws.iter_rows(values_only=True)
+        cabecalho = _nomes_unicos(_nomes_cabecalho(next(linhas, ())))
+
+        selecionadas = {}
+        for idx, nome in enumerate(cabecalho):
+            if nome in colunas or incluir_demais:
+                selecionadas[nome] = idx
+        if not selecionadas:
+            return None
+        colunas = {nome: colunas.get(nome, "bruto") for nome in selecionadas}
+
+        nomes = list(selecionadas)
+        indices = [selecionadas[n] for n in nomes]
+        largura = max(indices) + 1
+        buffers = [[] for _ in nomes]
+        blocos = {n: [] for n in nomes}
+
+        def fechar_bloco():
+            for nome, buf in zip(nomes, buffers):
+                blocos[nome].append(_converter_bloco(buf, colunas[nome]))
+                buf.clear()
+
+        n_buffer = 0
+        vazias = 0
+        for linha in linhas:
+            # Como no pandas.read_excel: linhas vazias no meio da aba viram linhas
+            # de NaN, as do fim são descartadas (só entram se vier algum dado depois)
+            if not any(v is not None for v in linha):
+                vazias += 1
+                continue
+            if vazias:
+                for buf in buffers:
+                    buf.extend([np.nan] * vazias)
+                n_buffer += vazias
+                vazias = 0
+            if len(linha) < largura:
+                linha = tuple(linha) + (None,) * (largura - len(linha))
+            for buf, idx in zip(buffers, indices):
+                buf.append(_valor_celula(linha[idx]))
+            n_buffer += 1
+            if n_buffer >= tamanho_bloco:
+                fechar_bloco()
+                n_buffer = 0
+        if n_buffer or not blocos[nomes[0]]:
+            fechar_bloco()
+    finally:
+        wb.close()
+
+    dados = {}
+    for nome in nomes:
+        partes = blocos.pop(nome)
+        if len(partes) == 1:
+            serie = partes[0]
+        elif colunas[nome] == "texto":
+            serie = pd.Series(union_categoricals(partes, sort_categories=True))
+        else:
+            serie = pd.concat(partes, ignore_index=True)
+        dados[nome] = _inferir_tipo(serie) if colunas[nome] == "bruto" else serie
+    return pd.DataFrame(dados)
+
+
+def ler_planilha_por_tipo(conteudo: bytes, tipo_planilha: str, sheet=None) -> Optional[pd.DataFrame]:
+    """Leitor específico do tipo detectado (colunas e tipos já declarados)."""
+    colunas, incluir_demais = LEITORES_POR_TIPO.get(tipo_planilha, (COLUNAS_NOTAS_FREQUENCIA, False))
+    return ler_colunas_streaming(conteudo, colunas, sheet, incluir_demais=incluir_demais)
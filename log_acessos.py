@@ -0,0 +1,327 @@
+"""
+Log local de acessos: JSON por linha, só com acréscimos, em segmentos com rotação por tamanho
+
+Uso:
+    python log_acessos.py compactar                 # junta os segmentos fechados
+    python log_acessos.py compactar --duplicados 120
+                                                    # e remove acessos repetidos do mesmo usuário em 120 s
+"""
+import hashlib
+import json
+import math
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+LOG_DIR = os.getenv("PAINEL_LOG_DIR", "logs_acesso")
+SEGMENTO_MAX_BYTES = int(float(os.getenv("PAINEL_LOG_SEGMENTO_MB", "4")) * 1024 * 1024)
+LOG_LEGADO = "local_access_log.json"
+
+# fsync em lote: a cada FSYNC_LINHAS registros ou FSYNC_SEGUNDOS desde o último
+FSYNC_LINHAS = 32
+FSYNC_SEGUNDOS = 2.0
+_BLOCO_LEITURA = 64 * 1024
+_PREFIXO, _SUFIXO = "acessos_", ".jsonl"
+_MARCA_LEGADO = ".legado_importado"
+_ARQUIVO_GERACAO = ".geracao"
+
+
+def chave_registro(registro: Dict) -> str:
+    """Chave determinística do registro: o mesmo acesso tem a mesma chave no log, no índice e no Firebase."""
+    conteudo = json.dumps(registro, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(conteudo).hexdigest()[:20]
+
+
+def _timestamp(registro: dict) -> float:
+    try:
+        return datetime.fromisoformat(registro.get("timestamp", "")).timestamp()
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class LogAcessos:
+    """
+    Cada acesso é uma linha acrescentada ao segmento mais novo com um único
+    write (O_APPEND), sem reler o arquivo. Segmentos que passam de
+    SEGMENTO_MAX_BYTES são fechados e um novo é aberto; as leituras vão do
+    fim do segmento mais novo para trás e param quando têm o que precisam.
+    """
+
+    def __init__(self, pasta: str = LOG_DIR, segmento_max_bytes: int = SEGMENTO_MAX_BYTES,
+                 legado: Optional[str] = LOG_LEGADO):
+        self.pasta = pasta
+        self.segmento_max_bytes = segmento_max_bytes
+        self.legado = legado
+        self._lock = threading.Lock()
+        self._pronto = False
+        self._fd = None
+        self._numero = 0
+        self._pendentes = 0
+        self._ultimo_fsync = 0.0
+        self._fsync_agendado: Optional[threading.Timer] = None
+
+    # --- Segmentos -----------------------------------------------------------
+
+    def _caminho(self, numero: int) -> str:
+        return os.path.join(self.pasta, f"{_PREFIXO}{numero:06d}{_SUFIXO}")
+
+    def segmentos(self) -> List[int]:
+        """Números dos segmentos existentes, do mais antigo ao mais novo."""
+        if not os.path.isdir(self.pasta):
+            return []
+        numeros = []
+        for nome in os.listdir(self.pasta):
+            if nome.startswith(_PREFIXO) and nome.endswith(_SUFIXO):
+                try:
+                    numeros.append(int(nome[len(_PREFIXO):-len(_SUFIXO)]))
+                except ValueError:
+                    pass
+        return sorted(numeros)
+
+    def _preparar(self):
+        """Cria a pasta e, na primeira vez, traz os registros do antigo local_access_log.json."""
+        if self._pronto:
+            return
+        os.makedirs(self.pasta, exist_ok=True)
+        marca = os.path.join(self.pasta, _MARCA_LEGADO)
+        if self.legado and os.path.exists(self.legado) and not os.path.exists(marca):
+            try:
+                with open(self.legado, "r", encoding="utf-8") as f:
+                    antigos = json.load(f)
+            except (OSError, ValueError):
+                antigos = []
+            if antigos and not self.segmentos():
+                self._gravar_segmentos(antigos, 1)
+            open(marca, "w").close()
+        self._pronto = True
+
+    def _abrir(self, numero: int):
+        self._fechar()
+        self._fd = os.open(self._caminho(numero), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._numero = numero
+
+    def _fechar(self):
+        if self._fd is not None:
+            if self._pendentes:
+                os.fsync(self._fd)
+                self._pendentes = 0
+            os.close(self._fd)
+            self._fd = None
+
+    def _rotacionar(self):
+        """Fecha o segmento atual; o próximo registro vai para um segmento novo."""
+        numeros = self.segmentos()
+        self._abrir((numeros[-1] if numeros else 0) + 1)
+
+    def geracao(self) -> int:
+        """Muda sempre que segmentos já escritos são reescritos ou apagados (compactação, limpeza)."""
+        try:
+            with open(os.path.join(self.pasta, _ARQUIVO_GERACAO), "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _nova_geracao(self):
+        caminho = os.path.join(self.pasta, _ARQUIVO_GERACAO)
+        with open(caminho + ".tmp", "w", encoding="utf-8") as f:
+            f.write(str(self.geracao() + 1))
+        os.replace(caminho + ".tmp", caminho)
+
+    def caminho_segmento(self, numero: int) -> str:
+        return self._caminho(numero)
+
+    # --- Escrita -------------------------------------------------------------
+
+    def registrar(self, registro: Dict):
+        """Acrescenta um acesso (uma linha JSON)."""
+        linha = (json.dumps(registro, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._preparar()
+            if self._fd is None:
+                numeros = self.segmentos()
+                self._abrir(numeros[-1] if numeros else 1)
+            if os.fstat(self._fd).st_size >= self.segmento_max_bytes:
+                self._rotacionar()
+            os.write(self._fd, linha)
+            self._pendentes += 1
+            agora = time.monotonic()
+            if self._pendentes >= FSYNC_LINHAS or agora - self._ultimo_fsync >= FSYNC_SEGUNDOS:
+                os.fsync(self._fd)
+                self._pendentes = 0
+                self._ultimo_fsync = agora
+            elif self._fsync_agendado is None:
+                # Sem outro registro, o fsync ainda acontece até FSYNC_SEGUNDOS depois
+                self._fsync_agendado = threading.Timer(FSYNC_SEGUNDOS, self.descarregar)
+                self._fsync_agendado.daemon = True
+                self._fsync_agendado.start()
+
+    def descarregar(self):
+        """fsync do que ainda não foi para o disco."""
+        with self._lock:
+            self._fsync_agendado = None
+            if self._fd is not None and self._pendentes:
+                os.fsync(self._fd)
+                self._pendentes = 0
+                self._ultimo_fsync = time.monotonic()
+
+    # --- Leitura -------------------------------------------------------------
+
+    @staticmethod
+    def _linhas_de_tras(caminho: str) -> Iterator[bytes]:
+        """Linhas do arquivo do fim para o começo, lendo em blocos."""
+        with open(caminho, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            posicao = f.tell()
+            resto = b""
+            while posicao > 0:
+                tamanho = min(_BLOCO_LEITURA, posicao)
+                posicao -= tamanho
+                f.seek(posicao)
+                partes = (f.read(tamanho) + resto).split(b"\n")
+                resto = partes[0]
+                for linha in reversed(partes[1:]):
+                    if linha.strip():
+                        yield linha
+            if resto.strip():
+                yield resto
+
+    def ler_de_tras(self) -> Iterator[Dict]:
+        """Registros do mais recente para o mais antigo (linhas corrompidas são ignoradas)."""
+        self._preparar()
+        for numero in reversed(self.segmentos()):
+            try:
+                for linha in self._linhas_de_tras(self._caminho(numero)):
+                    try:
+                        yield json.loads(linha)
+                    except ValueError:
+                        continue
+            except FileNotFoundError:
+                continue
+
+    def ultimos(self, limite: int) -> List[Dict]:
+        """Os `limite` acessos mais recentes, do mais novo para o mais antigo."""
+        registros = []
+        for registro in self.ler_de_tras():
+            registros.append(registro)
+            if len(registros) >= limite:
+                break
+        registros.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+        return registros
+
+    # --- Manutenção ----------------------------------------------------------
+
+    def _gravar_segmentos(self, registros: List[Dict], primeiro: int, limite: Optional[int] = None) -> int:
+        """
+        Grava `registros` em segmentos cheios a partir de `primeiro`, usando no
+        máximo os números abaixo de `limite` (o último fica maior se preciso).
+        Todos são escritos em temporários antes de trocar qualquer um.
+        """
+        grupos, buffer, tamanho = [], [], 0
+        for registro in registros:
+            linha = json.dumps(registro, ensure_ascii=False) + "\n"
+            buffer.append(linha)
+            tamanho += len(linha.encode("utf-8"))
+            ultimo_livre = limite is not None and primeiro + len(grupos) >= limite - 1
+            if tamanho >= self.segmento_max_bytes and not ultimo_livre:
+                grupos.append(buffer)
+                buffer, tamanho = [], 0
+        if buffer:
+            grupos.append(buffer)
+        temporarios = [self._escrever_temporario(primeiro + i, linhas) for i, linhas in enumerate(grupos)]
+        for i, temporario in enumerate(temporarios):
+            os.replace(temporario, self._caminho(primeiro + i))
+        return primeiro + len(grupos)
+
+    def _escrever_temporario(self, numero: int, linhas: List[str]) -> str:
+        temporario = self._caminho(numero) + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.writelines(linhas)
+            f.flush()
+            os.fsync(f.fileno())
+        return temporario
+
+    def compactar(self, duplicados_segundos: Optional[float] = None, incluir_ativo: bool = False) -> Dict:
+        """
+        Junta os segmentos fechados em segmentos cheios, em ordem de horário,
+        descartando linhas corrompidas e, com `duplicados_segundos`, acessos
+        do mesmo usuário a menos desse intervalo do anterior mantido. Com
+        `incluir_ativo` o segmento em uso é fechado antes e entra também.
+        """
+        with self._lock:
+            self._preparar()
+            if incluir_ativo and self.segmentos():
+                self._rotacionar()
+            numeros = self.segmentos()
+            ativo = numeros[-1] if numeros else None
+            fechados = [n for n in numeros if n != ativo and (self._fd is None or n != self._numero)]
+            if not fechados:
+                return {"segmentos": 0, "registros": 0, "removidos": 0}
+
+            registros, corrompidas = [], 0
+            for numero in fechados:
+                with open(self._caminho(numero), "r", encoding="utf-8") as f:
+                    for linha in f:
+                        if not linha.strip():
+                            continue
+                        try:
+                            registros.append(json.loads(linha))
+                        except ValueError:
+                            corrompidas += 1
+            registros.sort(key=lambda r: r.get("timestamp", ""))
+            total = len(registros)
+            if duplicados_segundos:
+                registros = self._sem_duplicados(registros, duplicados_segundos)
+
+            # Os números a partir do segmento ativo não podem ser usados (a ordem dos segmentos é a do log)
+            limite = min(set(numeros) - set(fechados))
+            proximo = self._gravar_segmentos(registros, fechados[0], limite)
+            for numero in fechados:
+                if numero >= proximo:
+                    os.remove(self._caminho(numero))
+            self._nova_geracao()
+            return {
+                "segmentos": len(fechados),
+                "registros": len(registros),
+                "removidos": total - len(registros) + corrompidas,
+            }
+
+    @staticmethod
+    def _sem_duplicados(registros: List[Dict], segundos: float) -> List[Dict]:
+        """Registros em ordem de horário sem os repetidos; horário ilegível é sempre mantido."""
+        mantidos, ultimo_por_usuario = [], {}
+        for registro in registros:
+            instante = _timestamp(registro)
+            if not math.isnan(instante):
+                anterior = ultimo_por_usuario.get(registro.get("usuario"))
+                if anterior is not None and instante - anterior < segundos:
+                    continue
+                ultimo_por_usuario[registro.get("usuario")] = instante
+            mantidos.append(registro)
+        return mantidos
+
+    def limpar(self):
+        """Apaga todos os segmentos (o log legado não é importado de novo)."""
+        with self._lock:
+            self._preparar()
+            self._fechar()
+            for numero in self.segmentos():
+                os.remove(self._caminho(numero))
+            self._nova_geracao()
+
+
+log_acessos = LogAcessos()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "compactar":
+        print(__doc__.strip())
+        sys.exit(1)
+    segundos = float(sys.argv[sys.argv.index("--duplicados") + 1]) if "--duplicados" in sys.argv else None
+    resultado = log_acessos.compactar(duplicados_segundos=segundos)
+    print(
+        f"✅ {resultado['segmentos']} segmentos compactados: "
+        f"{resultado['registros']} registros mantidos, {resultado['removidos']} removidos"
+    )
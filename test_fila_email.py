@@ -0,0 +1,161 @@
+"""
+Fila de e-mails contra um servidor SMTP local (aiosmtpd): uma sessão por
+lote, nova tentativa com espera crescente depois de um 4xx e lote adiado
+quando o servidor cai
+
+Rodar: python -m pytest -q test_fila_email.py   (precisa do aiosmtpd)
+"""
+import socket
+import sqlite3
+import time
+
+import pytest
+
+pytest.importorskip("aiosmtpd")
+from aiosmtpd.controller import Controller
+
+import fila_email
+from fila_email import ESPERA_BASE, RETENCAO_ENVIADOS, RETENCAO_FALHOS, FilaEmail
+
+
+def porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Caixa:
+    """Handler do aiosmtpd: guarda as mensagens e a sessão de cada uma; recusa com 451 quem estiver em `recusar`."""
+
+    def __init__(self):
+        self.mensagens = []
+        self.recusar = {}   # destinatário -> quantas vezes ainda recusar
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if self.recusar.get(address, 0) > 0:
+            self.recusar[address] -= 1
+            return "451 4.3.0 Tente mais tarde"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        for destinatario in envelope.rcpt_tos:
+            self.mensagens.append((id(session), destinatario))
+        return "250 Message accepted"
+
+
+@pytest.fixture
+def caixa(monkeypatch):
+    caixa = Caixa()
+    porta = porta_livre()
+    controller = Controller(caixa, hostname="127.0.0.1", port=porta)
+    controller.start()
+    monkeypatch.setenv("SMTP_HOST", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(porta))
+    monkeypatch.setenv("SMTP_STARTTLS", "0")
+    monkeypatch.delenv("GMAIL_USER", raising=False)
+    yield caixa
+    controller.stop()
+
+
+@pytest.fixture
+def fila(tmp_path, monkeypatch):
+    monkeypatch.setattr(fila_email, "EMAIL_LOG_FILE", str(tmp_path / "email_log.json"))
+    fila = FilaEmail(str(tmp_path / "fila.db"))
+    # Sem a thread: os testes chamam processar_lote
+    monkeypatch.setattr(fila, "iniciar", lambda: None)
+    yield fila
+    fila.parar()
+
+
+def linhas(fila):
+    conexao = sqlite3.connect(fila.caminho)
+    conexao.row_factory = sqlite3.Row
+    try:
+        return {linha["destinatario"]: dict(linha) for linha in conexao.execute("SELECT * FROM emails")}
+    finally:
+        conexao.close()
+
+
+def vencer(fila):
+    """Antecipa as novas tentativas (como se a espera tivesse passado)."""
+    conexao = sqlite3.connect(fila.caminho)
+    try:
+        conexao.execute("UPDATE emails SET proxima_tentativa = 0 WHERE status = 'pendente'")
+        conexao.commit()
+    finally:
+        conexao.close()
+
+
+def test_lote_enviado_numa_sessao_smtp(caixa, fila):
+    destinatarios = [f"usuario{i}@escola.com" for i in range(5)]
+    fila.enfileirar_lote(destinatarios, "Relatório", "Código: 123456")
+
+    assert fila.processar_lote() == 5
+    assert [destinatario for _, destinatario in caixa.mensagens] == destinatarios
+    assert len({sessao for sessao, _ in caixa.mensagens}) == 1
+    assert fila.situacao() == {"enviado": 5}
+    # O corpo (pode ter código de login) não fica guardado depois do envio
+    assert {linha["corpo"] for linha in linhas(fila).values()} == {""}
+    assert fila.processar_lote() == 0
+
+
+def test_4xx_volta_para_fila_com_espera_crescente(caixa, fila):
+    caixa.recusar["lento@escola.com"] = 2
+    fila.enfileirar_lote(["a@escola.com", "lento@escola.com", "b@escola.com"], "Aviso", "Olá")
+
+    for tentativa in (1, 2):
+        antes = time.time()
+        fila.processar_lote()
+        lento = linhas(fila)["lento@escola.com"]
+        assert lento["status"] == "pendente" and lento["tentativas"] == tentativa
+        assert "451" in lento["erro"]
+        espera = lento["proxima_tentativa"] - antes
+        assert ESPERA_BASE * 2 ** (tentativa - 1) <= espera < ESPERA_BASE * 2 ** (tentativa - 1) + 5
+        # Ainda não venceu: nada sai da fila
+        assert fila.processar_lote() == 0
+        vencer(fila)
+
+    # Erro da mensagem não para o lote nem derruba a sessão
+    assert [destinatario for _, destinatario in caixa.mensagens] == ["a@escola.com", "b@escola.com"]
+    assert fila.processar_lote() == 1
+    assert fila.situacao() == {"enviado": 3}
+    assert caixa.mensagens[-1][1] == "lento@escola.com"
+
+
+def test_servidor_fora_do_ar_adia_o_resto_do_lote(fila, monkeypatch):
+    monkeypatch.setenv("SMTP_HOST", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(porta_livre()))
+    monkeypatch.setenv("SMTP_STARTTLS", "0")
+    monkeypatch.delenv("GMAIL_USER", raising=False)
+    destinatarios = ["a@escola.com", "b@escola.com", "c@escola.com"]
+    fila.enfileirar_lote(destinatarios, "Aviso", "Olá")
+
+    antes = time.time()
+    assert fila.processar_lote() == 3
+    assert fila.erro_servidor
+    registros = linhas(fila)
+    # Só o primeiro foi tentado; os outros voltam para a fila com a mesma espera, sem contar tentativa
+    assert registros["a@escola.com"]["tentativas"] == 1 and registros["a@escola.com"]["erro"]
+    for destinatario in destinatarios[1:]:
+        assert registros[destinatario]["tentativas"] == 0 and registros[destinatario]["erro"] is None
+    for registro in registros.values():
+        assert registro["status"] == "pendente"
+        assert ESPERA_BASE <= registro["proxima_tentativa"] - antes < ESPERA_BASE + 5
+    assert fila.processar_lote() == 0
+
+
+def test_limpar_apaga_enviados_e_falhos_antigos(caixa, fila):
+    fila.enfileirar_lote(["a@escola.com", "b@escola.com"], "Aviso", "Olá")
+    fila.processar_lote()
+    conexao = sqlite3.connect(fila.caminho)
+    conexao.execute("UPDATE emails SET status = 'falhou' WHERE destinatario = 'b@escola.com'")
+    conexao.commit()
+    conexao.close()
+
+    agora = time.time()
+    assert fila.limpar(agora) == 0
+    assert fila.limpar(agora + RETENCAO_ENVIADOS + 1) == 1
+    assert fila.situacao() == {"falhou": 1}
+    assert fila.limpar(agora + RETENCAO_FALHOS + 1) == 1
+    assert fila.situacao() == {}
@@ -0,0 +1,193 @@
+"""
+Fila de gravação no Firebase contra um db.reference falso: lote num único
+update() de vários caminhos, memória cheia indo para o disco, retomada do
+`.enviando` depois de uma queda e nova tentativa com espera crescente;
+`sincronizar` repetido (ou depois do índice refeito) não duplica nada
+
+Rodar: python -m pytest -q test_fila_firebase.py
+"""
+import json
+import time
+
+import pytest
+
+import fila_firebase
+import firebase_config
+from fila_firebase import FilaFirebase, sincronizar
+from firebase_config import FirebaseManager
+from indice_acessos import IndiceAcessos
+from log_acessos import LogAcessos, chave_registro
+
+
+class ReferenciaFalsa:
+    def __init__(self, banco, caminho):
+        self.banco, self.caminho = banco, caminho
+
+    def update(self, atualizacoes):
+        if self.banco.falhas:
+            self.banco.falhas -= 1
+            raise ConnectionError("Firebase fora do ar")
+        self.banco.updates.append(dict(atualizacoes))
+        self.banco.dados.setdefault(self.caminho, {}).update(atualizacoes)
+
+
+class BancoFalso:
+    """Substitui firebase_admin.db: conta referências (uma por tentativa) e updates."""
+
+    def __init__(self):
+        self.dados = {}
+        self.updates = []
+        self.referencias = 0
+        self.falhas = 0   # próximos updates que falham
+
+    def reference(self, caminho):
+        self.referencias += 1
+        return ReferenciaFalsa(self, caminho)
+
+
+@pytest.fixture
+def banco(monkeypatch):
+    banco = BancoFalso()
+    monkeypatch.setattr(firebase_config, "db", banco, raising=False)
+    return banco
+
+
+@pytest.fixture
+def nova_fila(tmp_path, monkeypatch):
+    """Fila gravando pelo FirebaseManager (db.reference('access_logs').update), sem a thread."""
+    filas = []
+
+    def nova(**opcoes):
+        fila = FilaFirebase(FirebaseManager()._gravar_firebase, arquivo=str(tmp_path / "fila.jsonl"), **opcoes)
+        monkeypatch.setattr(fila, "iniciar", lambda: None)
+        filas.append(fila)
+        return fila
+
+    yield nova
+    for fila in filas:
+        fila.parar()
+
+
+def acessos(quantidade, inicio=0):
+    return [{"usuario": f"u{i}", "ip": "10.0.0.1", "timestamp": f"2026-03-02T08:{i:02d}:00"}
+            for i in range(inicio, inicio + quantidade)]
+
+
+def test_lote_num_unico_update_de_varios_caminhos(banco, nova_fila):
+    fila = nova_fila(lote_max=4)
+    registros = acessos(6)
+    chaves = [fila.enfileirar(registro) for registro in registros]
+
+    assert chaves == [chave_registro(registro) for registro in registros]
+    assert fila.descarregar() == 6
+    assert [list(update) for update in banco.updates] == [chaves[:4], chaves[4:]]
+    assert banco.dados["access_logs"] == dict(zip(chaves, registros))
+    assert fila.pendentes() == 0 and fila.enviados == 6
+
+
+def test_memoria_cheia_vai_para_o_disco(banco, nova_fila):
+    fila = nova_fila(memoria_max=3)
+    registros = acessos(5)
+    for registro in registros:
+        fila.enfileirar(registro)
+
+    with open(fila.arquivo, encoding="utf-8") as f:
+        assert [json.loads(linha)["registro"] for linha in f] == registros[:3]
+    assert fila.pendentes() == 5
+
+    # O disco (mais antigo) sai antes da memória
+    assert fila.descarregar() == 5
+    assert [list(update.values()) for update in banco.updates] == [registros[:3], registros[3:]]
+    assert fila.pendentes() == 0
+
+
+def test_retoma_o_enviando_de_uma_queda(banco, nova_fila, tmp_path):
+    # Queda no meio de um envio: o lote ficou em .enviando (última linha pela metade) e o arquivo já tinha outros
+    interrompidos, seguintes = acessos(2), acessos(2, inicio=10)
+    with open(tmp_path / "fila.jsonl.enviando", "w", encoding="utf-8") as f:
+        for registro in interrompidos:
+            f.write(json.dumps({"chave": chave_registro(registro), "registro": registro}) + "\n")
+        f.write('{"chave": "abc", "regis')
+    with open(tmp_path / "fila.jsonl", "w", encoding="utf-8") as f:
+        for registro in seguintes:
+            f.write(json.dumps({"chave": chave_registro(registro), "registro": registro}) + "\n")
+
+    fila = nova_fila()
+    assert fila.pendentes() == 4
+    assert fila.descarregar() == 2
+    assert not (tmp_path / "fila.jsonl.enviando").exists()
+    assert fila.descarregar() == 2
+    assert [list(update.values()) for update in banco.updates] == [interrompidos, seguintes]
+
+    # Reenviar o mesmo lote não duplica: as chaves são as mesmas
+    fila.enfileirar(interrompidos[0])
+    fila.descarregar()
+    assert len(banco.dados["access_logs"]) == 4
+
+
+def test_falha_transitoria_espera_e_reconecta(banco, nova_fila):
+    fila = nova_fila()
+    banco.falhas = 2
+    registros = acessos(3)
+    for registro in registros:
+        fila.enfileirar(registro)
+
+    for falha, espera in ((1, 1.0), (2, 2.0)):
+        antes = time.monotonic()
+        assert fila.descarregar() == 0
+        assert fila.falhas_seguidas == falha and "fora do ar" in fila.ultimo_erro
+        assert espera <= fila._proxima_tentativa - antes < espera + 0.5
+        # O lote que falhou vai para o disco, nada se perde
+        assert fila.pendentes() == 3
+
+    assert fila.descarregar() == 3
+    assert fila.falhas_seguidas == 0 and fila.ultimo_erro is None
+    # Uma referência nova por tentativa (nada preso a uma conexão que caiu)
+    assert banco.referencias == 3
+    assert list(banco.dados["access_logs"].values()) == registros
+
+
+def test_laco_respeita_a_espera_depois_da_falha(banco, tmp_path, monkeypatch):
+    monkeypatch.setattr(fila_firebase, "ESPERA_INICIAL", 0.3)
+    fila = FilaFirebase(FirebaseManager()._gravar_firebase, arquivo=str(tmp_path / "fila.jsonl"), intervalo=0.05)
+    banco.falhas = 1
+    try:
+        inicio = time.monotonic()
+        fila.enfileirar(acessos(1)[0])
+        limite = inicio + 5
+        while not banco.updates and time.monotonic() < limite:
+            time.sleep(0.02)
+        assert banco.updates, "a fila não tentou de novo"
+        assert time.monotonic() - inicio >= 0.3
+        assert banco.referencias == 2
+    finally:
+        fila.parar()
+
+
+def test_sincronizar_e_idempotente_pela_chave(banco, tmp_path):
+    log = LogAcessos(pasta=str(tmp_path / "logs"), legado=None)
+    indice = IndiceAcessos(log, str(tmp_path / "indice.db"))
+    gravar = FirebaseManager()._gravar_firebase
+    registros = acessos(5)
+    for registro in registros:
+        log.registrar(registro)
+
+    resultado = sincronizar(indice, gravar, lote_max=2)
+    assert (resultado["enviados"], resultado["lotes"]) == (5, 3)
+    # Mesma chave da fila: um acesso enviado pelos dois caminhos fica uma vez só
+    assert banco.dados["access_logs"] == {chave_registro(registro): registro for registro in registros}
+
+    assert sincronizar(indice, gravar, lote_max=2)["enviados"] == 0
+    log.registrar(acessos(1, inicio=5)[0])
+    assert sincronizar(indice, gravar, lote_max=2)["enviados"] == 1
+    updates = len(banco.updates)
+
+    # Índice refeito (compactação muda os ids): o que já foi enviado continua marcado
+    log.compactar(incluir_ativo=True)
+    assert sincronizar(indice, gravar, lote_max=2)["enviados"] == 0
+    assert len(banco.updates) == updates
+
+    # Marca perdida: reenviar tudo sobrescreve as mesmas chaves
+    indice.esquecer_sincronizados()
+    assert sincronizar(indice, gravar, lote_max=2)["enviados"] == 6
+    assert len(banco.dados["access_logs"]) == 6
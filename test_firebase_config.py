@@ -0,0 +1,102 @@
+"""
+Leitura dos acessos do Firebase para o índice do admin: em páginas por
+timestamp (nunca o nó inteiro de uma vez), continuando de onde parou, e
+depois só os novos
+
+Rodar: python -m pytest -q test_firebase_config.py
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import firebase_config
+from firebase_config import FirebaseManager
+from indice_acessos import IndiceAcessos
+from log_acessos import LogAcessos
+
+
+class ConsultaFalsa:
+    """order_by_child('timestamp').start_at(...).limit_to_first(...).get() sobre um dict em memória."""
+
+    def __init__(self, banco, inicio=None, limite=None):
+        self.banco, self.inicio, self.limite = banco, inicio, limite
+
+    def order_by_child(self, campo):
+        assert campo == "timestamp"
+        return self
+
+    def start_at(self, valor):
+        return ConsultaFalsa(self.banco, valor, self.limite)
+
+    def limit_to_first(self, limite):
+        return ConsultaFalsa(self.banco, self.inicio, limite)
+
+    def get(self):
+        assert self.limite is not None, "leitura sem limite"
+        itens = sorted(self.banco.dados.items(), key=lambda item: item[1]["timestamp"])
+        itens = [(k, v) for k, v in itens if self.inicio is None or v["timestamp"] >= self.inicio]
+        self.banco.lidos.append((self.inicio, len(itens[:self.limite])))
+        return dict(itens[:self.limite])
+
+
+class BancoFalso:
+    def __init__(self):
+        self.dados = {}
+        self.lidos = []   # (start_at, registros devolvidos) por leitura
+
+    def reference(self, caminho):
+        assert caminho == "access_logs"
+        return ConsultaFalsa(self)
+
+    def acrescentar(self, quantidade, inicio, passo=timedelta(minutes=1)):
+        for i in range(quantidade):
+            timestamp = (inicio + i * passo).isoformat()
+            self.dados[f"k{len(self.dados):05d}"] = {"usuario": f"u{i % 3}", "ip": "10.0.0.1", "timestamp": timestamp}
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    banco = BancoFalso()
+    indice = IndiceAcessos(LogAcessos(pasta=str(tmp_path / "logs"), legado=None), str(tmp_path / "indice.db"))
+    monkeypatch.setattr(firebase_config, "db", banco, raising=False)
+    monkeypatch.setattr(firebase_config, "indice_acessos", indice)
+    monkeypatch.setattr(firebase_config, "FIREBASE_PAGINA", 4)
+    return banco
+
+
+@pytest.fixture
+def manager():
+    manager = FirebaseManager()
+    manager.initialized = manager.firebase_connected = True
+    return manager
+
+
+def test_carga_inicial_em_paginas(banco, manager):
+    banco.acrescentar(10, datetime(2026, 3, 2, 8))
+
+    manager._atualizar_do_firebase()
+    assert banco.lidos == [(None, 4)]
+    # Página cheia: as próximas chamadas continuam do último timestamp (inclusive) sem esperar o intervalo
+    for _ in range(3):
+        manager._atualizar_do_firebase()
+    assert [inicio[11:16] for inicio, _ in banco.lidos[1:]] == ["08:03", "08:06", "08:09"]
+    assert [lidos for _, lidos in banco.lidos] == [4, 4, 4, 1]
+    assert manager._firebase_cursor is None
+    assert firebase_config.indice_acessos.resumo()["total"] == 10
+
+    # Carga completa: até o intervalo passar, nada é lido
+    manager._atualizar_do_firebase()
+    assert len(banco.lidos) == 4
+
+
+def test_depois_da_carga_le_so_a_janela_recente(banco, manager):
+    banco.acrescentar(3, datetime(2026, 3, 1, 8), passo=timedelta(days=2))
+    manager._atualizar_do_firebase()
+    banco.acrescentar(2, datetime(2026, 3, 6, 8))
+
+    manager._firebase_lido_em = 0.0
+    manager._atualizar_do_firebase()
+    # Relê as 24 h antes do último já trazido (5/3 8h): o acesso de 5/3 e os dois novos
+    assert banco.lidos == [(None, 3), ("2026-03-04T08:00:00", 3)]
+    assert manager._firebase_cursor is None
+    assert firebase_config.indice_acessos.resumo()["total"] == 5
@@ -0,0 +1,121 @@
+"""
+Indicadores pré-calculados por planilha: filtrar o resultado tem que dar o
+mesmo que calcular sobre as linhas filtradas (quando `exato`)
+
+Rodar: python -m pytest -q test_indicadores.py
+"""
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicadores import ResumoNotasBaixas, calcula_indicadores, indicadores_exatos, mapear_bimestres
+
+COLUNAS_TEXTO = ["Escola", "Turma", "Aluno", "Disciplina", "Status", "Periodo"]
+PERIODOS = ["Primeiro Bimestre", "Segundo Bimestre", "Terceiro Bimestre"]
+
+
+def carga(linhas):
+    """Linhas (Escola, Turma, Aluno, Disciplina, Status, Periodo, Nota) no formato de processar_notas_frequencia."""
+    df = pd.DataFrame(linhas, columns=COLUNAS_TEXTO + ["Nota"])
+    for coluna in COLUNAS_TEXTO:
+        df[coluna] = df[coluna].astype("category")
+    df["Bimestre"] = mapear_bimestres(df["Periodo"])
+    return df
+
+
+def turmas():
+    """Duas escolas, dois alunos por turma, duas disciplinas, três bimestres; notas variadas."""
+    rng = np.random.default_rng(7)
+    linhas = []
+    alunos = {
+        ("ESCOLA A", "6A"): [("Ana", "Cursando"), ("Bruno", "Cursando")],
+        ("ESCOLA A", "7A"): [("Caio", "Transferido"), ("Duda", "Cursando")],
+        ("ESCOLA B", "6A"): [("Eva", "Cursando"), ("Ana", "Desistente")],
+    }
+    for (escola, turma), nomes in alunos.items():
+        for (aluno, status), disciplina in itertools.product(nomes, ["MAT", "POR"]):
+            for periodo in PERIODOS:
+                linhas.append([escola, turma, aluno, disciplina, status, periodo, float(rng.integers(0, 11))])
+    # Período não reconhecido fica fora dos indicadores
+    linhas.append(["ESCOLA A", "6A", "Ana", "MAT", "Cursando", "Recuperação", 10.0])
+    return linhas
+
+
+def filtrar(frame, filtros):
+    """Mesma regra dos filtros da barra lateral (valor ou lista de valores por coluna)."""
+    mascara = np.ones(len(frame), dtype=bool)
+    for coluna, valores in filtros.items():
+        mascara &= frame[coluna].isin(valores).to_numpy()
+    return frame[mascara]
+
+
+FILTROS = [
+    {},
+    {"Escola": ["ESCOLA A"]},
+    {"Status": ["Cursando"]},
+    {"Status": ["Transferido", "Desistente"]},
+    {"Turma": ["6A"]},
+    {"Disciplina": ["POR"]},
+    {"Aluno": ["Ana"]},
+    {"Escola": ["ESCOLA A"], "Status": ["Cursando"], "Turma": ["7A"], "Disciplina": ["MAT"]},
+]
+
+
+def test_um_status_por_aluno_disciplina_e_exato():
+    df = carga(turmas())
+    assert indicadores_exatos(df, calcula_indicadores(df, por_status=True))
+
+
+@pytest.mark.parametrize("filtros", FILTROS, ids=lambda f: "-".join(f) or "sem_filtro")
+def test_filtrar_pre_calculado_igual_ao_calculo_filtrado(filtros):
+    df = carga(turmas())
+    completo = calcula_indicadores(df, por_status=True)
+    obtido = filtrar(completo, filtros).drop(columns="Status").reset_index(drop=True)
+    esperado = calcula_indicadores(filtrar(df, filtros))
+    pd.testing.assert_frame_equal(obtido, esperado)
+
+
+def test_dois_status_no_mesmo_aluno_disciplina_nao_e_exato():
+    # Bruno foi transferido no 3º bimestre: o par (Bruno, MAT) aparece com dois Status
+    linhas = turmas()
+    for linha in linhas:
+        if linha[2] == "Bruno" and linha[3] == "MAT" and linha[5] == "Terceiro Bimestre":
+            linha[4] = "Transferido"
+    df = carga(linhas)
+    completo = calcula_indicadores(df, por_status=True)
+    assert not indicadores_exatos(df, completo)
+
+    # É o caso em que filtrar o pré-calculado não serve: sem filtro, o par vira duas
+    # linhas (uma por Status), e o painel recalcula sobre as linhas filtradas
+    esperado = calcula_indicadores(df)
+    bruno = esperado[(esperado["Aluno"] == "Bruno") & (esperado["Disciplina"] == "MAT")]
+    assert len(bruno) == 1 and bruno[["N1", "N2", "N3"]].notna().all(axis=None)
+    assert len(completo.drop(columns="Status")) == len(esperado) + 1
+
+
+def test_status_vazio_nao_e_exato():
+    linhas = turmas()
+    linhas[0][4] = None
+    df = carga(linhas)
+    assert not indicadores_exatos(df, calcula_indicadores(df, por_status=True))
+
+
+@pytest.mark.parametrize("coluna_aluno", ["Aluno", None])
+def test_notas_baixas_iguais_a_filtrar_por_bimestre(coluna_aluno):
+    df = carga(turmas())
+    if coluna_aluno is None:
+        df = df.drop(columns="Aluno")
+    resumo = ResumoNotasBaixas(df, coluna_aluno)
+    for bimestre, periodo in enumerate(PERIODOS, start=1):
+        baixas = df[(df["Periodo"] == periodo) & (df["Nota"] < 6)]
+        assert resumo.qtd_notas(bimestre) == len(baixas)
+        # Sem coluna de aluno só as notas contam
+        alunos = set(baixas[coluna_aluno].unique()) if coluna_aluno else set()
+        assert resumo.alunos(bimestre) == alunos
+        assert resumo.qtd_alunos(bimestre) == len(alunos)
+    baixas = df[df["Periodo"].isin(PERIODOS) & (df["Nota"] < 6)]
+    esperado = baixas.groupby("Disciplina", observed=True)["Nota"].count()
+    obtido = resumo.por_disciplina([1, 2, 3]).set_index("Disciplina")[ResumoNotasBaixas.COLUNA_QTD]
+    assert obtido.to_dict() == esperado.to_dict()
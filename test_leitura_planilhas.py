@@ -0,0 +1,253 @@
+"""
+Paridade da leitura em streaming (leitura_planilhas) com pandas.read_excel,
+sobre planilhas geradas no próprio teste
+
+Rodar: python -m pytest -q test_leitura_planilhas.py
+"""
+import zipfile
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+import leitura_planilhas
+from leitura_planilhas import (
+    COLUNAS_NOTAS_FREQUENCIA,
+    LEITORES_POR_TIPO,
+    detectar_tipo_por_colunas,
+    identificar_planilha,
+    ler_cabecalho,
+    ler_colunas_streaming,
+    ler_planilha_por_tipo,
+)
+
+
+def planilha(linhas, mesclar=()):
+    """Bytes de um .xlsx com `linhas` na primeira aba (None = célula vazia)."""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for linha in linhas:
+        ws.append(linha)
+    for intervalo in mesclar:
+        ws.merge_cells(intervalo)
+    saida = BytesIO()
+    wb.save(saida)
+    return saida.getvalue()
+
+
+_XML = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PKG = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+
+def planilha_textos_compartilhados(linhas, mesclar=()):
+    """
+    Como o Excel grava (o openpyxl grava texto inline): textos na tabela
+    sharedStrings, linhas vazias ausentes do XML. Uma tupla de textos vira
+    texto com formatação (vários trechos <r>).
+    """
+    textos, xml_linhas = [], []
+    for i, linha in enumerate(linhas, start=1):
+        celulas = []
+        for j, valor in enumerate(linha):
+            referencia = f"{chr(65 + j)}{i}"
+            if valor is None:
+                continue
+            if isinstance(valor, (str, tuple)):
+                celulas.append(f'<c r="{referencia}" t="s"><v>{len(textos)}</v></c>')
+                textos.append(valor)
+            else:
+                celulas.append(f'<c r="{referencia}"><v>{valor}</v></c>')
+        if celulas:
+            xml_linhas.append(f'<row r="{i}">{"".join(celulas)}</row>')
+    itens = []
+    for texto in textos:
+        if isinstance(texto, tuple):
+            itens.append("<si>" + "".join(f"<r><t>{escape(p)}</t></r>" for p in texto) + "</si>")
+        else:
+            itens.append(f"<si><t>{escape(texto)}</t></si>")
+    largura = max(len(linha) for linha in linhas)
+    mescladas = "".join(f'<mergeCell ref="{m}"/>' for m in mesclar)
+    arquivos = {
+        "[Content_Types].xml": _XML + (
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+            "</Types>"
+        ),
+        "_rels/.rels": _XML + (
+            f'<Relationships xmlns="{_PKG}"><Relationship Id="rId1" Target="xl/workbook.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/></Relationships>'
+        ),
+        "xl/workbook.xml": _XML + (
+            f'<workbook xmlns="{_MAIN}" xmlns:r="{_REL}"><sheets>'
+            '<sheet name="Plan1" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ),
+        "xl/_rels/workbook.xml.rels": _XML + (
+            f'<Relationships xmlns="{_PKG}">'
+            f'<Relationship Id="rId1" Type="{_REL}/worksheet" Target="worksheets/sheet1.xml"/>'
+            f'<Relationship Id="rId2" Type="{_REL}/sharedStrings" Target="sharedStrings.xml"/>'
+            "</Relationships>"
+        ),
+        "xl/sharedStrings.xml": _XML + (
+            f'<sst xmlns="{_MAIN}" count="{len(itens)}" uniqueCount="{len(itens)}">{"".join(itens)}</sst>'
+        ),
+        "xl/worksheets/sheet1.xml": _XML + (
+            f'<worksheet xmlns="{_MAIN}"><dimension ref="A1:{chr(64 + largura)}{len(linhas)}"/>'
+            f'<sheetData>{"".join(xml_linhas)}</sheetData>'
+            + (f"<mergeCells>{mescladas}</mergeCells>" if mescladas else "")
+            + "</worksheet>"
+        ),
+    }
+    saida = BytesIO()
+    with zipfile.ZipFile(saida, "w") as zf:
+        for nome, texto in arquivos.items():
+            zf.writestr(nome, texto)
+    return saida.getvalue()
+
+
+NOTAS = [
+    ["Escola", " Turma ", "Aluno", "Periodo", "Disciplina", "Nota", "Falta", "Frequencia", "Obs"],
+    ["ESCOLA A", "6A", "Ana", "Primeiro Bimestre", "MAT", 7.5, 2, 95.5, "x"],
+    ["ESCOLA A", "6A", " Bruno ", "Primeiro Bimestre", "MAT", "5,5", None, 80, None],
+    [None] * 9,
+    ["ESCOLA B", 7, "Caio", "Segundo Bimestre", "POR", None, 1.0, None, "y"],
+    ["ESCOLA B", "7B", "Duda", "Segundo Bimestre", "POR", 10, 0, 100],
+]
+
+CENSO = [
+    ["Código", "INEP", "Escola", "Nome", "Situação da Matrícula", "Turno", "CPF", "Email",
+     "Telefone", "Bairro", "Ano/Série", "Idade"],
+    [1, 17012345, "ESCOLA A", " Ana ", "Matriculado", "Manhã", "000.111.222-33", "a@x.com", "NA", "Centro", "6º", 11],
+    [2, 17012345, "ESCOLA A", "Bruno", "Transferido", "Tarde", None, "#N/A", "9999", "Sul", "7º", "12"],
+    [3, 17099999, "ESCOLA B", "Caio", "Matriculado", None, "000.111.222-44", None, None, "Norte", "6º", 12.0],
+]
+
+CONTEUDO = [
+    ["Componente Curricular", "Atividade/Conteúdo", "Situação", "Data", "Horário"],
+    ["MAT", "Frações", "Aplicado", "01/03/2024", "07:00"],
+    ["POR", "Leitura", "Pendente", None, 8],
+]
+
+CABECALHO_EM_BRANCO = [[None, None, None], ["Escola", "Turma", "Aluno"], ["A", "6A", "Ana"]]
+
+
+def referencia(conteudo):
+    """O que o painel obtinha antes: pandas.read_excel e as conversões de processar_notas_frequencia."""
+    df = pd.read_excel(BytesIO(conteudo))
+    df.columns = [str(c).strip() for c in df.columns]
+    df = df[[c for c in df.columns if c in COLUNAS_NOTAS_FREQUENCIA]]
+    for coluna in df.columns:
+        tipo = COLUNAS_NOTAS_FREQUENCIA[coluna]
+        if tipo == "nota":
+            texto = df[coluna].astype(str).str.replace(",", ".", regex=False).str.replace(" ", "", regex=False)
+            df[coluna] = pd.to_numeric(texto, errors="coerce")
+        elif tipo == "inteiro":
+            df[coluna] = pd.to_numeric(df[coluna], errors="coerce").fillna(0).astype(int)
+        elif tipo == "decimal":
+            df[coluna] = pd.to_numeric(df[coluna], errors="coerce").astype(np.float64)
+        else:
+            df[coluna] = df[coluna].astype(str).str.strip()
+    return df.reset_index(drop=True)
+
+
+def comparar(obtido, esperado):
+    """Mesmas colunas e valores (texto comparado como texto, qualquer que seja o dtype)."""
+    assert list(obtido.columns) == list(esperado.columns)
+    for coluna in esperado.columns:
+        a, b = obtido[coluna], esperado[coluna]
+        if COLUNAS_NOTAS_FREQUENCIA.get(coluna) == "texto":
+            a, b = a.astype(str), b.astype(str)
+        pd.testing.assert_series_equal(a.reset_index(drop=True), b, check_names=False)
+
+
+@pytest.mark.parametrize("tamanho_bloco", [1, 2, 50_000])
+def test_streaming_igual_ao_read_excel(tamanho_bloco):
+    conteudo = planilha(NOTAS)
+    obtido = ler_colunas_streaming(conteudo, COLUNAS_NOTAS_FREQUENCIA, tamanho_bloco=tamanho_bloco)
+    comparar(obtido, referencia(conteudo))
+    # A linha vazia do meio continua (NaN), como no pandas
+    assert len(obtido) == 5
+
+
+def test_linhas_vazias_do_fim_sao_descartadas():
+    conteudo = planilha(NOTAS[:3] + [[None] * 9, [None] * 9])
+    obtido = ler_colunas_streaming(conteudo, COLUNAS_NOTAS_FREQUENCIA)
+    comparar(obtido, referencia(conteudo))
+    assert len(obtido) == 2
+
+
+def test_coluna_repetida_usa_a_primeira():
+    conteudo = planilha([["Aluno", "Nota", "Nota"], ["Ana", 7, 3], ["Bia", "8,5", 1]])
+    obtido = ler_colunas_streaming(conteudo, COLUNAS_NOTAS_FREQUENCIA)
+    esperado = pd.read_excel(BytesIO(conteudo))
+    assert list(obtido.columns) == ["Aluno", "Nota"]
+    assert obtido["Nota"].tolist() == [7.0, 8.5]
+    assert list(esperado.columns) == ["Aluno", "Nota", "Nota.1"]
+
+
+def test_sem_colunas_conhecidas_volta_para_o_read_excel():
+    # None faz carregar_dados usar pandas.read_excel
+    assert ler_colunas_streaming(planilha([["A", "B"], [1, 2]]), COLUNAS_NOTAS_FREQUENCIA) is None
+
+
+@pytest.mark.parametrize("linhas, mesclar", [
+    (NOTAS, ()),
+    ([["Escola", None, 2023, 1.5, "Nota"], ["A", 1, 2, 3, 4]], ()),
+    ([["Identificação", None, "Aluno", "Nota"], ["A", "6A", "Ana", 7]], ["A1:B1"]),
+    (CABECALHO_EM_BRANCO, ()),
+    ([["Escola", ("Dis", "ciplina"), "Aluno & Cia"], ["A", "MAT", "Ana"]], ()),
+], ids=["notas", "celulas_vazias", "mesclado", "linha_em_branco", "texto_formatado"])
+@pytest.mark.parametrize("gerar", [planilha, planilha_textos_compartilhados])
+@pytest.mark.parametrize("pelo_openpyxl", [False, True], ids=["xml", "openpyxl"])
+def test_cabecalho_igual_ao_read_excel(linhas, mesclar, gerar, pelo_openpyxl, monkeypatch):
+    if pelo_openpyxl:
+        # Caminho de reserva: XML fora do padrão
+        def falhar(*args):
+            raise KeyError("rId1")
+        monkeypatch.setattr(leitura_planilhas, "_cabecalho_xml", falhar)
+    if gerar is planilha:
+        linhas = [[("".join(v) if isinstance(v, tuple) else v) for v in linha] for linha in linhas]
+    conteudo = gerar(linhas, mesclar)
+    esperado = [str(c).strip() for c in pd.read_excel(BytesIO(conteudo)).columns]
+    assert ler_cabecalho(conteudo) == esperado
+
+
+@pytest.mark.parametrize("linhas, tipo", [
+    (NOTAS, "notas_frequencia"),
+    (CENSO, "censo_escolar"),
+    (CONTEUDO, "conteudo_aplicado"),
+    (CABECALHO_EM_BRANCO, "notas_frequencia"),
+], ids=["notas", "censo", "conteudo", "linha_em_branco"])
+@pytest.mark.parametrize("gerar", [planilha, planilha_textos_compartilhados])
+def test_tipo_igual_ao_read_excel(linhas, tipo, gerar):
+    conteudo = gerar(linhas)
+    assert detectar_tipo_por_colunas(pd.read_excel(BytesIO(conteudo)).columns) == tipo
+    assert identificar_planilha(conteudo)[0] == tipo
+
+
+@pytest.mark.parametrize("linhas, tipo", [
+    (CENSO, "censo_escolar"),
+    (CONTEUDO, "conteudo_aplicado"),
+], ids=["censo", "conteudo"])
+@pytest.mark.parametrize("gerar", [planilha, planilha_textos_compartilhados])
+def test_planilha_completa_igual_ao_read_excel(linhas, tipo, gerar):
+    """Censo e conteúdo leem todas as colunas: texto declarado como texto, o resto inferido como no pandas."""
+    conteudo = gerar(linhas)
+    obtido = ler_planilha_por_tipo(conteudo, tipo)
+    esperado = pd.read_excel(BytesIO(conteudo))
+    esperado.columns = [str(c).strip() for c in esperado.columns]
+    declaradas = LEITORES_POR_TIPO[tipo][0]
+    assert list(obtido.columns) == list(esperado.columns)
+    for coluna in esperado.columns:
+        if declaradas.get(coluna) == "texto":
+            assert obtido[coluna].astype(str).tolist() == esperado[coluna].astype(str).str.strip().tolist()
+        else:
+            pd.testing.assert_series_equal(obtido[coluna], esperado[coluna], check_names=False)
@@ -0,0 +1,90 @@
+"""
+Base de usuários em SQLite: importar → trocar senha → exportar tem que
+devolver a planilha com as mesmas colunas, e a reimportação automática
+(planilha alterada) não pode perder senha trocada no painel
+
+Rodar: python -m pytest -q test_usuarios.py
+"""
+import os
+
+import pandas as pd
+import pytest
+
+from usuarios import BancoUsuarios
+
+PLANILHA = pd.DataFrame({
+    "NOME": ["Ana", "Escola B", "Caio"],
+    "CPF": ["123.456.789-00", None, "987.654.321-00"],
+    "INEP": [None, 17012345.0, 17012345.0],
+    "E-mail": [" Ana@Escola.com ", "b@escola.com", None],
+    "SENHA": ["111", "222", "333"],
+    "Cargo": ["Professora", None, "Diretor"],
+})
+
+
+def salvar(df, caminho, adiantar=0):
+    df.to_excel(caminho, index=False)
+    if adiantar:
+        # Garante mtime maior que o gravado na base mesmo em sistemas de arquivos com resolução grossa
+        mtime = os.path.getmtime(caminho) + adiantar
+        os.utime(caminho, (mtime, mtime))
+
+
+@pytest.fixture
+def banco(tmp_path):
+    planilha = tmp_path / "login_senha.xlsx"
+    salvar(PLANILHA, planilha)
+    return BancoUsuarios(str(tmp_path / "usuarios.db"), str(planilha))
+
+
+def test_importar_trocar_senha_exportar_preserva_colunas(banco, tmp_path):
+    assert banco.por_email("ana@escola.com")["nome"] == "Ana"
+    assert [u["nome"] for u in banco.por_identificador("17012345")] == ["Escola B", "Caio"]
+
+    assert banco.alterar_senha("12345678900", "999", "444") is False
+    assert banco.alterar_senha("00000000000", "111", "444") is None
+    assert banco.alterar_senha("123.456.789-00", "111", "444") is True
+    assert banco.por_identificador("12345678900")[0]["senha_limpa"] == "444"
+
+    saida = tmp_path / "exportada.xlsx"
+    assert banco.exportar_excel(str(saida)) == len(PLANILHA)
+    exportada = pd.read_excel(saida)
+    esperada = pd.read_excel(banco.planilha)
+    esperada.loc[0, "SENHA"] = 444
+    assert list(exportada.columns) == list(PLANILHA.columns)
+    pd.testing.assert_frame_equal(exportada, esperada)
+
+
+def test_planilha_alterada_e_reimportada_mantendo_senha_trocada(banco):
+    banco.preparar()
+    assert banco.alterar_senha("12345678900", "111", "444") is True
+
+    editada = PLANILHA.copy()
+    editada.loc[2, "SENHA"] = "555"
+    editada.loc[3] = ["Duda", "111.222.333-44", None, "duda@escola.com", "666", None]
+    salvar(editada, banco.planilha, adiantar=2)
+
+    assert banco.por_email("duda@escola.com")["nome"] == "Duda"
+    assert not banco.planilha_alterada()
+    # Senha trocada no painel vale mais que a da planilha; as outras vêm da planilha
+    assert banco.por_identificador("12345678900")[0]["senha_limpa"] == "444"
+    assert banco.por_identificador("98765432100")[0]["senha_limpa"] == "555"
+
+    # Depois de exportar, a planilha é a referência de novo
+    banco.exportar_excel()
+    editada = pd.read_excel(banco.planilha)
+    editada.loc[0, "SENHA"] = 777
+    salvar(editada, banco.planilha, adiantar=2)
+    assert banco.por_identificador("12345678900")[0]["senha_limpa"] == "777"
+
+
+def test_planilha_invalida_mantem_base_atual(banco, capsys):
+    banco.preparar()
+    with open(banco.planilha, "wb") as arquivo:
+        arquivo.write(b"sendo salva")
+    mtime = os.path.getmtime(banco.planilha) + 2
+    os.utime(banco.planilha, (mtime, mtime))
+
+    assert banco.por_email("ana@escola.com")["nome"] == "Ana"
+    assert "Erro ao reimportar" in capsys.readouterr().out
+    assert banco.planilha_alterada()
@@ -0,0 +1,319 @@
+"""
+Base de usuários do painel em SQLite, com importação/exportação da planilha login_senha.xlsx
+
+Uso:
+    python usuarios.py importar [login_senha.xlsx]   # substitui a base pela planilha
+    python usuarios.py exportar [login_senha.xlsx]   # grava a base (com as senhas atuais) na planilha
+"""
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from banco_sqlite import conectar, criar_tabelas, transacao
+
+USUARIOS_FILE = "login_senha.xlsx"
+USUARIOS_DB = os.getenv("PAINEL_USUARIOS_DB", "usuarios.db")
+COLUNAS_EMAIL = ("EMAIL", "E-MAIL", "E_MAIL")
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS usuarios (
+    linha INTEGER PRIMARY KEY,  -- posição na planilha importada
+    nome TEXT,
+    cpf TEXT NOT NULL,          -- só dígitos ('' se vazio)
+    inep TEXT NOT NULL,         -- só dígitos ('' se vazio)
+    email TEXT NOT NULL,        -- normalizado ('' se vazio)
+    senha TEXT NOT NULL,
+    senha_limpa TEXT NOT NULL,
+    senha_trocada INTEGER NOT NULL DEFAULT 0,  -- 1 = trocada no painel depois da última exportação
+    dados TEXT NOT NULL         -- linha original da planilha (JSON), usada na exportação
+);
+CREATE INDEX IF NOT EXISTS idx_usuarios_email ON usuarios (email);
+CREATE INDEX IF NOT EXISTS idx_usuarios_cpf ON usuarios (cpf);
+CREATE INDEX IF NOT EXISTS idx_usuarios_inep ON usuarios (inep);
+CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT);
+"""
+
+_CAMPOS = "linha, nome, cpf, inep, email, senha, senha_limpa"
+
+
+def normalizar_email(email) -> str:
+    """Normaliza e-mail para comparação (minúsculo, sem espaços)."""
+    if not email or not isinstance(email, str):
+        return ""
+    return email.strip().lower()
+
+
+def somente_digitos(valor) -> str:
+    """CPF, INEP ou senha só com os números (remove pontos, traços e espaços)."""
+    return re.sub(r"[^0-9]", "", str(valor))
+
+
+def normalizar_inep(valor) -> str:
+    """INEP lido como float (ex.: 17012345.0) vira '17012345'; vazio vira ''."""
+    if valor is None or valor == "" or pd.isna(valor):
+        return ""
+    try:
+        return somente_digitos(int(float(valor)))
+    except (TypeError, ValueError):
+        return somente_digitos(valor)
+
+
+def _valor_planilha(valor):
+    """Valor de célula serializável em JSON (NaN vira None, números numpy viram Python)."""
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return None
+    return valor.item() if hasattr(valor, "item") else valor
+
+
+def registros_planilha(df: pd.DataFrame) -> List[Dict]:
+    """Linhas da planilha de usuários com CPF/INEP/e-mail/senha normalizados para busca."""
+    col_email = next((c for c in df.columns if str(c).strip().upper() in COLUNAS_EMAIL), None)
+    registros = []
+    for linha, usuario in enumerate(df.to_dict("records")):
+        # CPF vazio (NaN) vira 'nan' em str() e fica sem dígitos
+        email_valor = usuario.get(col_email) if col_email is not None else None
+        registros.append({
+            "linha": linha,
+            "nome": _valor_planilha(usuario.get("NOME", "Usuário")),
+            "cpf": somente_digitos(usuario.get("CPF", "")),
+            "inep": normalizar_inep(usuario.get("INEP", "")),
+            "email": normalizar_email(str(email_valor)) if email_valor is not None and not pd.isna(email_valor) else "",
+            "senha": str(usuario.get("SENHA", "")),
+            "senha_limpa": somente_digitos(usuario.get("SENHA", "")),
+            "dados": json.dumps({str(c): _valor_planilha(v) for c, v in usuario.items()}, ensure_ascii=False, default=str),
+        })
+    return registros
+
+
+class BancoUsuarios:
+    """
+    Usuários em SQLite com índices por e-mail, CPF e INEP. Login e pedido de
+    código fazem uma consulta indexada; a troca de senha é um UPDATE numa
+    transação, sem regravar a planilha. Se a base estiver vazia, ela é
+    importada da planilha na primeira consulta; se a planilha mudar (mtime),
+    é reimportada na consulta seguinte, mantendo as senhas trocadas no
+    painel depois da última exportação.
+    """
+
+    def __init__(self, caminho: str = USUARIOS_DB, planilha: str = USUARIOS_FILE):
+        self.caminho = caminho
+        self.planilha = planilha
+        self._lock = threading.Lock()
+        self._pronto = False
+        self._mtime = None
+
+    def _criar_tabelas(self):
+        """Cria as tabelas se preciso; True se ainda não há nenhum usuário."""
+        criar_tabelas(self.caminho, _ESQUEMA)
+        conexao = conectar(self.caminho)
+        try:
+            return conexao.execute("SELECT 1 FROM usuarios LIMIT 1").fetchone() is None
+        finally:
+            conexao.close()
+
+    def _mtime_planilha(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.planilha)
+        except OSError:
+            return None
+
+    def preparar(self):
+        """
+        Cria as tabelas e, se a base estiver vazia, importa a planilha
+        (FileNotFoundError se ela não existir). Depois, um stat por consulta:
+        se o mtime da planilha mudou, ela é reimportada.
+        """
+        mtime = self._mtime_planilha()
+        if self._pronto and mtime == self._mtime:
+            return
+        with self._lock:
+            if not self._pronto:
+                if self._criar_tabelas():
+                    self.importar_excel(self.planilha)
+                self._pronto = True
+            if mtime != self._mtime:
+                try:
+                    self.importar_excel(self.planilha, manter_senhas=True, se_alterada=True)
+                except Exception as e:
+                    # Planilha sendo salva ou inválida: a base atual continua valendo
+                    print(f"⚠️ Erro ao reimportar {self.planilha}: {e}")
+                self._mtime = mtime
+
+    def _marcar_planilha(self, conexao, caminho: str):
+        if os.path.abspath(caminho) == os.path.abspath(self.planilha):
+            conexao.execute(
+                "INSERT OR REPLACE INTO meta (chave, valor) VALUES ('planilha_mtime', ?)",
+                (repr(os.path.getmtime(caminho)),),
+            )
+
+    def planilha_alterada(self) -> bool:
+        """True se a planilha foi modificada depois da última importação/exportação."""
+        try:
+            mtime = os.path.getmtime(self.planilha)
+        except OSError:
+            return False
+        conexao = conectar(self.caminho)
+        try:
+            return self._alterada(conexao, mtime)
+        finally:
+            conexao.close()
+
+    @staticmethod
+    def _alterada(conexao, mtime: float) -> bool:
+        linha = conexao.execute("SELECT valor FROM meta WHERE chave = 'planilha_mtime'").fetchone()
+        return linha is not None and mtime > float(linha["valor"])
+
+    def importar_excel(self, caminho: Optional[str] = None, manter_senhas: bool = False,
+                       se_alterada: bool = False) -> int:
+        """
+        Substitui todos os usuários pelos da planilha numa transação; devolve
+        quantos foram importados. `manter_senhas`: quem trocou a senha no painel
+        depois da última exportação (mesmo CPF e INEP) fica com a senha nova.
+        `se_alterada`: só importa se a planilha mudou desde a última
+        importação/exportação (conferido dentro da transação; devolve 0 se não).
+        """
+        caminho = caminho or self.planilha
+        if se_alterada and not self.planilha_alterada():
+            return 0
+        df = pd.read_excel(caminho)
+        registros = registros_planilha(df)
+        self._criar_tabelas()
+        with transacao(self.caminho) as conexao:
+            # Outro processo pode ter reimportado enquanto a planilha era lida
+            if se_alterada and not self._alterada(conexao, os.path.getmtime(caminho)):
+                return 0
+            trocadas = conexao.execute(
+                "SELECT cpf, inep, senha FROM usuarios WHERE senha_trocada = 1"
+            ).fetchall() if manter_senhas else []
+            conexao.execute("DELETE FROM usuarios")
+            conexao.executemany(
+                f"INSERT INTO usuarios ({_CAMPOS}, dados) VALUES "
+                "(:linha, :nome, :cpf, :inep, :email, :senha, :senha_limpa, :dados)",
+                registros,
+            )
+            for trocada in trocadas:
+                self._gravar_senha(conexao, "cpf = ? AND inep = ?", (trocada["cpf"], trocada["inep"]), trocada["senha"])
+            conexao.execute(
+                "INSERT OR REPLACE INTO meta (chave, valor) VALUES ('colunas', ?)",
+                (json.dumps([str(c) for c in df.columns], ensure_ascii=False),),
+            )
+            self._marcar_planilha(conexao, caminho)
+        return len(registros)
+
+    def exportar_excel(self, caminho: Optional[str] = None) -> int:
+        """Grava os usuários (com as senhas atuais) numa planilha, trocando o arquivo de uma vez."""
+        caminho = caminho or self.planilha
+        df = self.dataframe()
+        pasta = os.path.dirname(os.path.abspath(caminho))
+        descritor, temporario = tempfile.mkstemp(suffix=".xlsx", dir=pasta)
+        os.close(descritor)
+        try:
+            df.to_excel(temporario, index=False)
+            os.replace(temporario, caminho)
+        except BaseException:
+            os.remove(temporario)
+            raise
+        with transacao(self.caminho) as conexao:
+            if os.path.abspath(caminho) == os.path.abspath(self.planilha):
+                # A planilha agora tem as senhas trocadas no painel
+                conexao.execute("UPDATE usuarios SET senha_trocada = 0")
+            self._marcar_planilha(conexao, caminho)
+        return len(df)
+
+    def dataframe(self) -> pd.DataFrame:
+        """Usuários no formato da planilha (mesmas colunas, na ordem da importação)."""
+        self.preparar()
+        conexao = conectar(self.caminho)
+        try:
+            meta = conexao.execute("SELECT valor FROM meta WHERE chave = 'colunas'").fetchone()
+            linhas = conexao.execute("SELECT dados FROM usuarios ORDER BY linha").fetchall()
+        finally:
+            conexao.close()
+        colunas = json.loads(meta["valor"]) if meta else None
+        return pd.DataFrame([json.loads(linha["dados"]) for linha in linhas], columns=colunas)
+
+    def por_email(self, email) -> Optional[Dict]:
+        """Primeiro usuário com o e-mail informado."""
+        email = normalizar_email(email)
+        if not email:
+            return None
+        self.preparar()
+        conexao = conectar(self.caminho)
+        try:
+            linha = conexao.execute(
+                f"SELECT {_CAMPOS} FROM usuarios WHERE email = ? ORDER BY linha LIMIT 1", (email,)
+            ).fetchone()
+        finally:
+            conexao.close()
+        return dict(linha) if linha else None
+
+    def por_identificador(self, identificador) -> List[Dict]:
+        """Usuários cujo CPF ou INEP é `identificador`, na ordem da planilha (um INEP pode ter vários)."""
+        identificador = somente_digitos(identificador)
+        if not identificador:
+            return []
+        self.preparar()
+        conexao = conectar(self.caminho)
+        try:
+            linhas = conexao.execute(
+                f"SELECT {_CAMPOS} FROM usuarios WHERE cpf = ? OR inep = ? ORDER BY linha",
+                (identificador, identificador),
+            ).fetchall()
+        finally:
+            conexao.close()
+        return [dict(linha) for linha in linhas]
+
+    def alterar_senha(self, identificador, senha_atual_limpa, nova_senha_limpa) -> Optional[bool]:
+        """
+        Troca a senha do primeiro cadastro com esse CPF/INEP se a senha atual
+        conferir. None = usuário não encontrado, False = senha atual incorreta.
+        """
+        identificador = somente_digitos(identificador)
+        if not identificador:
+            return None
+        self.preparar()
+        with transacao(self.caminho) as conexao:
+            usuario = conexao.execute(
+                "SELECT linha, senha_limpa FROM usuarios WHERE cpf = ? OR inep = ? ORDER BY linha LIMIT 1",
+                (identificador, identificador),
+            ).fetchone()
+            if usuario is None:
+                return None
+            if usuario["senha_limpa"] != senha_atual_limpa:
+                return False
+            self._gravar_senha(conexao, "linha = ?", (usuario["linha"],), nova_senha_limpa)
+        return True
+
+    @staticmethod
+    def _gravar_senha(conexao, onde: str, parametros: tuple, senha: str):
+        conexao.execute(
+            "UPDATE usuarios SET senha = ?, senha_limpa = ?, senha_trocada = 1, "
+            f"dados = json_set(dados, '$.SENHA', ?) WHERE {onde}",
+            (senha, somente_digitos(senha), senha) + parametros,
+        )
+
+
+banco_usuarios = BancoUsuarios()
+
+
+if __name__ == "__main__":
+    comandos = ("importar", "exportar")
+    if len(sys.argv) < 2 or sys.argv[1] not in comandos:
+        print(__doc__.strip())
+        sys.exit(1)
+    planilha = sys.argv[2] if len(sys.argv) > 2 else USUARIOS_FILE
+    if sys.argv[1] == "importar":
+        if not os.path.exists(planilha):
+            print(f"❌ Arquivo '{planilha}' não encontrado")
+            sys.exit(1)
+        total = banco_usuarios.importar_excel(planilha)
+        print(f"✅ {total} usuários importados de '{planilha}' para '{banco_usuarios.caminho}'")
+    else:
+        total = banco_usuarios.exportar_excel(planilha)
+        print(f"✅ {total} usuários exportados de '{banco_usuarios.caminho}' para '{planilha}'")